@@ -0,0 +1,269 @@
+"""This module aligns the retention times of a set of chromatograms to those
+of a reference chromatogram, correcting drift that varies over a run.
+
+Example:
+    align.align(chromatograms, reference)
+
+Each chromatogram gets a piecewise-linear time warp (see
+Chromatogram.warp_time()) fitted by one of two methods:
+    "peaks" -- peaks are matched to the reference's peaks by retention time,
+        and the warp moves each matched peak onto its reference peak
+    "cow" -- correlation optimized warping: the run is cut into segments
+        whose boundaries are moved to maximize the correlation of each
+        segment's signal with the reference's, which needs no picked peaks
+Warps replace any existing warp of a chromatogram; time_scale and time_shift
+are kept."""
+import numpy as np
+
+TOLERANCE = 0.05
+#Maximum distance in minutes between matched peaks, after the chromatograms
+#have been shifted by their median offset from the reference.
+MAX_SHIFT = 1.0
+#Maximum shift in minutes of any point of a chromatogram.
+SEGMENTS = 40
+#Number of segments for correlation optimized warping.
+SLACK = 3
+#Maximum change in the length of a segment in grid points when warping.
+RESOLUTION = 2000
+#Number of grid points that signals are binned to for warping.
+SECTIONS = 5
+#Number of sections of a run whose drift is estimated separately before
+#peaks are matched.
+ITERATIONS = 10
+#Maximum number of times peaks are matched when aligning by peaks.
+
+#================================================================
+# PEAK MATCHING
+#================================================================
+def nearest(reference,times):
+    """This function returns, for each of a list of times, the index of the
+    nearest time in a sorted array of reference times."""
+    positions = np.searchsorted(reference,times)
+    left = np.clip(positions-1,0,len(reference)-1)
+    right = np.clip(positions,0,len(reference)-1)
+    return np.where(np.abs(times-reference[left])
+        <= np.abs(reference[right]-times),left,right)
+
+def match_peaks(reference,times,tolerance=TOLERANCE):
+    """This function matches two sorted arrays of retention times one-to-one.
+    Two times match when each is the other's nearest time and they are within
+    the tolerance of each other.
+
+    Returns:
+        i_reference -- an increasing array of indices of matched reference
+            times
+        i_times -- an array of the indices of the times they match"""
+    reference = np.asarray(reference,dtype=np.float64)
+    times = np.asarray(times,dtype=np.float64)
+    if len(reference) == 0 or len(times) == 0:
+        return np.zeros(0,dtype=int), np.zeros(0,dtype=int)
+    forward = nearest(reference,times)
+    backward = nearest(times,reference)
+    i_times = np.arange(len(times))
+    keep = (backward[forward] == i_times)\
+        & (np.abs(reference[forward]-times) <= tolerance)
+    i_reference, i_times = forward[keep], i_times[keep]
+    increasing = np.diff(i_reference,prepend=-1) > 0
+    #Mutual nearest matches never cross; this only drops ties.
+    return i_reference[increasing], i_times[increasing]
+
+def consistent(offsets,tolerance):
+    """This function flags the offsets of matched peaks that are within half
+    the tolerance of the median offset of the two matches on either side.
+    Drift changes slowly over a run, so the others are likely mismatches."""
+    if len(offsets) == 0:
+        return np.zeros(0,dtype=bool)
+    padded = np.pad(offsets,2,mode="edge")
+    medians = np.median(np.lib.stride_tricks.sliding_window_view(padded,5),
+        axis=1)
+    return np.abs(offsets-medians) <= tolerance/2
+
+def peak_warp(gram,reference_times,tolerance=TOLERANCE,max_shift=MAX_SHIFT):
+    """This function fits a time warp that moves the peaks of a chromatogram
+    onto the matching reference peaks.
+
+    A rough warp is first made from the median offsets of the peaks to their
+    nearest reference peaks (within max_shift) in each of SECTIONS sections of
+    the run. Peaks are then matched within the tolerance (see match_peaks())
+    on the times given by the warp, inconsistent matches are dropped (see
+    consistent()) and the warp is redrawn through the rest, until no more
+    peaks match. Returns the anchors and offsets of the warp (see
+    Chromatogram.warp_time()), or None if no peak is within max_shift of a
+    reference peak or no peak matches a reference peak within the
+    tolerance."""
+    reference_times = np.sort(np.asarray(reference_times,dtype=np.float64))
+    indices = np.unique([peak.i_max for peak in gram.peaks])
+    if len(indices) == 0 or len(reference_times) == 0:
+        return None
+    linear = indices*gram.time_scale+gram.time_shift
+    #Retention times without the current warp.
+
+    offsets = reference_times[nearest(reference_times,linear)]-linear
+    close = np.flatnonzero(np.abs(offsets) <= max_shift)
+    if len(close) == 0:
+        return None
+    sections = [section for section in np.array_split(close,SECTIONS)
+        if len(section) > 0]
+    warp = ([np.median(indices[section]) for section in sections],
+        [np.median(offsets[section]) for section in sections])
+
+    matched = 0
+    for _ in range(ITERATIONS):
+        times = linear+np.interp(indices,*warp)
+        i_reference, i_peaks = match_peaks(reference_times,times,tolerance)
+        offsets = reference_times[i_reference]-linear[i_peaks]
+        keep = consistent(offsets,tolerance)
+        if keep.sum() <= matched:
+            break
+        matched = keep.sum()
+        warp = indices[i_peaks][keep], offsets[keep]
+    if matched == 0:
+        return None
+    #The rough warp alone is not trusted.
+    return warp
+
+
+#================================================================
+# CORRELATION OPTIMIZED WARPING
+#================================================================
+def bin_max(time,signal,grid):
+    """This function bins a signal to a grid of times, taking the maximum of
+    each bin so that narrow peaks are kept."""
+    edges = np.searchsorted(time,(grid[1:]+grid[:-1])/2)
+    starts = np.concatenate(([0],edges))
+    starts = np.minimum(starts,len(signal)-1)
+    return np.maximum.reduceat(signal,starts)
+
+def _correlations(segments,reference):
+    """This function returns the correlation coefficient of each row of an
+    array of segments with a reference segment (0 where either is flat)."""
+    segments = segments-segments.mean(axis=-1,keepdims=True)
+    reference = reference-reference.mean()
+    norms = np.sqrt((segments**2).sum(axis=-1)*(reference**2).sum())
+    products = (segments*reference).sum(axis=-1)
+    return np.divide(products,norms,out=np.zeros_like(products),
+        where=norms > 0)
+
+def cow(reference,sample,segments=SEGMENTS,slack=SLACK,band=None):
+    """This function aligns a sample signal with a reference signal of the
+    same length by correlation optimized warping.
+
+    The reference is cut into segments of equal length. The boundaries of the
+    sample's segments are chosen by dynamic programming so that each segment
+    is at most slack points longer or shorter than the reference segment,
+    every boundary is within band points of the reference boundary, and the
+    sum of the correlations of the sample segments (stretched to the length
+    of the reference segments) with the reference segments is maximal.
+
+    Returns:
+        boundaries -- the indices of the reference segment boundaries
+        warped -- the indices of the matching sample segment boundaries"""
+    m = len(reference)
+    segments = max(min(segments,(m-1)//max(slack+2,2)),1)
+    boundaries = np.linspace(0,m-1,segments+1).round().astype(int)
+    if band is None:
+        band = slack*segments
+    band = int(max(band,slack))
+    shifts = np.arange(-slack,slack+1)
+
+    positions = np.arange(max(boundaries[0]-band,0),
+        min(boundaries[0]+band,m-1)+1)
+    scores = np.zeros(len(positions))
+    choices = []
+    for k in range(1,segments+1):
+        length = boundaries[k]-boundaries[k-1]
+        candidates = np.arange(max(boundaries[k]-band,0),
+            min(boundaries[k]+band,m-1)+1)
+        starts = candidates[:,None]-(length+shifts)[None,:]
+        valid = (starts >= positions[0]) & (starts <= positions[-1])\
+            & (starts < candidates[:,None])
+        starts = np.clip(starts,positions[0],positions[-1])
+
+        fractions = np.linspace(0,1,length+1)
+        points = starts[:,:,None]\
+            +(candidates[:,None]-starts)[:,:,None]*fractions
+        #Points of the sample segment ending at each candidate and starting
+        #at each shift, stretched to the length of the reference segment.
+        lower = np.minimum(np.floor(points).astype(int),m-2)
+        weights = points-lower
+        stretched = sample[lower]*(1-weights)+sample[lower+1]*weights
+        totals = scores[starts-positions[0]]\
+            +_correlations(stretched,reference[boundaries[k-1]:boundaries[k]+1])
+        totals[~valid] = -np.inf
+
+        best = totals.argmax(axis=1)
+        choices.append((candidates,starts[np.arange(len(candidates)),best]))
+        scores = totals[np.arange(len(candidates)),best]
+        positions = candidates
+
+    warped = [positions[scores.argmax()]]
+    for candidates, starts in reversed(choices):
+        warped.append(starts[warped[-1]-candidates[0]])
+    return boundaries, np.array(warped[::-1])
+
+def cow_warp(gram,reference,segments=SEGMENTS,slack=SLACK,
+    max_shift=MAX_SHIFT,resolution=RESOLUTION):
+    """This function fits a time warp that aligns the signal of a chromatogram
+    with that of a reference chromatogram by correlation optimized warping
+    (see cow()), over the time range both cover.
+
+    Both signals are binned to a grid of resolution points first. Returns the
+    anchors and offsets of the warp (see Chromatogram.warp_time()), or None
+    if the chromatograms do not overlap."""
+    n = len(gram.signal_series)
+    linear = np.arange(n)*gram.time_scale+gram.time_shift
+    #Time series without the current warp.
+    if n < 2 or len(reference.time_series) < 2:
+        return None
+    start = max(linear[0],reference.time_series[0])
+    end = min(linear[-1],reference.time_series[-1])
+    if end <= start:
+        return None
+    grid = np.linspace(start,end,resolution)
+    target = bin_max(reference.time_series,reference.signal_series,grid)
+    sample = bin_max(linear,gram.signal_series,grid)
+    step = grid[1]-grid[0]
+    boundaries, warped = cow(target,sample,segments,slack,max_shift/step)
+    anchors = (grid[warped]-gram.time_shift)/gram.time_scale
+    return anchors, grid[boundaries]-grid[warped]
+
+
+#================================================================
+# ALIGNMENT
+#================================================================
+def align(chromatograms,reference,method="peaks",tolerance=TOLERANCE,
+    max_shift=MAX_SHIFT,segments=SEGMENTS,slack=SLACK,resolution=RESOLUTION):
+    """This function warps the time series of a list of chromatograms to
+    align them with a reference chromatogram (which is left as it is if it is
+    in the list).
+
+    Arguments:
+        method -- 'peaks' to match picked peaks (see peak_warp()) or 'cow' for
+            correlation optimized warping of the signals (see cow_warp())
+    See the module constants for the other arguments.
+
+    Returns a list of the warps applied (None for chromatograms that could not
+    be aligned, which keep their time series)."""
+    if method not in ("peaks","cow"):
+        raise ValueError("Alignment method must be 'peaks' or 'cow'!") from None
+    if method == "peaks":
+        reference_times = [peak.retention_time for peak in reference.peaks]
+    warps = []
+    for gram in chromatograms:
+        warp = None
+        if gram is not reference:
+            if method == "peaks":
+                warp = peak_warp(gram,reference_times,tolerance,max_shift)
+            else:
+                warp = cow_warp(gram,reference,segments,slack,max_shift,
+                    resolution)
+            if warp is not None:
+                try:
+                    gram.warp_time(*warp)
+                except ValueError:
+                    warp = None
+                    #The fitted warp would reverse the time series.
+            if warp is None:
+                print(f"Could not align {gram.name} with {reference.name}.")
+        warps.append(warp)
+    return warps
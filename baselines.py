@@ -0,0 +1,142 @@
+"""This module estimates the baseline of a signal automatically, for
+correcting curved baseline drift without picking baseline points.
+
+Example:
+    gram.auto_baseline("als")
+    baselines.estimate(signal, "rolling_min", window=1201)
+
+Methods (see the function of the same name for its options):
+    "als" -- asymmetric least squares: a smooth curve that follows the signal
+        from below, fitted by reweighted penalized least squares
+    "rolling_min" -- a morphological opening (rolling minimum, then rolling
+        maximum) of the signal, smoothed by a moving average
+    "polynomial" -- a polynomial refitted to the signal with the points above
+        it clipped to it, until it stops changing
+Each runs in time proportional to the length of the signal. Windows and
+smoothness are in data points, so they depend on the sampling rate; the
+defaults suit 10 Hz data with peaks a few seconds wide."""
+import numpy as np
+
+METHODS = ("als","rolling_min","polynomial")
+
+#================================================================
+# ASYMMETRIC LEAST SQUARES
+#================================================================
+def _difference_bands(n):
+    """This function returns the upper bands (in the layout of
+    scipy.linalg.solveh_banded()) of D'D, where D is the second difference
+    matrix of a series of n points."""
+    coefficients = (1.0,-2.0,1.0)
+    bands = np.zeros((3,n))
+    for offset in range(3):
+        for a in range(3-offset):
+            bands[2-offset,offset+a:offset+a+n-2] += coefficients[a]\
+                *coefficients[a+offset]
+    return bands
+
+def als(signal,smoothness=1e7,asymmetry=0.001,iterations=20):
+    """This function estimates a baseline by asymmetric least squares (Eilers
+    and Boelens, 2005).
+
+    The baseline z minimizes sum(w*(y-z)**2) + smoothness*sum((D2 z)**2),
+    where points above the baseline get the weight asymmetry and the others
+    1-asymmetry, so that peaks barely pull on it. The weights are updated and
+    the banded system solved again until they stop changing.
+
+    Arguments:
+        smoothness -- penalty on the curvature of the baseline; larger values
+            give stiffer baselines
+        asymmetry -- weight of points above the baseline (0 < asymmetry < 0.5)
+        iterations -- maximum number of reweightings"""
+    from scipy.linalg import solveh_banded
+    #Imported here so that the other methods do not need scipy.
+    signal = np.asarray(signal,dtype=np.float64)
+    n = len(signal)
+    if n < 3:
+        return signal.copy()
+    penalty = smoothness*_difference_bands(n)
+    weights = np.ones(n)
+    for _ in range(iterations):
+        bands = penalty.copy()
+        bands[2] += weights
+        baseline = solveh_banded(bands,weights*signal,check_finite=False)
+        new_weights = np.where(signal > baseline,asymmetry,1-asymmetry)
+        if np.array_equal(new_weights,weights):
+            break
+        weights = new_weights
+    return baseline
+
+
+#================================================================
+# ROLLING MINIMUM
+#================================================================
+def rolling_min(signal,window=601,smoothing=None):
+    """This function estimates a baseline by a morphological opening of the
+    signal: the rolling minimum over a window, followed by the rolling
+    maximum over the same window. Peaks narrower than the window are removed,
+    and the result is smoothed by a moving average (and kept below the
+    signal).
+
+    Arguments:
+        window -- width in points of the structuring window; it should be
+            wider than the widest peak
+        smoothing -- width in points of the moving average (by default the
+            window)"""
+    from scipy import ndimage
+    signal = np.asarray(signal,dtype=np.float64)
+    if len(signal) == 0:
+        return signal.copy()
+    window = max(int(window),1)
+    opened = ndimage.maximum_filter1d(
+        ndimage.minimum_filter1d(signal,window,mode="nearest"),
+        window,mode="nearest")
+    #scipy's filters run in time independent of the window width.
+    if smoothing is None:
+        smoothing = window
+    smoothed = ndimage.uniform_filter1d(opened,max(int(smoothing),1),
+        mode="nearest")
+    return np.minimum(smoothed,signal)
+
+
+#================================================================
+# ITERATIVE POLYNOMIAL
+#================================================================
+def polynomial(signal,degree=3,iterations=100,tolerance=1e-3):
+    """This function estimates a baseline by iterative polynomial fitting
+    (modified polyfit, Lieber and Mahadevan-Jansen, 2003): a polynomial is
+    fitted to the signal, points of the signal above it are lowered onto it,
+    and the fit is repeated until it changes by less than the tolerance
+    (relative to its size).
+
+    Arguments:
+        degree -- degree of the polynomial
+        iterations -- maximum number of fits"""
+    signal = np.asarray(signal,dtype=np.float64)
+    n = len(signal)
+    if n <= degree:
+        return signal.copy()
+    x = np.linspace(-1,1,n)
+    #Fitting on [-1, 1] keeps the fit well conditioned.
+    clipped = signal
+    baseline = np.polynomial.polynomial.polyval(x,
+        np.polynomial.polynomial.polyfit(x,clipped,degree))
+    for _ in range(iterations):
+        clipped = np.minimum(clipped,baseline)
+        fit = np.polynomial.polynomial.polyval(x,
+            np.polynomial.polynomial.polyfit(x,clipped,degree))
+        change = np.linalg.norm(fit-baseline)
+        baseline = fit
+        if change <= tolerance*max(np.linalg.norm(baseline),1e-12):
+            break
+    return baseline
+
+
+#================================================================
+# DISPATCH
+#================================================================
+def estimate(signal,method="als",**options):
+    """This function estimates the baseline of a signal with one of the
+    METHODS, passing on any options to its function."""
+    if method not in METHODS:
+        raise ValueError(f"Baseline method must be one of {METHODS}!") from None
+    return globals()[method](signal,**options)
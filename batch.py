@@ -0,0 +1,222 @@
+"""This module runs the chromatogram analysis pipeline from the command line,
+without the GUI.
+
+Example:
+    python batch.py "data/*.asc" -o peaks.csv --baseline 0.5 28 --threshold 5000
+
+Every file is loaded, baseline corrected, autopicked and normalized according
+to a recipe, and the peak tables of all files are written to one CSV file in
+the same layout as File>Export Peak Table. Files are processed in parallel by
+a pool of worker processes."""
+import argparse
+import concurrent.futures
+import glob
+import json
+import pathlib
+import sys
+import align
+import cache
+import loader
+import noise
+import save
+
+RECIPE_DEFAULTS = {
+    "baseline":None,
+    "auto_baseline":None,
+    "auto_baseline_options":{},
+    "threshold":None,
+    "reference":None,
+    "reference_tolerance":0.1,
+    "normalize_dim":"area",
+    "normalize_to":1,
+    "area_mode":"bb",
+    "derivative_mode":"right",
+    "derivative_window":5,
+    "align":None
+    }
+#baseline -- two times in minutes [start, end] on the baseline
+#auto_baseline -- method for estimating the baseline automatically instead
+#   ('als', 'rolling_min' or 'polynomial', see baselines.py), or None
+#auto_baseline_options -- options passed on to the baseline method
+#threshold -- signal threshold for autopicking peaks, or 'auto' (see
+#   Chromatogram.threshold_autopick())
+#reference -- approximate retention time of the peak to normalize to
+#reference_tolerance -- maximum distance in minutes from the reference time
+#normalize_dim, normalize_to -- passed on to Chromatogram.normalize()
+#area_mode -- integration mode of the picked peaks ('bb','vv','bv','vb')
+#derivative_mode, derivative_window -- derivative used to find peak bounds
+#   (see derivatives.py)
+#align -- method for aligning the retention times of all chromatograms with
+#   those of the first ('peaks' or 'cow', see align.py), or None
+
+#================================================================
+# PIPELINE
+#================================================================
+def find_paths(patterns):
+    """This function expands directories and glob patterns into a sorted list
+    of data files."""
+    paths = []
+    for pattern in patterns:
+        if pathlib.Path(pattern).is_dir():
+            paths += glob.glob(str(pathlib.Path(pattern)/"*.asc"))
+        else:
+            paths += glob.glob(pattern)
+    return sorted(set(paths))
+
+def nearest_peak(gram,retention_time,tolerance):
+    """This function returns the peak of a chromatogram closest to a given
+    retention time, or None if no peak lies within the tolerance."""
+    candidates = [peak for peak in gram.peaks
+        if abs(peak.retention_time-retention_time) <= tolerance]
+    if not candidates:
+        return None
+    return min(candidates, key=lambda peak: abs(peak.retention_time-retention_time))
+
+def process_file(path,recipe,cache_directory=None):
+    """This function loads one data file and applies a recipe to it. It returns
+    the processed Chromatogram.
+
+    When a cache directory is given, the parsed file is read from/stored in a
+    ParseCache in that directory (see cache.py)."""
+    if cache_directory is None:
+        gram = loader.load_asc(path)
+    else:
+        gram = cache.ParseCache(cache_directory).load_asc(path)
+    if recipe["auto_baseline"] is not None:
+        gram.auto_baseline(recipe["auto_baseline"],
+            **recipe["auto_baseline_options"])
+    elif recipe["baseline"] is not None:
+        bounds = [min(max(i,0),len(gram.signal_series)-1)
+            for i in gram.time2index(list(recipe["baseline"]))]
+        #Baseline points past either end of a run are clamped to its ends.
+        gram.baseline_correct(bounds)
+    gram.set_derivative_mode(recipe["derivative_mode"],
+        recipe["derivative_window"])
+    if recipe["threshold"] is not None:
+        gram.threshold_autopick(recipe["threshold"],area_mode=recipe["area_mode"])
+    if recipe["reference"] is not None:
+        reference = nearest_peak(gram,recipe["reference"],
+            recipe["reference_tolerance"])
+        if reference is None:
+            print(f"{path}: no reference peak near {recipe['reference']} min.;"
+                " peaks were not normalized.",file=sys.stderr)
+        else:
+            gram.normalize(reference,dim=recipe["normalize_dim"],
+                norm_to=recipe["normalize_to"])
+    return gram
+
+def run(paths,recipe,workers=None,cache_directory=None):
+    """This function processes data files in a process pool and returns the
+    processed chromatograms in the order of the paths. Files that fail are
+    reported and skipped. With 0 workers, the files are processed one at a
+    time in this process."""
+    grams = []
+    if workers == 0:
+        for path in paths:
+            try:
+                grams.append(process_file(path,recipe,cache_directory))
+            except Exception as error:
+                print(f"{path}: {error!r}",file=sys.stderr)
+        return grams
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(process_file,path,recipe,cache_directory)
+            for path in paths]
+        for path, future in zip(paths,futures):
+            try:
+                grams.append(future.result())
+            except Exception as error:
+                print(f"{path}: {error!r}",file=sys.stderr)
+    return grams
+
+
+#================================================================
+# COMMAND LINE INTERFACE
+#================================================================
+def load_recipe(args):
+    """This function builds a recipe from the defaults, an optional JSON
+    recipe file, and the command line options (in increasing priority)."""
+    recipe = dict(RECIPE_DEFAULTS)
+    if args.recipe is not None:
+        with open(args.recipe,"r") as reader:
+            recipe.update(json.load(reader))
+    for key in RECIPE_DEFAULTS:
+        value = getattr(args,key,None)
+        if value is not None:
+            recipe[key] = value
+    return recipe
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Batch-process chromatogram data files without the GUI.")
+    parser.add_argument("inputs",nargs="+",
+        help="data files, directories or glob patterns")
+    parser.add_argument("-o","--output",default="peaks.csv",
+        help="CSV file for the combined peak table (default: peaks.csv)")
+    parser.add_argument("--recipe",help="JSON file of recipe options")
+    parser.add_argument("--baseline",nargs=2,type=float,metavar=("START","END"),
+        help="baseline points in minutes")
+    parser.add_argument("--auto-baseline",choices=("als","rolling_min",
+        "polynomial"),help="estimate the baseline automatically")
+    parser.add_argument("--threshold",type=noise.parse_level,
+        help="signal threshold for autopicking peaks, or auto for 10 times "
+        "the estimated noise above the baseline")
+    parser.add_argument("--reference",type=float,metavar="TIME",
+        help="retention time of the peak to normalize to")
+    parser.add_argument("--reference-tolerance",type=float,metavar="MINUTES")
+    parser.add_argument("--normalize-dim",choices=("area","height"))
+    parser.add_argument("--normalize-to",type=float)
+    parser.add_argument("--area-mode",choices=("bb","vv","bv","vb"))
+    parser.add_argument("--derivative-mode",choices=("right","left",
+        "central","savgol","moving_average"),
+        help="derivative used to find peak bounds")
+    parser.add_argument("--derivative-window",type=int,
+        help="window in points of the smoothing derivative modes")
+    parser.add_argument("--align",choices=("peaks","cow"),
+        help="align retention times with those of the first file")
+    parser.add_argument("--compounds",metavar="CSV",
+        help="also write a table of the area of each compound in each file")
+    parser.add_argument("-j","--workers",type=int,
+        help="number of worker processes (default: number of CPUs; 0 to "
+        "process files in this process)")
+    parser.add_argument("--cache",metavar="DIRECTORY",
+        help="cache parsed data files in this directory")
+    parser.add_argument("--profile",nargs="?",const="-",metavar="FILE",
+        help="process files in this process with timing instrumentation and "
+        "a cProfile/tracemalloc capture, and print the summary (or write it "
+        "to FILE)")
+    args = parser.parse_args(argv)
+
+    paths = find_paths(args.inputs)
+    if not paths:
+        parser.error("no data files found")
+    workers = args.workers
+    if args.profile is not None:
+        import instrument
+        instrument.enable()
+        instrument.start_profile()
+        workers = 0
+        #Worker processes would record their timings where they cannot be
+        #collected.
+    recipe = load_recipe(args)
+    grams = run(paths,recipe,workers,args.cache)
+    if args.profile is not None:
+        report = instrument.summary()+"\n\n"+instrument.stop_profile()
+        if args.profile == "-":
+            print(report,file=sys.stderr)
+        else:
+            with open(args.profile,"w") as writer:
+                writer.write(report)
+    if not grams:
+        print("No data files could be processed.",file=sys.stderr)
+        return 1
+    if recipe["align"] is not None:
+        align.align(grams,grams[0],method=recipe["align"])
+        #Alignment needs every chromatogram, so it runs after the pool.
+    save.write_peaks(grams,args.output)
+    print(f"Wrote peaks of {len(grams)}/{len(paths)} chromatograms to {args.output}")
+    if args.compounds is not None:
+        save.write_compounds(grams,args.compounds)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,335 @@
+"""This module benchmarks M|Chroma's data processing.
+
+Run it from the command line:
+    python benchmark.py [-o results.json] [--compare baseline.json]
+
+Each hot path of the Chromatogram and Peak classes is timed on a synthetic
+chromatogram whose length, number of peaks, noise and baseline drift can be
+configured, and its peak memory use is measured. The results can be saved as
+JSON and compared against an earlier run. Data files given as arguments are
+also parsed with the bulk parser and the legacy line-by-line loop."""
+import argparse
+import datetime
+import json
+import pathlib
+import platform
+import random
+import subprocess
+import tempfile
+import time
+import timeit
+import tracemalloc
+import numpy as np
+import loader
+import save
+from chromatogram import Peak, threshold_features
+from history import History
+
+SYNTHETIC_DEFAULTS = {
+    "points":100000,
+    "peaks":300,
+    "noise":20.0,
+    "drift":5000.0,
+    "sampling_rate":10.0,
+    "seed":0
+    }
+#points -- length of the synthetic chromatogram
+#peaks -- number of Gaussian peaks
+#noise -- standard deviation of the detector noise in counts
+#drift -- rise of the (quadratic) baseline over the run in counts
+#sampling_rate -- sampling rate in Hz
+#seed -- seed of the random number generator
+
+THRESHOLD = 5000
+#Signal threshold used for picking peaks in the synthetic chromatogram.
+
+#================================================================
+# REFERENCE IMPLEMENTATIONS
+#================================================================
+def legacy_read_asc(path):
+    """This function is the line-by-line parser that mchroma.py used before
+    the loader module; it is kept as a reference for benchmarking."""
+    temp_data = []
+    temp_name = ""
+    temp_rate = ""
+    with open(path) as reader:
+        line = reader.readline()
+        while line != '':
+            if line.replace("\n","").replace("-","").isnumeric():
+                temp_data.append(int(line))
+            elif "Sample ID" in line:
+                temp_name=line.replace("Sample ID: ","").replace("\n","")
+            elif "Sampling Rate" in line:
+                temp_rate = float(line.replace("Sampling Rate: ","").replace(" Hz\n",""))
+            line = reader.readline()
+    return temp_data, temp_name, temp_rate
+
+
+#================================================================
+# SYNTHETIC DATA
+#================================================================
+def synthetic_data(points=100000,peaks=300,noise=20.0,drift=5000.0,seed=0,
+    **kwargs):
+    """This function returns a synthetic trace in detector counts: Gaussian
+    peaks of random heights and widths on a quadratic baseline that rises by
+    drift counts over the run, with Gaussian detector noise."""
+    rng = np.random.default_rng(seed)
+    x = np.arange(points)
+    signal = drift*(x/max(points-1,1))**2
+    margin = min(200,points//10)
+    centers = rng.uniform(margin,points-margin,peaks)
+    heights = rng.uniform(2e4,1e6,peaks)
+    widths = rng.uniform(3,8,peaks)
+    for center, height, width in zip(centers,heights,widths):
+        i_0 = max(int(center-8*width),0)
+        i_f = min(int(center+8*width)+1,points)
+        signal[i_0:i_f] += height*np.exp(-0.5*((x[i_0:i_f]-center)/width)**2)
+        #Each peak is only evaluated within 8 standard deviations.
+    signal += rng.normal(0,noise,points)
+    return np.round(signal).astype(np.int32)
+
+def write_asc(path,data,sampling_rate=10.0,name="synthetic"):
+    """This function writes data points to a CLASS-VP .dat.asc file."""
+    with open(path,"w") as writer:
+        writer.write("Version: 3\nMaxchannels: 1\n")
+        writer.write(f"Sample ID: {name}\n")
+        writer.write(f"Sampling Rate: {sampling_rate:.6f} Hz\n")
+        writer.write(f"Total Data Points: {len(data)} Pts.\n")
+        writer.write("\n".join(str(point) for point in data))
+        writer.write("\n")
+
+def write_synthetic_asc(path,minutes=180,sampling_rate=10.0,seed=0):
+    """This function writes a synthetic CLASS-VP .dat.asc file of uniform
+    noise of the given run length."""
+    rng = np.random.default_rng(seed)
+    n = int(minutes*60*sampling_rate)
+    write_asc(path,rng.integers(-1000,1000,n),sampling_rate,
+        f"synthetic_{minutes}_min")
+
+
+#================================================================
+# MEASUREMENT
+#================================================================
+def best_time(function,repeat=5):
+    """This function returns the best wall time of several calls in seconds."""
+    return min(timeit.repeat(function,number=1,repeat=repeat))
+
+def measure(function,setup=None,repeat=5):
+    """This function times a benchmark, running its setup (untimed) before
+    each call, and then measures the peak memory allocated by one more call
+    with tracemalloc.
+
+    Arguments:
+        function -- the benchmark; called with the value returned by setup
+        setup -- a function preparing the input of each call, or None
+
+    Returns a dict of the best and median wall time in seconds, the number of
+    calls timed and the peak memory in bytes."""
+    prepare = setup if setup is not None else (lambda: None)
+    times = []
+    for _ in range(repeat):
+        value = prepare()
+        start = time.perf_counter()
+        function(value)
+        times.append(time.perf_counter()-start)
+    value = prepare()
+    tracemalloc.start()
+    try:
+        function(value)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        "best_s":min(times),
+        "median_s":float(np.median(times)),
+        "repeat":repeat,
+        "peak_bytes":peak
+        }
+
+
+#================================================================
+# BENCHMARKS
+#================================================================
+def without_peaks(gram):
+    """This function returns a copy of a chromatogram without its peaks."""
+    duplicate = gram.copy()
+    duplicate.peaks = []
+    duplicate.update_peak_table()
+    return duplicate
+
+def benchmarks(path,gram):
+    """This function returns the suite of benchmarks as a dict of (function,
+    setup) pairs keyed by name, for a data file and the chromatogram loaded
+    from it with its peaks picked."""
+    n = len(gram.signal_series)
+    bounds = [[peak.i_0,peak.i_f] for peak in gram.peaks]
+    starts = threshold_features(gram.signal_series,THRESHOLD)[0]
+    directory = pathlib.Path(path).parent
+
+    def fresh():
+        duplicate = gram.copy()
+        duplicate.derivative_series = None
+        duplicate._derivatives = {}
+        duplicate._noise_estimator = None
+        duplicate._bounds_cache = None
+        return duplicate
+
+    def shuffled():
+        duplicate = gram.copy()
+        random.Random(0).shuffle(duplicate.peaks)
+        return duplicate
+
+    def history():
+        states = History()
+        states.present().add_chromatogram(gram.copy())
+        return states
+
+    def edit(states):
+        states.save()
+        states.present().edit(0)
+
+    def session():
+        states = History()
+        states.present().add_chromatogram(gram)
+        save.save_session(states.present(),directory/"benchmark.mchroma")
+
+    return {
+        "parse":(lambda _: loader.read_asc(path),None),
+        "compute_derivative":(lambda duplicate: duplicate.compute_derivative(),
+            fresh),
+        "derivative_savgol":(lambda duplicate: (duplicate.set_derivative_mode(
+            "savgol",7),duplicate.compute_derivative()),fresh),
+        "estimate_noise":(lambda duplicate: duplicate.signal_noise,fresh),
+        "baseline_correct":(lambda duplicate:
+            duplicate.baseline_correct([0,n-1]),fresh),
+        "auto_baseline":(lambda duplicate: duplicate.auto_baseline("als"),
+            fresh),
+        "detect_bounds":(lambda duplicate:
+            duplicate.detect_bounds_batch(starts),fresh),
+        "threshold_autopick":(lambda duplicate:
+            duplicate.threshold_autopick(THRESHOLD),
+            lambda: without_peaks(fresh())),
+        #Timed from a cold start, including the derivative and the bound
+        #lookup tables.
+        "peak_construction":(lambda _: [Peak(gram,pair) for pair in bounds],
+            None),
+        "reindex_peaks":(lambda duplicate: duplicate.reindex_peaks(),shuffled),
+        "update_peak_table":(lambda duplicate: (duplicate.update_peak_table(),
+            duplicate.peak_table),lambda: gram.copy()),
+        "history_save":(edit,history),
+        "export_csv":(lambda _: save.write_peaks([gram],directory/"peaks.csv"),
+            None),
+        "save_session":(lambda _: session(),None),
+        "load_session":(lambda _: save.load_session(
+            directory/"benchmark.mchroma").chromatograms[0].peaks,
+            session)
+        }
+
+def run_suite(config,repeat=5,only=None):
+    """This function writes a synthetic chromatogram with the given
+    configuration (see SYNTHETIC_DEFAULTS) to a temporary file and runs the
+    benchmarks on it. It returns a dict of the results keyed by benchmark
+    name (see measure())."""
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        path = pathlib.Path(directory)/"synthetic.dat.asc"
+        write_asc(path,synthetic_data(**config),config["sampling_rate"])
+        gram = loader.load_asc(path)
+        gram.threshold_autopick(THRESHOLD)
+        gram.peak_table
+        for name, (function, setup) in benchmarks(path,gram).items():
+            if only is None or name in only:
+                results[name] = measure(function,setup,repeat)
+    return results
+
+def bench_parse(paths,repeat=5):
+    """This function compares the bulk .dat.asc parser against the legacy
+    line-by-line loop, returning one result dict per file."""
+    results = []
+    for path in paths:
+        legacy = best_time(lambda: legacy_read_asc(path),repeat)
+        bulk = best_time(lambda: loader.read_asc(path),repeat)
+        results.append({
+            "file":pathlib.Path(path).name,
+            "points":len(loader.read_asc(path)[0]),
+            "legacy_s":legacy,
+            "bulk_s":bulk,
+            "speedup":legacy/bulk
+            })
+    return results
+
+
+#================================================================
+# REPORTING
+#================================================================
+def environment():
+    """This function describes the machine and code the benchmarks ran on."""
+    try:
+        commit = subprocess.run(["git","rev-parse","--short","HEAD"],
+            capture_output=True,text=True,
+            cwd=pathlib.Path(__file__).parent).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "time":datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit":commit,
+        "python":platform.python_version(),
+        "numpy":np.__version__,
+        "machine":platform.platform()
+        }
+
+def report(results,baseline=None):
+    """This function prints a table of benchmark results, with the change in
+    time relative to the results of an earlier run when given."""
+    for name, result in results.items():
+        line = f"{name:<20} {result['best_s']*1000:10.2f} ms  "\
+            f"{result['peak_bytes']/2**20:9.2f} MiB"
+        if baseline is not None and name in baseline:
+            line += f"  x{baseline[name]['best_s']/result['best_s']:.2f}"
+            #Speedup over the earlier run (> 1 is faster).
+        print(line)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("files",nargs="*",
+        help="data files to compare against the legacy parser")
+    parser.add_argument("--repeat",type=int,default=5)
+    parser.add_argument("--points",type=int,default=SYNTHETIC_DEFAULTS["points"])
+    parser.add_argument("--peaks",type=int,default=SYNTHETIC_DEFAULTS["peaks"])
+    parser.add_argument("--noise",type=float,default=SYNTHETIC_DEFAULTS["noise"])
+    parser.add_argument("--drift",type=float,default=SYNTHETIC_DEFAULTS["drift"])
+    parser.add_argument("--seed",type=int,default=SYNTHETIC_DEFAULTS["seed"])
+    parser.add_argument("--only",nargs="+",metavar="BENCHMARK",
+        help="run only these benchmarks")
+    parser.add_argument("-o","--output",help="save the results to a JSON file")
+    parser.add_argument("--compare",metavar="JSON",
+        help="compare against the results saved by an earlier run")
+    args = parser.parse_args(argv)
+
+    config = dict(SYNTHETIC_DEFAULTS)
+    for key in ("points","peaks","noise","drift","seed"):
+        config[key] = getattr(args,key)
+    output = {
+        "environment":environment(),
+        "config":config,
+        "results":run_suite(config,args.repeat,args.only)
+        }
+    if args.files:
+        output["parse_files"] = bench_parse(args.files,args.repeat)
+
+    baseline = None
+    if args.compare is not None:
+        with open(args.compare,"r") as reader:
+            baseline = json.load(reader)["results"]
+    report(output["results"],baseline)
+    for result in output.get("parse_files",[]):
+        print(f"{result['file']:<50} {result['points']:>8} pts  "
+            f"legacy {result['legacy_s']*1000:8.1f} ms  "
+            f"bulk {result['bulk_s']*1000:7.1f} ms  "
+            f"x{result['speedup']:.1f}")
+    if args.output is not None:
+        with open(args.output,"w") as writer:
+            json.dump(output,writer,indent=4)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""This module caches parsed data files on disk so that loading the same file
+again skips parsing it"""
+import hashlib
+import json
+import os
+import pathlib
+import threading
+import numpy as np
+import loader
+
+MAX_BYTES = 256*2**20
+#Default bound on the total size of a cache directory.
+
+#================================================================
+# PARSED FILE CACHE
+#================================================================
+class ParseCache:
+    """The ParseCache class stores the data points and header of parsed
+    .dat.asc files in a cache directory.
+
+    Each entry is a pair of files named after the entry's key: a .npy file of
+    the data points and a .json file of the header. Keys are computed from a
+    file's absolute path, modification time and size, or from a hash of its
+    contents when hash_contents is enabled (slower, but survives copying and
+    touching files). When the directory grows past max_bytes, the least
+    recently used entries are deleted.
+
+    Parameters:
+        directory - the cache directory, created if it does not exist
+            (several threads or processes may share one directory)
+        max_bytes - the maximum total size of the cache entries
+        hash_contents - whether keys are computed from file contents"""
+
+    def __init__(self,directory,max_bytes=MAX_BYTES,hash_contents=False):
+        self.directory = pathlib.Path(directory)
+        self.directory.mkdir(parents=True,exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hash_contents = hash_contents
+        self.hits = 0
+        self.misses = 0
+
+    def key(self,path):
+        """This method returns the cache key of a data file."""
+        if self.hash_contents:
+            digest = hashlib.sha256()
+            with open(path,"rb") as reader:
+                for block in iter(lambda: reader.read(2**20),b""):
+                    digest.update(block)
+            return digest.hexdigest()
+        stat = os.stat(path)
+        identity = f"{os.path.abspath(path)}|{stat.st_mtime_ns}|{stat.st_size}"
+        return hashlib.sha256(identity.encode("utf-8")).hexdigest()
+
+    def _paths(self,key):
+        return self.directory/f"{key}.npy", self.directory/f"{key}.json"
+
+    def read_asc(self,path):
+        """This method returns the data points and header of a .dat.asc file
+        (see loader.read_asc()), from the cache if possible."""
+        data_path, header_path = self._paths(self.key(path))
+        try:
+            data = np.load(data_path)
+            with open(header_path,"r") as reader:
+                header = json.load(reader)
+        except (OSError,ValueError):
+            self.misses += 1
+            data, header = loader.read_asc(path)
+            self._store(data_path,header_path,data,header)
+            return data, header
+        self.hits += 1
+        os.utime(data_path)
+        #The modification time of an entry records when it was last used.
+        return data, header
+
+    def load_asc(self,path,color=None):
+        """This method loads a .dat.asc file as a Chromatogram object (see
+        loader.load_asc()), using the cache if possible."""
+        data, header = self.read_asc(path)
+        return loader.build_chromatogram(path,data,header,color)
+
+    def _store(self,data_path,header_path,data,header):
+        """This method writes a cache entry and evicts old entries if the
+        cache is too large. Files are written under temporary names first so
+        that other processes never see partial entries."""
+        suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(f"{header_path}{suffix}","w") as writer:
+            json.dump(header,writer)
+        with open(f"{data_path}{suffix}","wb") as writer:
+            np.save(writer,data)
+        os.replace(f"{header_path}{suffix}",header_path)
+        os.replace(f"{data_path}{suffix}",data_path)
+        self.evict()
+
+    def entries(self):
+        """This method returns a list of (last used time, size in bytes, key)
+        tuples of the entries in the cache."""
+        entries = []
+        for data_path in self.directory.glob("*.npy"):
+            try:
+                stat = data_path.stat()
+                size = stat.st_size+(self.directory/f"{data_path.stem}.json").stat().st_size
+            except OSError:
+                continue
+                #Entry was deleted by another process.
+            entries.append((stat.st_mtime,size,data_path.stem))
+        return entries
+
+    def size(self):
+        """This method returns the total size of the cache entries in bytes."""
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        """This method deletes the least recently used entries until the cache
+        is no larger than max_bytes."""
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            for entry_path in self._paths(key):
+                try:
+                    entry_path.unlink()
+                except OSError:
+                    pass
+            total -= size
+
+    def clear(self):
+        """This method deletes every entry in the cache."""
+        for _, _, key in self.entries():
+            for entry_path in self._paths(key):
+                try:
+                    entry_path.unlink()
+                except OSError:
+                    pass
@@ -1,22 +1,23 @@
 """This module defines the Chromatogram and Peak classes"""
+import bisect
+import copy
+import types
 import numpy as np
-import pandas as pd
-from icecream import ic
+import baselines
+import derivatives
+import noise
+import settings
 
 #================================================================
 # SETTING SYSTEM PARAMETERS
 #================================================================
-NOISE_TOLERANCE = 50
-SAMPLING_RATE = 10.000640
-
-with open("settings.cfg","r") as settings:
-    line = settings.readline()
-    while line != "":
-        if line.split(" ")[0] == "NOISE_TOLERANCE":
-            NOISE_TOLERANCE = float(line.split(" ")[1])
-        elif line.split(" ")[0] == "SMAPLING_RATE":
-            SAMPLING_RATE = float(line.split(" ")[1])
-        line = settings.readline()
+def __getattr__(name):
+    """This function makes NOISE_TOLERANCE and SAMPLING_RATE available as
+    module attributes, looked up in the settings (see settings.py) when they
+    are read rather than when the module is imported."""
+    if name in ("NOISE_TOLERANCE","SAMPLING_RATE"):
+        return settings.get(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 #================================================================
@@ -28,6 +29,186 @@ def validate(var,vals,types):
     return bool(var not in vals and isinstance(var,types))
 
 empties = ("",[],tuple(),None,0,{})
+
+def as_counts(data):
+    """This function converts a sequence of detector readings to a contiguous
+    numpy array. Integral data is stored as int32 counts; anything else is
+    stored as float64."""
+    data = np.asarray(data)
+    if data.dtype.kind in "biu":
+        return np.ascontiguousarray(data,dtype=np.int32)
+    return np.ascontiguousarray(data,dtype=np.float64)
+
+#================================================================
+# SIGNAL PROCESSING FUNCTIONS
+#================================================================
+def threshold_features(signal,threshold):
+    """This function finds the features of a signal series that rise above a
+    threshold.
+
+    Returns:
+        starts -- an array of the first index of each feature
+        ends -- an array of the first index after each feature; a feature
+            that is still above the threshold at the end of the series ends
+            at len(signal)"""
+    above = np.zeros(len(signal)+2,dtype=np.int8)
+    above[1:-1] = np.asarray(signal) > threshold
+    #Pad with a point below the threshold on both sides so that every
+    #feature has a rising and a falling edge.
+    edges = np.diff(above)
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    return starts, ends
+
+INDEX_COLUMN = "Retention Index"
+#First column of the peak table: the position of each peak in retention time
+#order, counting from 1. It is not stored with the peaks but numbered when the
+#table is built, so adding or removing a peak does not renumber the others.
+PEAK_TABLE_COLUMNS = {
+    "Retention Time":"retention_time",
+    "Area":"area",
+    "Height":"height",
+    "Width":"width_hh",
+    "Plate Count":"plates",
+    "S/N":"snr"
+    }
+#Other columns of the peak table and the Peak attributes they are taken from.
+
+class BoundLookup:
+    """The BoundLookup class finds the bounds of peak features from points
+    within them, using precomputed masks of a derivative series.
+
+    Each point of the derivative is classified as rising (derivative above the
+    tolerance), falling (below minus the tolerance) or flat (magnitude below
+    the tolerance). For each combination of classes searched for, a table of
+    the nearest matching index at or before (or at or after) every point is
+    built once with a cumulative maximum (minimum), so that every step of a
+    search is a single array lookup for any number of points at once.
+
+    From a point, the left bound is found by walking left:
+        on the right side of a peak, until the derivative rises (the left
+            side) or is flat (the crest);
+        on the crest, until the derivative rises (the left side);
+        on the left side, until the derivative is flat (the baseline) or falls
+            (the end of a previous peak).
+    The right bound is found in the same way walking right from the point,
+    starting on the left side of the peak. Searches that run past either end
+    of the series stop at that end."""
+
+    def __init__(self,derivative,tolerance):
+        derivative = np.asarray(derivative)
+        self.derivative = derivative
+        self.tolerance = tolerance
+        rising = derivative > tolerance
+        falling = -derivative > tolerance
+        self.flat = np.abs(derivative) < tolerance
+        self.n = len(derivative)
+        self.last_rising = self._last(rising)
+        self.last_rising_or_flat = self._last(rising|self.flat)
+        self.last_falling_or_flat = self._last(falling|self.flat)
+        self.next_falling = self._next(falling)
+        self.next_falling_or_flat = self._next(falling|self.flat)
+        self.next_rising_or_flat = self._next(rising|self.flat)
+        self.rising = rising
+        self.falling = falling
+
+    def _last(self,mask):
+        """This method returns, for every index, the last index at or before
+        it where the mask is True (or -1)."""
+        return np.maximum.accumulate(np.where(mask,np.arange(self.n),-1))
+
+    def _next(self,mask):
+        """This method returns, for every index, the first index at or after
+        it where the mask is True (or n)."""
+        return np.minimum.accumulate(
+            np.where(mask,np.arange(self.n),self.n)[::-1])[::-1]
+
+    def _before(self,table,indices):
+        """This method looks up table[indices], returning -1 for indices
+        before the start of the series."""
+        found = np.full(len(indices),-1)
+        valid = indices >= 0
+        found[valid] = table[indices[valid]]
+        return found
+
+    def _after(self,table,indices):
+        """This method looks up table[indices], returning n for indices past
+        the end of the series."""
+        found = np.full(len(indices),self.n)
+        valid = indices < self.n
+        found[valid] = table[indices[valid]]
+        return found
+
+    def find(self,points):
+        """This method returns arrays of the left and right bounds of the
+        features containing each of the given indices."""
+        points = np.asarray(points,dtype=np.int64).reshape(-1)
+        if self.n == 0:
+            return np.zeros(len(points),dtype=np.int64),\
+                np.zeros(len(points),dtype=np.int64)
+        points = np.clip(points,0,self.n-1)
+
+        #Left bound
+        on_top = self.flat[points]
+        on_right = ~on_top & (self.derivative[points] < 0)
+        left_side = np.where(on_right|on_top,-1,points)
+        #Index from which each search continues on the left side of the peak.
+        turn = self._before(self.last_rising_or_flat,points-1)
+        #From the right side, the first rising or flat point to the left...
+        reached = turn >= 0
+        turn_rising = np.zeros(len(points),dtype=bool)
+        turn_rising[reached] = self.rising[turn[reached]]
+        left_side = np.where(on_right&turn_rising,turn,left_side)
+        #...is on the left side if it is rising,
+        crest = np.where(on_top,points,np.where(on_right&reached&~turn_rising,
+            turn,-1))
+        #...or on the crest if it is flat.
+        from_crest = self._before(self.last_rising,crest-1)
+        left_side = np.where(crest >= 0,from_crest,left_side)
+        #From the crest, the left side starts at the first rising point.
+        lefts = self._before(self.last_falling_or_flat,left_side-1)
+        lefts = np.where(left_side >= 0,lefts,-1)
+        lefts = np.maximum(lefts,0)
+
+        #Right bound (the walk starts on the left side of the peak)
+        turn = self._after(self.next_falling_or_flat,points+1)
+        #From the left side, the first falling or flat point to the right...
+        reached = turn < self.n
+        turn_falling = np.zeros(len(points),dtype=bool)
+        turn_falling[reached] = self.falling[turn[reached]]
+        right_side = np.where(turn_falling,turn,self.n)
+        #...is on the right side if it is falling,
+        crest = np.where(reached&~turn_falling,turn,self.n)
+        #...or on the crest if it is flat.
+        from_crest = self._after(self.next_falling,crest+1)
+        right_side = np.where(crest < self.n,from_crest,right_side)
+        #From the crest, the right side starts at the first falling point.
+        rights = self._after(self.next_rising_or_flat,right_side+1)
+        rights = np.where(right_side < self.n,rights,self.n)
+        rights = np.minimum(rights,self.n-1)
+
+        return lefts, rights
+
+def peak_order_key(peak):
+    """This function returns the key by which the peaks of a chromatogram are
+    ordered: retention time, with ties broken by the bounding indices."""
+    return (peak.retention_time,peak.i_0,peak.i_f)
+
+class _OrderKeys:
+    """The _OrderKeys class is a read-only sequence of the peak_order_key() of
+    each of a list of peaks, so that the list can be searched with the bisect
+    module without building a list of keys (bisect only takes a key function
+    from Python 3.10)."""
+
+    def __init__(self,peaks):
+        self.peaks = peaks
+
+    def __len__(self):
+        return len(self.peaks)
+
+    def __getitem__(self,i):
+        return peak_order_key(self.peaks[i])
+
 #================================================================
 # CHROMATOGRAM
 #================================================================
@@ -37,11 +218,31 @@ class Chromatogram:
 
     Parameters:
         raw_data - expects a list of integers corresponding to signal intensity
-            in detector counts"""
+            in detector counts
+        signal_series, baseline - optional arrays of the processed signal and
+            of the baseline; when given they are used as-is instead of being
+            derived from the raw data (e.g. memory-mapped arrays of a saved
+            session)
+        time_scale - optional time scale in minutes per point, which takes
+            priority over sampling_rate
+
+    All data series (raw_data, signal_series, baseline, time_series and
+    derivative_series) are stored as contiguous numpy arrays: int32 for raw
+    detector counts and float64 for everything else. Arrays support the same
+    indexing, slicing, len() and iteration as the lists they replace.
+
+    Transformations never modify a series in place; a new array is assigned
+    instead, so arrays may safely be shared between objects."""
     def __init__(self,**kwargs):
-        self.raw_data = [point for point in kwargs["data"]]
-        self.signal_series = [point for point in kwargs["data"]]
-        self.baseline = [0 for point in kwargs["data"]]
+        self.raw_data = as_counts(kwargs["data"])
+        if kwargs.get("signal_series") is not None:
+            self.signal_series = kwargs["signal_series"]
+        else:
+            self.signal_series = self.raw_data.astype(np.float64)
+        if kwargs.get("baseline") is not None:
+            self.baseline = kwargs["baseline"]
+        else:
+            self.baseline = np.zeros(len(self.raw_data))
         #Initialize raw_data and signal_series as separate memory objects
         #so that raw_data can be remembered when signal_series is changed by
         #normalization, etc.
@@ -58,90 +259,222 @@ class Chromatogram:
             self.name = "unnamed chromatogram"
         #Set chromatogram name.
 
-        if "sampling_rate" in kwargs and validate(kwargs["sampling_rate"],empties,(int,float)):
+        if "time_scale" in kwargs and validate(kwargs["time_scale"],empties,(int,float)):
+            self.time_scale = kwargs["time_scale"]
+        elif "sampling_rate" in kwargs and validate(kwargs["sampling_rate"],empties,(int,float)):
             self.time_scale = 1/(60*kwargs["sampling_rate"])
         else:
-            self.time_scale=1/(60*SAMPLING_RATE)
+            self.time_scale=1/(60*settings.get("SAMPLING_RATE"))
         #Specify number of data points recorded per minute.
 
-        self.time_series=[t*self.time_scale for t in range(len(self.signal_series))]
-        #convert independent variable from data point # to time in minutes
-
         if "time_shift" in kwargs and validate(kwargs["time_shift"],empties,(int,float)):
             self.time_shift = kwargs["time_shift"]
         else:
             self.time_shift = 0
         #Variable to track net shift in time series
 
+        self.time_warp = kwargs.get("time_warp")
+        #Nonlinear correction of the time series (see Chromatogram.warp_time())
+
+        self._update_time_series()
+        #convert independent variable from data point # to time in minutes
+
         if "signal_scale" in kwargs and validate(kwargs["signal_scale"],empties,(int,float)):
             self.signal_scale = kwargs["signal_scale"]
         else:
             self.signal_scale = 1 #Variable to track net scaling of signal series
 
+        if "noise_tolerance" in kwargs and (kwargs["noise_tolerance"] == "auto"
+            or validate(kwargs["noise_tolerance"],empties,(int,float))):
+            self.noise_tolerance = kwargs["noise_tolerance"]
+        else:
+            self.noise_tolerance = None
+        #Overrides NOISE_TOLERANCE for this chromatogram when set; 'auto'
+        #uses a multiple of the estimated noise (see noise.py).
+
         self.reference_peak = None #Peak used as reference for adjusting time.
 
-        self.derivative_series=[self.signal_series[x+1]-self.signal_series[x]\
-            for x in range(len(self.signal_series)-1)]
-        #computes the right handed slope at any point
-        self.derivative_series.append(0)
-        #we need one more data point at the end so the lengths don't mismatch
-        self.peaks = []
+        if kwargs.get("derivative_mode") in derivatives.MODES:
+            self.derivative_mode = kwargs["derivative_mode"]
+        else:
+            self.derivative_mode = "right"
+        if "derivative_window" in kwargs and validate(kwargs["derivative_window"],empties,(int)):
+            self.derivative_window = kwargs["derivative_window"]
+        else:
+            self.derivative_window = derivatives.WINDOW
+        #Mode of the derivative used to find peak bounds (see derivatives.py)
+
+        self._derivative_series = None
+        #First-derivative series, computed when it is first requested.
+        self._derivatives = {}
+        #Derivative series of the present signal keyed by (mode, window).
+        self._noise_estimator = None
+        self._noise_key = None
+        #Estimator of the noise of the derivative (see Chromatogram.noise),
+        #and the (mode, window) of the derivative it was fed.
+        self._peaks = []
+        self._stale = False
+        #Flags that the peaks must be rebuilt because the series they were
+        #computed from have changed.
         self.hidden = False #Toggles display of chromatogram on graph.
         self.active = False
-        self.peak_table=pd.DataFrame()
+        self._peak_columns = {column:[] for column in PEAK_TABLE_COLUMNS}
+        #Peak data stored column-wise, with one row per peak.
+        self._peak_table = None
+        #DataFrame view of the peak data, built when it is first requested.
+        self._buffers = {}
+        #Buffers with spare capacity that data series are views of after the
+        #chromatogram has been extended (see Chromatogram.extend()).
+
+    @property
+    def peak_table(self):
+        """This property is a Pandas DataFrame of the peak data, used to
+        display it and easily export it as CSV. The DataFrame is cached until
+        the peak data changes."""
+        self.peaks
+        #Rebuild out-of-date peaks (and their table data) first.
+        if self._peak_table is None:
+            import pandas as pd
+            #Imported here so that importing this module (e.g. in worker
+            #processes) does not wait for pandas.
+            columns = {INDEX_COLUMN:np.arange(1,len(self._peaks)+1)}
+            columns.update(self._peak_columns)
+            self._peak_table = pd.DataFrame(columns,
+                columns=[INDEX_COLUMN]+list(PEAK_TABLE_COLUMNS))
+        return self._peak_table
+
+    @property
+    def derivative_series(self):
+        """This property is the first-derivative series of the signal in the
+        chromatogram's derivative mode. It is computed when it is first
+        requested after the signal changes."""
+        if self._derivative_series is None:
+            self._derivative_series = self._derivatives.get(
+                (self.derivative_mode,self.derivative_window))
+        if self._derivative_series is None:
+            self.compute_derivative()
+        return self._derivative_series
+
+    @derivative_series.setter
+    def derivative_series(self,series):
+        self._derivative_series = series
+
+    @property
+    def noise(self):
+        """This property is the estimated standard deviation of the noise of
+        the derivative series (see noise.py). The estimate is kept until the
+        signal or the derivative mode changes; points added by extend() are
+        added to it."""
+        key = (self.derivative_mode,self.derivative_window)
+        if self._noise_estimator is None or self._noise_key != key:
+            self._noise_estimator = noise.NoiseEstimator()
+            self._noise_key = key
+        final = len(self.signal_series)-derivatives.reach(*key)[1]
+        #The derivative of the last points changes when points are added.
+        if final > self._noise_estimator.count:
+            self._noise_estimator.push(
+                self.derivative_series[self._noise_estimator.count:final])
+        return self._noise_estimator.sigma()
+
+    @property
+    def signal_noise(self):
+        """This property is the estimated standard deviation of the noise of
+        the signal series, which signal-to-noise ratios are relative to."""
+        return noise.signal_noise(self.noise,self.derivative_mode,
+            self.derivative_window)
+
+    @property
+    def peaks(self):
+        """This property is the list of peaks, ordered by retention time. When
+        the chromatogram has been manipulated since the peaks were computed,
+        they are rebuilt from their bounds when the list is first requested."""
+        if self._stale:
+            self._stale = False
+            self._update_peaks()
+            self.reindex_peaks()
+            self.update_peak_table()
+        return self._peaks
+
+    @peaks.setter
+    def peaks(self,peaks):
+        self._peaks = peaks
 
     def update_peak_table(self):
-        """This method stores peak data in a Pandas DataFrame object in order to
-        easily export it as CSV"""
-        peaks_data = []
-        for peak in self.peaks:
-            peak_data = [
-                peak.retention_index,
-                peak.retention_time,
-                peak.area,
-                peak.height,
-                peak.width_hh,
-                peak.plates
-                ]
-            peaks_data.append(peak_data)
-
-        self.peak_table=pd.DataFrame(peaks_data,
-            columns=[
-                "Retention Index",
-                "Retention Time",
-                "Area",
-                "Height",
-                "Width",
-                "Plate Count"
-                ])
+        """This method rebuilds the peak data from all of the peaks."""
+        for column, attribute in PEAK_TABLE_COLUMNS.items():
+            self._peak_columns[column] = [getattr(peak,attribute)
+                for peak in self.peaks]
+        self._peak_table = None
+
+    def _table_insert(self,row,peak):
+        """This method inserts a row of peak data into the peak table."""
+        for column, attribute in PEAK_TABLE_COLUMNS.items():
+            self._peak_columns[column].insert(row,getattr(peak,attribute))
+        self._peak_table = None
+
+    def _table_remove(self,row):
+        """This method removes a row of peak data from the peak table."""
+        for column in PEAK_TABLE_COLUMNS:
+            del self._peak_columns[column][row]
+        self._peak_table = None
+
+    def _table_replace(self,row,peak):
+        """This method overwrites a row of peak data in the peak table."""
+        for column, attribute in PEAK_TABLE_COLUMNS.items():
+            self._peak_columns[column][row] = getattr(peak,attribute)
+        self._peak_table = None
 
     def reindex_peaks(self):
-        """This method orders peaks from lowest rt to highest"""
-        peak_order=[]
-        peaks_temp=[]
-        for peak_1 in self.peaks:
-            peak_index = 0
-            if len(self.peaks) <=1:
-                peak_order=[0]
-                #bug fix! without this line, peak_order is an empty table,
-                #so nothing gets appended into peaks_temp, so the peak table
-                #gets wiped by this function!
-                break
-            for peak_2 in self.peaks:
-                if peak_1 is peak_2:
-                    continue
-                    #do not compare peak with itself
-                if peak_1.retention_time>peak_2.retention_time:
-                    peak_index+=1
-                    #Assign each peak an index based on the order of its retention time
-                elif peak_1.retention_time==peak_2.retention_time:
-                    print("Error: Peaks should have distinct retention times!")
-            peak_order.append(peak_index)
-        for index in peak_order:
-            peaks_temp.append(self.peaks[index])
-            self.peaks[index].retention_index=len(peaks_temp)
-            #reorder peaks based on their assigned indices
-        self.peaks = peaks_temp #overwrite unsorted list with newly sorted list
+        """This method orders peaks from lowest rt to highest, which numbers
+        their retention indices (see INDEX_COLUMN). Peaks with equal retention
+        times are ordered by their bounding indices."""
+        self.peaks.sort(key=peak_order_key)
+
+    def _insert_peak(self,peak):
+        """This method inserts a peak into the list of peaks, which is kept
+        sorted by peak_order_key(), using a binary search. It returns the
+        position of the new peak."""
+        index = bisect.bisect_right(_OrderKeys(self.peaks),peak_order_key(peak))
+        self.peaks.insert(index,peak)
+        #The peaks after the new one are moved along in a single memmove.
+        return index
+
+    def copy(self):
+        """This method returns a copy of the chromatogram that shares its data
+        arrays with the original. Since data series are always replaced rather
+        than modified in place, either one can then be changed without
+        affecting the other."""
+        duplicate = copy.copy(self)
+        duplicate._peaks = [copy.copy(peak) for peak in self._peaks]
+        duplicate._peak_columns = {column:list(values)
+            for column, values in self._peak_columns.items()}
+        duplicate._buffers = {}
+        duplicate._derivatives = dict(self._derivatives)
+        duplicate._noise_estimator = copy.copy(self._noise_estimator)
+        if self._buffers:
+            duplicate._derivative_series = None
+            duplicate._derivatives = {}
+            #Extending overwrites the last point of a buffered derivative, so
+            #the copy computes its own.
+        return duplicate
+
+    def data_arrays(self):
+        """This method returns a dict of the data arrays of the chromatogram
+        keyed by their ids, which is used to measure memory shared between
+        copies. Arrays of derived data that has been computed (derivatives,
+        the bound lookup and the noise estimate) are included, and series
+        that are views of buffers (see Chromatogram.extend()) are counted as
+        the whole buffer."""
+        arrays = [value for value in vars(self).values()
+            if isinstance(value,np.ndarray)]
+        arrays += list(self._derivatives.values())+list(self._buffers.values())
+        for cache in (getattr(self,"_bounds_cache",None),self._noise_estimator):
+            if cache is not None:
+                arrays += [value for value in vars(cache).values()
+                    if isinstance(value,np.ndarray)]
+        buffers = set(id(buffer) for buffer in self._buffers.values())
+        return {id(array):array for array in arrays
+            if id(array.base) not in buffers}
 
     def __getitem__(self,i):
         """This method allows direct indexing into the chromatogram to access
@@ -149,65 +482,211 @@ class Chromatogram:
         return self.peaks[i]
 
     def __repr__(self):
+        import pandas as pd
         pd.set_option("display.precision", 2)
         return f"Chromatogram {self.name} <{id(self)}>:\n{str(self.peak_table)}\n"
 
     def compute_derivative(self):
         """This method is used to calculate the first-derivative series from
-        the signal series."""
-        self.derivative_series=[self.signal_series[x+1]-self.signal_series[x]\
-            for x in range(len(self.signal_series)-1)]
-        #Computes the right handed slope at any point
-        self.derivative_series.append(0)
-        #we need one more data point at the end so the lengths don't mismatch
+        the signal series, in the chromatogram's derivative mode (see
+        derivatives.py). By default, this is the right handed slope at every
+        point, with the last point left at 0."""
+        key = (self.derivative_mode,self.derivative_window)
+        self.derivative_series = derivatives.differentiate(self.signal_series,
+            *key)
+        self._derivatives[key] = self._derivative_series
+
+    def set_derivative_mode(self,mode,window=None):
+        """This method selects how the derivative used to find peak bounds is
+        computed (see derivatives.py). Derivatives computed in other modes
+        are kept until the signal changes, so switching back is free.
+        Existing peaks are kept as they are.
+
+        Arguments:
+            mode -- 'right', 'left', 'central', 'savgol' or 'moving_average'
+            window -- the window in points of the smoothing modes (by default
+                the present window)"""
+        if window is None:
+            window = self.derivative_window
+        derivatives.kernel(mode,window)
+        #Raises a ValueError for unknown modes.
+        self.derivative_mode = mode
+        self.derivative_window = window
+        self._derivative_series = None
 
     def time2index(self,time):
         """This method converts a list of times to a list of corresponding data
         point indices."""
         output = None
-        if isinstance(time,(list,tuple)):
-            indices = []
-            for t in time:
-                indices.append(int(np.round((t-self.time_shift)/self.time_scale)))
-                output = indices
-        elif isinstance(time,(float,int)):
-            output = int(np.round((time-self.time_shift)/self.time_scale))
+        if isinstance(time,(list,tuple,np.ndarray)):
+            output = np.round(self._unwarp(np.asarray(time,dtype=np.float64)))\
+                .astype(int).tolist()
+        elif isinstance(time,(float,int,np.number)):
+            output = int(np.round(self._unwarp(time)))
         return output
 
     def index2time(self,index):
         """This method converts a list of data point indices to a list of
         time points."""
         output = None
-        if isinstance(index,(list,tuple)):
-            time = []
-            for i in index:
-                time.append(i*self.time_scale+self.time_shift)
-            output = time
-        elif isinstance(index,int):
-            output = index*self.time_scale+self.time_shift
+        if isinstance(index,(list,tuple,np.ndarray)):
+            index = np.asarray(index)
+            output = (index*self.time_scale+self.time_shift
+                +self._warp_offsets(index)).tolist()
+        elif isinstance(index,(int,np.integer)):
+            output = index*self.time_scale+self.time_shift\
+                +float(self._warp_offsets(index))
         return output
 
+    def _warp_offsets(self,index):
+        """This method returns the time warp offsets at (possibly fractional)
+        data point indices, or 0 if the time series is not warped."""
+        if self.time_warp is None:
+            return 0
+        anchors, offsets = self.time_warp
+        return np.interp(index,anchors,offsets)
+        #Past the first and last anchors, the offset stays constant.
+
+    def _unwarp(self,time):
+        """This method returns the fractional data point indices at which the
+        time series reaches the given times."""
+        if self.time_warp is None or len(self.time_series) == 0:
+            return (time-self.time_shift)/self.time_scale
+        n = len(self.time_series)
+        first, last = self.time_series[0], self.time_series[-1]
+        return np.where(time < first,(time-first)/self.time_scale,
+            np.where(time > last,(time-last)/self.time_scale+n-1,
+            np.interp(time,self.time_series,np.arange(n))))
+        #The warped time series is increasing, so it can be inverted by
+        #interpolation; past either end, it runs at the time scale.
+
+    def warp_time(self,anchors,offsets=None):
+        """This method warps the time series nonlinearly, e.g. to align it
+        with another chromatogram (see align.py).
+
+        The time of each data point is shifted by an offset interpolated
+        linearly between anchor points, on top of time_scale and time_shift.
+        Before the first and after the last anchor, the offsets of those
+        anchors apply. The warped time series must stay increasing.
+
+        Arguments:
+            anchors -- an increasing list of (possibly fractional) data point
+                indices, or None to remove the warp
+            offsets -- a list of the time offsets at the anchors in minutes
+
+        Raises a ValueError, leaving the time series as it was, if the anchors
+        are not increasing or the warped time series would not be."""
+        if anchors is None or len(anchors) == 0:
+            warp = None
+        else:
+            warp = ([float(anchor) for anchor in anchors],
+                [float(offset) for offset in offsets])
+            if len(warp[0]) != len(warp[1]):
+                raise ValueError("A time warp needs one offset per anchor!")
+            if np.any(np.diff(warp[0]) <= 0):
+                raise ValueError("Time warp anchors must be increasing!")
+        previous = self.time_warp, self.time_series
+        self.time_warp = warp
+        self._update_time_series()
+        if np.any(np.diff(self.time_series) <= 0):
+            self.time_warp, self.time_series = previous
+            raise ValueError("A time warp must keep the time series "
+                "increasing!")
+        self._invalidate(signal=False)
+
     def _update_peaks(self):
         """This method is used to update peaks when a chromatogram is
         manipulated (i.e. time series is shifted or signal series is scaled.)
         A new set of peaks is constructed based on the bounding point indices
         of the old peaks."""
         updated_peaks = []
-        for peak in self.peaks:
+        for peak in self._peaks:
             updated_peaks.append(Peak(self,[peak.i_0,peak.i_f],area_mode=peak.area_mode))
-        self.peaks = updated_peaks
+        self._peaks = updated_peaks
+
+    def peak_bounds(self):
+        """This method returns the peaks as a list of [i_0, i_f, area_mode]
+        lists, without rebuilding out-of-date peaks."""
+        return [[int(peak.i_0),int(peak.i_f),peak.area_mode]
+            for peak in self._peaks]
+
+    def restore_peaks(self,peaks):
+        """This method restores peaks from a list of [i_0, i_f, area_mode]
+        lists (e.g. from a saved session), replacing any existing peaks. The
+        Peak objects are built the first time the peaks are read."""
+        self._peaks = [types.SimpleNamespace(i_0=i_0,i_f=i_f,area_mode=area_mode)
+            for i_0, i_f, area_mode in peaks]
+        #Placeholders holding just what _update_peaks() needs.
+        self._invalidate(signal=False)
+
+    def _invalidate(self,signal=True):
+        """This method marks the data derived from the signal and time series
+        (derivative series, peaks and peak table) as out of date, so that it is
+        recomputed the next time it is read. Several manipulations in a row
+        therefore cost a single recomputation.
+
+        Arguments:
+            signal -- whether the signal series changed; the derivative only
+                needs to be recomputed if it did"""
+        if signal:
+            self._derivative_series = None
+            self._derivatives = {}
+            self._noise_estimator = None
+        self._stale = True
+        self._peak_table = None
 
     def update(self):
         """This method is used to ensure that any changes to a chromatogram
-        are reflected throughout."""
-        self.compute_derivative()
-        self.reindex_peaks()
-        self.update_peak_table()
+        are reflected throughout. Derived data is recomputed lazily."""
+        self._invalidate()
 
     def add_peak(self,bounds,area_mode="bb"):
-        """This method is used to add a peak to the chromatogram."""
-        self.peaks.append(Peak(self,bounds))
-        self.update()
+        """This method is used to add a peak to the chromatogram. It returns
+        the new Peak."""
+        peak = Peak(self,bounds,area_mode=area_mode)
+        self._table_insert(self._insert_peak(peak),peak)
+        #Adding a peak does not change the signal, so the derivative does not
+        #need to be recomputed and only one row of the peak table is added.
+        return peak
+
+    def remove_peak(self,i):
+        """This method removes the i-th peak from the chromatogram."""
+        self.peaks.pop(i)
+        self._table_remove(i)
+
+    def peak_at(self,point):
+        """This method returns the position in the list of peaks of the peak
+        whose bounds contain a data point index (the one whose crest is
+        nearest if several do), or None if no peak does."""
+        positions = [i for i, peak in enumerate(self.peaks)
+            if peak.i_0 <= point <= peak.i_f]
+        if not positions:
+            return None
+        return min(positions,key=lambda i: abs(self.peaks[i].i_max-point))
+
+    def recompute_peak(self,i,area_mode=None):
+        """This method rebuilds the i-th peak from its bounds, optionally with
+        a new area mode, and updates its row of the peak table."""
+        old_peak = self.peaks[i]
+        if area_mode is None:
+            area_mode = old_peak.area_mode
+        peak = Peak(self,[old_peak.i_0,old_peak.i_f],area_mode=area_mode)
+        self.peaks[i] = peak
+        self._table_replace(i,peak)
+
+    def add_peaks(self,bounds_list,area_mode="bb"):
+        """This method is used to add several peaks to the chromatogram at
+        once, sorting the peaks and updating the peak table a single time."""
+        self.insert_peaks([Peak(self,bounds,area_mode=area_mode)
+            for bounds in bounds_list])
+
+    def insert_peaks(self,peaks):
+        """This method is used to add several Peak objects to the chromatogram
+        at once, sorting the peaks and updating the peak table a single
+        time."""
+        self.peaks.extend(peaks)
+        self.reindex_peaks()
+        self.update_peak_table()
 
     def baseline_correct(self,bounds):
         """This method is used to correct the baseline of the chromatogram. It
@@ -221,20 +700,99 @@ class Chromatogram:
         s_0 = self.signal_series[i_0] #Signal at first point
         s_f = self.signal_series[i_f] #Signal at second point
         slope = (s_f-s_0)/(i_f-i_0) #Slope of baseline
-        self.baseline = [slope * (i_x-i_0) + s_0
-            for i_x,_ in enumerate(self.signal_series)]
+        self.baseline = slope*(np.arange(len(self.signal_series))-i_0) + s_0
         #Signal values of baseline calculated with point slope form
-        corrected_signals = [self.signal_series[i] - self.baseline[i]
-            for i,_ in enumerate(self.signal_series)]
-        self.signal_series = corrected_signals
+        self.signal_series = self.signal_series - self.baseline
         #Update signal series by subtracting baseline values
-        self._update_peaks()
-        self.update()
+        self._invalidate()
+
+    def auto_baseline(self,method="als",**options):
+        """This method corrects the baseline of the chromatogram with a
+        baseline estimated from the data (see baselines.py), replacing any
+        earlier baseline correction.
+
+        Arguments:
+            method -- 'als', 'rolling_min' or 'polynomial'
+            options -- passed on to the function of the method"""
+        uncorrected = self.signal_series+self.baseline
+        self.baseline = baselines.estimate(uncorrected,method,**options)
+        self.signal_series = uncorrected-self.baseline
+        self._invalidate()
+
+    def _grow(self,name,length):
+        """This method returns a buffer of at least the given length whose
+        first points are the named data series. The buffer the series is a
+        view of is reused while it has room; otherwise a new one is allocated
+        with double the capacity."""
+        series = getattr(self,name)
+        buffer = self._buffers.get(name)
+        if buffer is None or series.base is not buffer or len(buffer) < length:
+            buffer = np.empty(max(length,2*len(series)),dtype=series.dtype)
+            buffer[:len(series)] = series
+            self._buffers[name] = buffer
+        return buffer
+
+    def extend(self,data):
+        """This method appends new detector readings to the end of the
+        chromatogram, e.g. while a run is being acquired (see live.py).
+
+        The data series become views of buffers whose capacity doubles when
+        they fill up, so appending takes time proportional to the number of
+        new points rather than to the length of the chromatogram. Points
+        already in the series are never changed, so existing views and copies
+        of them are unaffected. The signal of the new points is scaled by
+        signal_scale, and the baseline is continued along the line through its
+        last two points. Existing peaks are kept as they are."""
+        data = np.asarray(data).astype(self.raw_data.dtype)
+        n_old = len(self.raw_data)
+        n_new = n_old+len(data)
+        if len(data) == 0:
+            return
+
+        baseline = self._grow("baseline",n_new)
+        if n_old >= 2:
+            slope = baseline[n_old-1]-baseline[n_old-2]
+            baseline[n_old:n_new] = baseline[n_old-1]\
+                +slope*np.arange(1,len(data)+1)
+        elif n_old == 1:
+            baseline[n_old:n_new] = baseline[0]
+        else:
+            baseline[n_old:n_new] = 0
+        raw_data = self._grow("raw_data",n_new)
+        raw_data[n_old:n_new] = data
+        signal = self._grow("signal_series",n_new)
+        signal[n_old:n_new] = data*self.signal_scale-baseline[n_old:n_new]
+        time = self._grow("time_series",n_new)
+        indices = np.arange(n_old,n_new)
+        time[n_old:n_new] = indices*self.time_scale + self.time_shift\
+            + self._warp_offsets(indices)
+
+        self._derivatives = {}
+        if self._derivative_series is not None:
+            derivative = self._grow("_derivative_series",n_new)
+            start = max(n_old-derivatives.reach(self.derivative_mode,
+                self.derivative_window)[1],0)
+            derivative[start:n_new] = derivatives.differentiate(
+                signal[:n_new],self.derivative_mode,self.derivative_window,
+                start)
+            self._derivative_series = derivative[:n_new]
+            self._derivatives[(self.derivative_mode,self.derivative_window)]\
+                = self._derivative_series
+            #Only the derivative of the new points (and of the last old
+            #points, which depends on them) is computed.
+
+        self.baseline = baseline[:n_new]
+        self.raw_data = raw_data[:n_new]
+        self.signal_series = signal[:n_new]
+        self.time_series = time[:n_new]
 
     def _update_time_series(self):
         """This method is used to apply changes to the time_scale and time_shift
         attributes to the time_series list."""
-        self.time_series=[t*self.time_scale+self.time_shift for t in range(len(self.signal_series))]
+        indices = np.arange(len(self.signal_series))
+        self.time_series = indices*self.time_scale + self.time_shift
+        if self.time_warp is not None:
+            self.time_series = self.time_series + self._warp_offsets(indices)
 
     def shift_time(self, shift, set=False):
         """This method shifts the time series by a given amount of time.
@@ -249,8 +807,7 @@ class Chromatogram:
             self.time_shift += shift
 
         self._update_time_series()
-        self._update_peaks()
-        self.update()
+        self._invalidate(signal=False)
 
     def scale_signal(self, factor,set=False):
         """This method scales the signal series by a specified scale factor.
@@ -262,15 +819,19 @@ class Chromatogram:
         if factor == 0:
             print("Cannot scale signal to 0 or data will be lost!")
         else:
+            old_scale = self.signal_scale
             if set:
                 self.signal_scale = factor
             else:
                 self.signal_scale *= factor
 
-            self.signal_series = [self.signal_scale*point for point in self.raw_data]
+            ratio = self.signal_scale/old_scale
+            self.signal_series = ratio*self.signal_series
+            self.baseline = ratio*self.baseline
+            #The signal is rescaled rather than recomputed from raw_data so
+            #that baseline corrections are kept.
 
-            self._update_peaks()
-            self.update()
+            self._invalidate()
 
     def scale_time(self, factor, type="period",set=True):
         """This method changes the time scale factor.
@@ -298,12 +859,11 @@ class Chromatogram:
                     self.time_scale = 1/(60*factor)
                 else:
                     self.time_scale *= 1/(60*factor)
-            self.time_series=[t*self.time_scale+self.time_shift for t in range(len(self.signal_series))]
+            self._update_time_series()
         else:
             print("Invalid argument for Chromatogram.rescale_time()")
 
-        self._update_peaks()
-        self.update()
+        self._invalidate(signal=False)
 
     def normalize(self, reference, dim="area", norm_to=1):
         """This method normalizes the signal series with respect to a reference
@@ -323,7 +883,7 @@ class Chromatogram:
         if dim == "area":
             self.scale_signal(norm_to/reference.area,set=True)
         elif dim == "height":
-            self.scale_signal(norm_to/reference.height,self=True)
+            self.scale_signal(norm_to/reference.height,set=True)
         else:
             raise ValueError("Normalization dimension must be\
                  'area' or 'height!'") from None
@@ -333,115 +893,92 @@ class Chromatogram:
         self.shift_time(reference.retention_time,set=True)
         self.reference_peak = reference
 
+    def _tolerance_setting(self):
+        """This method returns the noise tolerance of the chromatogram, or the
+        NOISE_TOLERANCE setting if it has none: a number of detector counts
+        or 'auto'."""
+        if self.noise_tolerance is not None:
+            return self.noise_tolerance
+        return settings.get("NOISE_TOLERANCE")
+
+    def _bound_tolerance(self):
+        """This method returns the derivative magnitude below which the signal
+        is considered flat when detecting peak bounds."""
+        tolerance = self._tolerance_setting()
+        if tolerance == "auto":
+            return noise.TOLERANCE_FACTOR*self.noise
+        return tolerance*self.signal_scale
+
+    def _bound_lookup(self):
+        """This method returns the BoundLookup of the derivative series,
+        reusing it until the derivative or the tolerance changes."""
+        derivative = self.derivative_series
+        tolerance = self._bound_tolerance()
+        lookup = getattr(self,"_bounds_cache",None)
+        if lookup is None or lookup.derivative is not derivative\
+            or lookup.tolerance != tolerance:
+            lookup = BoundLookup(derivative,tolerance)
+            self._bounds_cache = lookup
+        return lookup
+
     def detect_bounds(self, point):
         """This method finds the bounding indices of a feature (peak) from a
         single index within the peak by examining the first derivative.
 
         The location on the peak is detected (left, right, or plateau) and
         from there, the bounds are detected as points past the crest (plateau)
-        whose first derivatives are zero (below the NOISE_TOLERANCE threshold)."""
-        location = ""
-        if abs(self.derivative_series[point]) < NOISE_TOLERANCE*self.signal_scale:
-            location = "top"
-        elif self.derivative_series[point] < 0:
-            location = "right"
-        else:
-            location = "left"
-
-        left = point
-        right = point
-
-        while True:
-            left -= 1
-            #Step through the feature backwards to find the left bound.
-            if location == "left" and abs(self.derivative_series[left]) < NOISE_TOLERANCE*self.signal_scale:
-                #Bound is found when the left tail reaches a plateau (zero derivative).
-                break
-            elif location == "left" and -self.derivative_series[left] > NOISE_TOLERANCE*self.signal_scale:
-                #Bound is also found when the left tail finds the end of another
-                #peak (negative derivative).
-                break
-            elif location == "top" and self.derivative_series[left] > NOISE_TOLERANCE*self.signal_scale:
-                #The left tail is found when the top begins to to slope (positive derivative).
-                location = "left"
-                continue
-            elif location == "right" and self.derivative_series[left] > NOISE_TOLERANCE*self.signal_scale:
-                location = "left"
-                #There may not be a top plateau, so the left tail is found when
-                #derivative is positive while exploring the right tail.
-                continue
-            elif location == "right" and abs(self.derivative_series[left]) < NOISE_TOLERANCE*self.signal_scale:
-                location = "top"
-                #The top is found when the right tail gives way to a plateau.
-                continue
-            else:
-                continue
-
-        while True:
-            right += 1
-            #Step through the feature forwards to find the right bound.
-            if location == "right" and abs(self.derivative_series[right]) < NOISE_TOLERANCE*self.signal_scale:
-                #Bound is found when the right tail reaches a plateau (zero derivative).
-                break
-            elif location == "right" and self.derivative_series[right] > NOISE_TOLERANCE*self.signal_scale:
-                #Bound is also found when the right tail finds the start of another
-                #peak (positive derivative).
-                break
-            elif location == "top" and -self.derivative_series[right] > NOISE_TOLERANCE*self.signal_scale:
-                #The right tail is found when the top begins to to slope (negative derivative).
-                location = "right"
-                continue
-            elif location == "left" and -self.derivative_series[right] > NOISE_TOLERANCE*self.signal_scale:
-                location = "right"
-                #There may not be a top plateau, so the right tail is found when
-                #derivative is negative while exploring the left tail.
-                continue
-            elif location == "left" and abs(self.derivative_series[right]) < NOISE_TOLERANCE*self.signal_scale:
-                location = "top"
-                #The top is found when the left tail gives way to a plateau.
-                continue
-            else:
-                continue
-
-        return [left,right]
-
-    def one_point_peak(self,point):
+        whose first derivatives are zero (below the noise tolerance).
+        Bounds that would lie past either end of the chromatogram are placed
+        at its ends. See BoundLookup for details."""
+        lefts, rights = self._bound_lookup().find([point])
+        return [int(lefts[0]),int(rights[0])]
+
+    def detect_bounds_batch(self, points):
+        """This method finds the bounds of the features containing each of a
+        list of indices at once (see detect_bounds()).
+
+        Returns:
+            lefts -- an array of the left bound of each feature
+            rights -- an array of the right bound of each feature"""
+        return self._bound_lookup().find(points)
+
+    def one_point_peak(self,point,area_mode="bb"):
         """This method adds a peak from a single index within the feature,
         using the detect_bounds() method to find the bounding indices of the
         peak."""
-        self.add_peak(self.detect_bounds(point))
-
-
-    def threshold_autopick(self,threshold,delta=200):
-        """This method automatically picks peaks above a certain threshold"""
-        features=[]
-        #Keep track of the features above the threshold in this list.
-        above_threshold = False
-        temp_bounds = []
-        for index,signal in enumerate(self.signal_series):
-            if not above_threshold:
-                if signal > threshold:
-                    temp_bounds.append(index)
-                    above_threshold = True
-                    #When the signal first exceeds the threshold, define the
-                    #start of a new feature.
-            else:
-                if signal < threshold:
-                    temp_bounds.append(index)
-                    above_threshold = False
-                    features.append(temp_bounds)
-                    #When the signal of a feature drops below the threshold,
-                    #define the end of the feature and append it to the list of
-                    #features.
+        self.add_peak(self.detect_bounds(point),area_mode=area_mode)
+
+
+    def threshold_autopick(self,threshold="auto",delta=200,area_mode="bb"):
+        """This method automatically picks peaks above a certain threshold. A
+        threshold of 'auto' (the default) picks the peaks that rise more than
+        noise.THRESHOLD_FACTOR times the noise of the signal above the level
+        of the baseline (see noise.baseline_level()), so it also works on data
+        whose baseline has not been corrected."""
+        signal = self.signal_series
+        if threshold == "auto":
+            signal = signal-noise.baseline_level(signal)
+            threshold = noise.THRESHOLD_FACTOR*self.signal_noise
+        starts, ends = threshold_features(signal,threshold)
+        #A feature starts where the signal first exceeds the threshold, and
+        #ends where it drops back below it.
 
         #Note: we could be done here if we only wanted to include the part of
         #the peaks that are above the threshold, but instead what we want is to
         #include the entirety of any peak whose maximum height is above the
         #threshold.
-        for feature in temp_bounds:
-            self.one_point_peak(feature[0])
-            #Instead of reinveinting the wheel, peaks are made from the
-            #detected features by using one_point_peak() to find their bounds.
+        picked = set((peak.i_0,peak.i_f) for peak in self.peaks)
+        new_bounds = []
+        lefts, rights = self.detect_bounds_batch(starts)
+        #Instead of reinveinting the wheel, the bounds of all features are
+        #found with detect_bounds_batch().
+        for bounds in zip(lefts.tolist(),rights.tolist()):
+            if bounds not in picked:
+                picked.add(bounds)
+                new_bounds.append(list(bounds))
+                #Several features (e.g. noise around the threshold) can belong
+                #to the same peak, which is only added once.
+        self.add_peaks(new_bounds,area_mode=area_mode)
 
     def load_dict(self,dictionary):
         """This method loads data from a dict of chromatogram data."""
@@ -457,63 +994,103 @@ class Peak:
     raw data and time series the peak contains, peak area, maximum height,
     half-height width, retention time, etc."""
 
-    def __init__(self, parent_gram, bounds, area_mode="bb"):
+    def __init__(self, parent_gram, bounds, area_mode="bb", signal_noise=None):
         """Peak object is defined by its parent chromatogram and its
-        bounding indices."""
+        bounding indices. Its signal-to-noise ratio is relative to
+        signal_noise if it is given, or else to the noise of the parent
+        chromatogram."""
         self.i_0, self.i_f = bounds
         #Indices of incident and final data points in the chromatogram raw data.
         self.t_0, self.t_f = parent_gram.index2time(bounds)
         #Starting and ending time of peak feature.
         self.time_series = parent_gram.time_series[self.i_0:self.i_f+1]
         self.signal_series = parent_gram.signal_series[self.i_0:self.i_f+1]
-        #subset of raw data contained in peak
+        #subset of raw data contained in peak (views into the parent
+        #chromatogram's arrays, not copies)
         self.s_0 = self.signal_series[0]
         self.s_f = self.signal_series[-1]
-        self.height = max(self.signal_series)
-        self.retention_index = 0
+        self.height = self.signal_series.max()
 
+        n_points = len(self.signal_series)
+        if self.t_f != self.t_0:
+            ramp = n_points*(n_points-1)/2/(self.t_f-self.t_0)
+        else:
+            ramp = 0
+        #Sum of n/(t_f-t_0) for n in range(n_points); each modifier below is a
+        #slope multiplied by this sum.
         self.area_modifiers = {
             "bb":0,
-            "vv":sum([(self.s_f-self.s_0)/(self.t_f-self.t_0)*n\
-                for n in range(len(self.time_series))]),
-            "bv":sum([(0-self.s_0)/(self.t_f-self.t_0)*n\
-                for n in range(len(self.time_series))]),
-            "vb":sum([(self.s_f-0)/(self.t_f-self.t_0)*n\
-                for n in range(len(self.time_series))])
+            "vv":(self.s_f-self.s_0)*ramp,
+            "bv":(0-self.s_0)*ramp,
+            "vb":(self.s_f-0)*ramp
         }
         #modifiers for different integration modes: base-base, valley-valley,
         #left base to right valley, right base to left valley
         #The modifiers are integrals of the lines connecting the bases/valleys
 
+        total = self.signal_series.sum()
         self.areas={}
         for key in self.area_modifiers:
-            self.areas[key]=sum(self.signal_series)-self.area_modifiers[key]
+            self.areas[key]=total-self.area_modifiers[key]
         #areas computed with each mode
         self.area = self.areas[area_mode]
         self.area_mode = area_mode
         #area computed with the desired mode
 
-        i_maxima = [index for index in range(len(self.time_series))\
-            if self.signal_series[index] == self.height]
+        i_maxima = np.flatnonzero(self.signal_series == self.height)
         #finds all time points with maximum signal in case detector caps out
-        i_max=int(np.floor((len(i_maxima)-1)/2))
+        i_max = i_maxima[(len(i_maxima)-1)//2]
         #as an estimate, the middle of the peak is in the middle of the plateau
+        self.i_max = self.i_0+int(i_max)
+        #Index of the crest in the chromatogram.
         self.retention_time=self.time_series[i_max]
         #the retention time occurs at the crest of the peak
 
-        try:
-            i_over_hh = [index for index in range(len(self.signal_series))\
-                if self.signal_series[index]>self.height/2]
-            #all indices for which the singal is > half the height
+        self.width_hh = np.nan
+        self.plates = np.nan
+        i_over_hh = np.flatnonzero(self.signal_series > self.height/2)
+        #all indices for which the singal is > half the height
+        if len(i_over_hh) > 0:
             self.width_hh=self.time_series[i_over_hh[-1]]\
                 -self.time_series[i_over_hh[0]]
             #hh width is total duration of time for which the signal is
             #greater than half-height
+        if self.width_hh > 0:
             self.plates=5.54*(self.retention_time/self.width_hh)\
                 *(self.retention_time/self.width_hh)
             #calculates the number of theoretical plates for a peak
-        except:
+        else:
             print("Error computing half-height width")
 
+        if signal_noise is None:
+            signal_noise = parent_gram.signal_noise
+        self.snr = self.signal_to_noise(signal_noise)
+        #signal-to-noise ratio of the peak (see noise.py)
+
+    def signal_to_noise(self,signal_noise):
+        """This method returns the signal-to-noise ratio of the peak given the
+        noise of the signal. The height of the peak is measured from the line
+        joining its bounds, so that an uncorrected baseline does not count."""
+        base = self.s_0
+        if self.i_f != self.i_0:
+            base += (self.s_f-self.s_0)*(self.i_max-self.i_0)/(self.i_f-self.i_0)
+        return noise.snr(self.height-base,signal_noise)
+
+    @classmethod
+    def restore(cls, parent_gram, attributes):
+        """This method recreates a peak of a chromatogram from the attributes
+        of a peak computed elsewhere (e.g. in a worker process, see
+        parallel.py), without computing its metrics again.
+
+        Arguments:
+            parent_gram -- the chromatogram the peak belongs to
+            attributes -- a dict of the peak's attributes, apart from its
+                time_series and signal_series"""
+        peak = cls.__new__(cls)
+        peak.__dict__.update(attributes)
+        peak.time_series = parent_gram.time_series[peak.i_0:peak.i_f+1]
+        peak.signal_series = parent_gram.signal_series[peak.i_0:peak.i_f+1]
+        return peak
+
     def __repr__(self):
         return f"Peak object <{id(self)}>"
@@ -0,0 +1,262 @@
+"""This module indexes the peaks of a set of chromatograms by retention time,
+so that the same compound can be found in every run.
+
+Example:
+    index = compounds.PeakIndex(history.present().chromatograms)
+    index.find(4.32,0.02)    #the peak at 4.32 +/- 0.02 min in each run
+    index.compound_table(0.02,"Area")    #one row per compound
+
+The index keeps the retention times, bounds and runs of all peaks in arrays
+sorted by retention time, so queries are binary searches. Peaks whose bounds
+[t_0, t_f] overlap an interval are found the same way: their retention time
+lies within the widest peak's width of the interval. After chromatograms or
+their peaks change, PeakIndex.sync() updates only the peaks that were added
+or removed."""
+import numpy as np
+from chromatogram import PEAK_TABLE_COLUMNS
+
+TOLERANCE = 0.02
+#Default maximum distance in minutes between peaks of the same compound.
+
+#================================================================
+# PEAK INDEX
+#================================================================
+class PeakIndex:
+    """The PeakIndex class is a retention time index of the peaks of several
+    chromatograms (runs).
+
+    Parameters:
+        chromatograms - the chromatograms to index; more can be added with
+            add() or sync()
+
+    Runs are numbered by their position in PeakIndex.chromatograms. Query
+    results are (chromatogram, peak) pairs in order of retention time."""
+    def __init__(self,chromatograms=()):
+        self.chromatograms = []
+        self._signatures = []
+        #ids of the indexed peaks of each run, to find what changed.
+        self._times = np.zeros(0)
+        self._starts = np.zeros(0)
+        self._ends = np.zeros(0)
+        self._runs = np.zeros(0,dtype=int)
+        self._peaks = np.zeros(0,dtype=object)
+        self._max_width = 0.0
+        for gram in chromatograms:
+            self.add(gram)
+
+    def __len__(self):
+        return len(self._times)
+
+    def _results(self,positions):
+        """This method returns the (chromatogram, peak) pairs of positions in
+        the index."""
+        return [(self.chromatograms[run], peak) for run, peak
+            in zip(self._runs[positions],self._peaks[positions])]
+
+    #================================================================
+    # UPDATING
+    #================================================================
+    def add(self,gram):
+        """This method adds a chromatogram and its peaks to the index."""
+        self.chromatograms.append(gram)
+        self._signatures.append(set())
+        self.add_peaks(gram,gram.peaks)
+
+    def add_peaks(self,gram,peaks):
+        """This method adds peaks of an indexed chromatogram to the index,
+        merging them into the sorted arrays in one pass."""
+        if len(peaks) == 0:
+            return
+        run = self.run(gram)
+        times = np.array([peak.retention_time for peak in peaks],dtype=float)
+        order = np.argsort(times,kind="stable")
+        times = times[order]
+        new_peaks = np.empty(len(peaks),dtype=object)
+        new_peaks[:] = [peaks[i] for i in order]
+        starts = np.array([peak.t_0 for peak in new_peaks],dtype=float)
+        ends = np.array([peak.t_f for peak in new_peaks],dtype=float)
+
+        positions = np.searchsorted(self._times,times,side="right")
+        self._times = np.insert(self._times,positions,times)
+        self._starts = np.insert(self._starts,positions,starts)
+        self._ends = np.insert(self._ends,positions,ends)
+        self._runs = np.insert(self._runs,positions,run)
+        self._peaks = np.insert(self._peaks,positions,new_peaks)
+        self._max_width = max(self._max_width,float((ends-starts).max()))
+        self._signatures[run].update(id(peak) for peak in new_peaks)
+
+    def _delete(self,mask):
+        """This method removes the positions flagged by a mask from the
+        index."""
+        keep = ~mask
+        self._times = self._times[keep]
+        self._starts = self._starts[keep]
+        self._ends = self._ends[keep]
+        self._runs = self._runs[keep]
+        self._peaks = self._peaks[keep]
+        self._max_width = float((self._ends-self._starts).max())\
+            if len(self._times) else 0.0
+
+    def remove_peaks(self,gram,peaks):
+        """This method removes peaks of an indexed chromatogram from the
+        index."""
+        run = self.run(gram)
+        ids = {id(peak) for peak in peaks}
+        mask = (self._runs == run)\
+            & np.array([id(peak) in ids for peak in self._peaks],dtype=bool)
+        self._delete(mask)
+        self._signatures[run] -= ids
+
+    def remove(self,gram):
+        """This method removes a chromatogram and its peaks from the index.
+        The runs after it are renumbered."""
+        run = self.run(gram)
+        self._delete(self._runs == run)
+        self._runs[self._runs > run] -= 1
+        del self.chromatograms[run]
+        del self._signatures[run]
+
+    def sync(self,chromatograms=None):
+        """This method updates the index after peaks have been added to or
+        removed from its chromatograms. Only the changed peaks are merged in
+        or deleted. Peaks that were rebuilt (e.g. after the time axis was
+        shifted) are new peaks.
+
+        Arguments:
+            chromatograms -- the chromatograms the index should hold (e.g. the
+                chromatograms of the present SaveState); indexed chromatograms
+                not in the list are removed and new ones are added. By
+                default, the indexed chromatograms are kept."""
+        if chromatograms is not None:
+            current = {id(gram) for gram in chromatograms}
+            for gram in [gram for gram in self.chromatograms
+                if id(gram) not in current]:
+                self.remove(gram)
+            indexed = {id(gram) for gram in self.chromatograms}
+            for gram in chromatograms:
+                if id(gram) not in indexed:
+                    self.add(gram)
+                    indexed.add(id(gram))
+        for run, gram in enumerate(self.chromatograms):
+            peaks = gram.peaks
+            ids = {id(peak) for peak in peaks}
+            signature = self._signatures[run]
+            if ids == signature:
+                continue
+            removed = signature-ids
+            if removed:
+                self.remove_peaks(gram,[peak for peak
+                    in self._peaks[self._runs == run] if id(peak) in removed])
+            self.add_peaks(gram,[peak for peak in peaks
+                if id(peak) not in signature])
+
+    #================================================================
+    # QUERIES
+    #================================================================
+    def run(self,gram):
+        """This method returns the run number of an indexed chromatogram."""
+        for run, indexed in enumerate(self.chromatograms):
+            if indexed is gram:
+                return run
+        raise KeyError(f"{gram.name} is not indexed.")
+
+    def in_range(self,t_min,t_max):
+        """This method returns the peaks with retention times between two
+        times (inclusive)."""
+        low = np.searchsorted(self._times,t_min,side="left")
+        high = np.searchsorted(self._times,t_max,side="right")
+        return self._results(np.arange(low,high))
+
+    def overlapping(self,t_min,t_max=None):
+        """This method returns the peaks whose bounds [t_0, t_f] overlap an
+        interval, or contain a time if only one is given."""
+        if t_max is None:
+            t_max = t_min
+        low = np.searchsorted(self._times,t_min-self._max_width,side="left")
+        high = np.searchsorted(self._times,t_max+self._max_width,side="right")
+        positions = np.arange(low,high)
+        positions = positions[(self._starts[positions] <= t_max)
+            & (self._ends[positions] >= t_min)]
+        return self._results(positions)
+
+    def nearest(self,time):
+        """This method returns the peak with the retention time nearest to a
+        time, or None if the index is empty."""
+        if len(self) == 0:
+            return None
+        position = np.searchsorted(self._times,time)
+        if position == len(self) or (position > 0
+            and time-self._times[position-1] <= self._times[position]-time):
+            position -= 1
+        return self._results([position])[0]
+
+    def find(self,time,tolerance=TOLERANCE):
+        """This method returns a list of the peak of each run nearest to a
+        time, with None for runs without a peak within the tolerance."""
+        low = np.searchsorted(self._times,time-tolerance,side="left")
+        high = np.searchsorted(self._times,time+tolerance,side="right")
+        positions = np.arange(low,high)
+        positions = positions[np.argsort(np.abs(self._times[positions]-time),
+            kind="stable")]
+        runs, first = np.unique(self._runs[positions],return_index=True)
+        found = [None]*len(self.chromatograms)
+        for run, position in zip(runs,positions[first]):
+            found[run] = self._peaks[position]
+        return found
+
+    #================================================================
+    # COMPOUNDS
+    #================================================================
+    def group(self,tolerance=TOLERANCE):
+        """This method groups the peaks into compounds. Peaks in order of
+        retention time belong to the same compound while each is within the
+        tolerance of the previous one; a compound with several peaks of one run
+        is split at its largest gap until every run has at most one peak in it.
+
+        Returns a list of arrays of positions in the index, one per compound,
+        in order of retention time."""
+        if len(self) == 0:
+            return []
+        breaks = np.flatnonzero(np.diff(self._times) > tolerance)+1
+        pending = np.split(np.arange(len(self)),breaks)[::-1]
+        groups = []
+        while pending:
+            positions = pending.pop()
+            runs = self._runs[positions]
+            if len(np.unique(runs)) == len(runs):
+                groups.append(positions)
+                continue
+            split = int(np.diff(self._times[positions]).argmax())+1
+            pending += [positions[split:],positions[:split]]
+            #Pushed in reverse so that the earlier half is grouped first.
+        return groups
+
+    def compounds(self,tolerance=TOLERANCE):
+        """This method returns a list of the compounds, each a list of the
+        peak of every run in the compound (None for runs without one)."""
+        rows = []
+        for positions in self.group(tolerance):
+            row = [None]*len(self.chromatograms)
+            for run, peak in zip(self._runs[positions],self._peaks[positions]):
+                row[run] = peak
+            rows.append(row)
+        return rows
+
+    def compound_table(self,tolerance=TOLERANCE,column="Area"):
+        """This method returns a Pandas DataFrame with one row per compound
+        and one column per run, holding a peak table column (e.g. "Area" or
+        "Height") of each compound's peak in each run. Rows are labelled with
+        the compounds' mean retention times."""
+        import pandas as pd
+        #Imported here, as in Chromatogram.peak_table.
+        attribute = PEAK_TABLE_COLUMNS[column]
+        groups = self.group(tolerance)
+        values = np.full((len(groups),len(self.chromatograms)),np.nan)
+        for row, positions in enumerate(groups):
+            values[row,self._runs[positions]] = [getattr(peak,attribute)
+                for peak in self._peaks[positions]]
+        table = pd.DataFrame(values,
+            columns=[gram.name for gram in self.chromatograms],
+            index=pd.Index([self._times[positions].mean()
+                for positions in groups],name="Retention Time"))
+        return table
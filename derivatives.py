@@ -0,0 +1,80 @@
+"""This module computes the first derivative of a signal series, which is used
+to find the bounds of peaks.
+
+Example:
+    derivatives.differentiate(signal, "savgol", 7)
+    gram.set_derivative_mode("savgol", 7)
+
+Modes (the derivative is in counts per data point):
+    "right" -- slope to the next point, y[i+1]-y[i]
+    "left" -- slope from the previous point, y[i]-y[i-1]
+    "central" -- average of the left and right slopes, (y[i+1]-y[i-1])/2
+    "savgol" -- Savitzky-Golay derivative: the slope at each point of a
+        quadratic fitted by least squares to a window of points around it
+    "moving_average" -- the right slopes averaged over a window of points
+        around each point
+The last two smooth out detector noise, so that noise on the baseline is not
+mistaken for the edge of a peak. Windows are odd numbers of points. Each mode
+is a convolution with a short kernel; points too close to either end of the
+series for the kernel to fit have a derivative of 0."""
+import functools
+import numpy as np
+
+MODES = ("right","left","central","savgol","moving_average")
+WINDOW = 5
+#Default window in points of the smoothing modes.
+
+#================================================================
+# KERNELS
+#================================================================
+@functools.lru_cache(maxsize=None)
+def kernel(mode="right",window=WINDOW):
+    """This function returns the derivative kernel of a mode, as the offset of
+    its first coefficient from the point it is evaluated at and an array of
+    its coefficients: derivative[i] = sum(coefficients[k]*y[i+offset+k])."""
+    if mode not in MODES:
+        raise ValueError(f"Derivative mode must be one of {MODES}!") from None
+    half = max(int(window),1)//2
+    if mode == "right":
+        return 0, np.array([-1.0,1.0])
+    if mode == "left":
+        return -1, np.array([-1.0,1.0])
+    if mode == "central":
+        return -1, np.array([-0.5,0.0,0.5])
+    if mode == "savgol":
+        half = max(half,1)
+        offsets = np.arange(-half,half+1,dtype=np.float64)
+        return -half, offsets/(offsets**2).sum()
+        #The slope of a least-squares quadratic (or cubic) at the middle of a
+        #window of 2*half+1 points is sum(k*y[i+k])/sum(k**2).
+    coefficients = np.zeros(2*half+2)
+    coefficients[0] = -1/(2*half+1)
+    coefficients[-1] = 1/(2*half+1)
+    return -half, coefficients
+    #The average of the right slopes at i-half...i+half telescopes to
+    #(y[i+half+1]-y[i-half])/(2*half+1).
+
+def reach(mode="right",window=WINDOW):
+    """This function returns how many points before and after a point its
+    derivative depends on."""
+    offset, coefficients = kernel(mode,window)
+    return -offset, offset+len(coefficients)-1
+
+
+#================================================================
+# DIFFERENTIATION
+#================================================================
+def differentiate(signal,mode="right",window=WINDOW,start=0):
+    """This function returns the first derivative of a signal series with a
+    mode (see the module docstring), from index start onwards."""
+    signal = np.asarray(signal,dtype=np.float64)
+    offset, coefficients = kernel(mode,window)
+    before, after = reach(mode,window)
+    n = len(signal)
+    derivative = np.zeros(max(n-start,0))
+    first = max(start,before)
+    last = n-after
+    if last > first:
+        derivative[first-start:last-start] = np.correlate(
+            signal[first-before:last+after],coefficients,mode="valid")
+    return derivative
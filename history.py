@@ -0,0 +1,165 @@
+"""This module defines the SaveState and History classes used for undo/redo"""
+
+MAX_STATES = 100
+MAX_BYTES = 512*2**20
+#Default bounds on the number of SaveStates kept in a History, and on the total
+#memory taken up by their data arrays.
+
+#================================================================
+# SAVE STATE
+#================================================================
+class SaveState:
+    """The SaveState class holds the chromatograms in one state of the session
+    so that changes can be undone/redone.
+
+    SaveStates share chromatograms copy-on-write: a snapshot references the
+    same Chromatogram objects as the state it was taken from, and a
+    chromatogram is only copied (sharing its data arrays) the first time it is
+    edited through SaveState.edit(). Chromatograms that may be changed must
+    therefore be retrieved with edit(), not active() or indexing.
+    """
+    def __init__(self):
+        self.chromatograms=[]
+        self.active_index=0
+        self._owned=set()
+        #ids of the chromatograms that no other SaveState references.
+
+    def active(self):
+        """This method returns the active chromatogram"""
+        return self.chromatograms[self.active_index]
+
+    def __getitem__(self,i):
+        """This method allows direct indexing into a SaveState object to access
+        chromatograms in the list."""
+        return self.chromatograms[i]
+
+    def add_chromatogram(self,gram):
+        """This method adds a new chromatogram to the SaveState."""
+        self.chromatograms.append(gram)
+        self._owned.add(id(gram))
+
+    def edit(self,i):
+        """This method returns the i-th chromatogram so that it can be
+        changed, first replacing it with a private copy if it is shared with
+        other SaveStates."""
+        gram = self.chromatograms[i]
+        if id(gram) not in self._owned:
+            gram = gram.copy()
+            self.chromatograms[i] = gram
+            self._owned.add(id(gram))
+        return gram
+
+    def edit_active(self):
+        """This method returns the active chromatogram so that it can be
+        changed (see SaveState.edit())."""
+        return self.edit(self.active_index)
+
+    def snapshot(self):
+        """This method returns a new SaveState sharing all of this state's
+        chromatograms. Afterwards, neither state owns them."""
+        state = SaveState()
+        state.chromatograms = list(self.chromatograms)
+        state.active_index = self.active_index
+        self._owned = set()
+        return state
+
+    def data_arrays(self):
+        """This method returns a dict of the data arrays of all chromatograms
+        in the SaveState keyed by their ids."""
+        arrays = {}
+        for gram in self.chromatograms:
+            arrays.update(gram.data_arrays())
+        return arrays
+
+
+#================================================================
+# HISTORY
+#================================================================
+class History:
+    """The History class is for the instantiation of a master object which
+    contains the cache of SaveStates, as well as methods pertaining to changing
+    the current SaveState.
+
+    Parameters:
+        max_states - the maximum number of SaveStates to keep
+        max_bytes - the maximum memory taken up by the data arrays of all
+            SaveStates (arrays shared between states are counted once)
+
+    When either bound is exceeded, the oldest SaveStates are discarded. The
+    present SaveState is never discarded. Since editing the present SaveState
+    (or reading data derived lazily from it) takes up more memory, evict()
+    should be called again once a change has been made."""
+
+    def __init__(self,max_states=MAX_STATES,max_bytes=MAX_BYTES):
+        self.states=[SaveState()]
+        self.present_index=0
+        self.max_states=max_states
+        self.max_bytes=max_bytes
+
+    def save(self):
+        """This method adds a new SaveState to the cache, sharing the
+        chromatograms of the present one (see History.push())."""
+        self.push(self.states[self.present_index].snapshot())
+
+    def push(self,state):
+        """This method makes a given SaveState the present one (e.g. a loaded
+        session), discarding any changes that have been undone."""
+        while len(self.states)>self.present_index+1:
+            self.states.pop()
+        self.states.append(state)
+        self.present_index+=1
+        self.evict()
+
+    def nbytes(self):
+        """This method returns the memory in bytes taken up by the data arrays
+        of all SaveStates, counting arrays shared between states once."""
+        arrays = {}
+        for state in self.states:
+            arrays.update(state.data_arrays())
+        return sum(array.nbytes for array in arrays.values())
+
+    def evict(self):
+        """This method discards the oldest SaveStates until the History is
+        within its bounds."""
+        state_arrays = [state.data_arrays() for state in self.states]
+        references = {}
+        #Number of SaveStates holding each array, keyed by its id.
+        total = 0
+        for arrays in state_arrays:
+            for key, array in arrays.items():
+                if key not in references:
+                    references[key] = 0
+                    total += array.nbytes
+                references[key] += 1
+        while self.present_index > 0 and (
+            (self.max_states is not None and len(self.states) > self.max_states)
+            or (self.max_bytes is not None and total > self.max_bytes)):
+            for key, array in state_arrays.pop(0).items():
+                references[key] -= 1
+                if references[key] == 0:
+                    total -= array.nbytes
+                    #Arrays are freed once no SaveState holds them.
+            self.states.pop(0)
+            self.present_index-=1
+
+    def present(self):
+        """This method returns the presently displayed SaveState."""
+        return self.states[self.present_index]
+
+    def undo(self):
+        """This method returns to the previous SaveState in the cache. It
+        returns True if there was something to undo."""
+        if self.present_index>0:
+            self.present_index-=1
+            return True
+        print("Nothing to undo!")
+        return False
+
+    def redo(self):
+        """This method returns to the next SaveState in the cache. It returns
+        True if there was something to redo."""
+        if self.present_index<len(self.states)-1:
+            self.present_index+=1
+            return True
+        print("Nothing to redo!")
+        return False
@@ -0,0 +1,212 @@
+"""This module records where M|Chroma spends its time, for diagnosing slow
+operations.
+
+Example:
+    import instrument
+    instrument.enable()
+    ...
+    print(instrument.summary())
+
+While enabled, the main Chromatogram, History, loading and drawing operations
+are wrapped to record their call counts and wall time (and, while tracemalloc
+is tracing, the memory they allocate). When disabled, the original functions
+are put back, so instrumentation costs nothing unless it is turned on. A
+cProfile/tracemalloc capture of everything that runs can also be started and
+stopped. Setting the environment variable MCHROMA_INSTRUMENT=1 enables
+instrumentation when this module is first imported."""
+import cProfile
+import functools
+import io
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+import cache
+import history
+import loader
+import save
+from chromatogram import Chromatogram, Peak
+
+TARGETS = [
+    (loader,"read_asc","load: parse"),
+    (loader,"load_asc","load"),
+    (cache.ParseCache,"load_asc","load: cached"),
+    (save,"load_session","load: session"),
+    (save,"save_session","save session"),
+    (save,"write_peaks","export peaks"),
+    (Chromatogram,"update","Chromatogram.update"),
+    (Chromatogram,"compute_derivative","Chromatogram.compute_derivative"),
+    (Chromatogram,"_update_peaks","Chromatogram._update_peaks"),
+    (Chromatogram,"reindex_peaks","Chromatogram.reindex_peaks"),
+    (Chromatogram,"update_peak_table","Chromatogram.update_peak_table"),
+    (Chromatogram,"peak_table","Chromatogram.peak_table"),
+    (Chromatogram,"baseline_correct","Chromatogram.baseline_correct"),
+    (Chromatogram,"detect_bounds_batch","Chromatogram.detect_bounds_batch"),
+    (Chromatogram,"threshold_autopick","Chromatogram.threshold_autopick"),
+    (Chromatogram,"copy","Chromatogram.copy"),
+    (Peak,"__init__","Peak"),
+    (history.History,"save","History.save"),
+    (history.History,"undo","History.undo"),
+    (history.History,"redo","History.redo"),
+    (history.History,"evict","History.evict"),
+    (history.SaveState,"edit","SaveState.edit")
+    ]
+#Functions that are instrumented: (owner, attribute, label). Properties are
+#instrumented through their getter. Other modules (e.g. the GUI) add their own
+#with register().
+
+stats = {}
+#Recorded statistics keyed by label: calls, seconds and bytes (net memory
+#allocated while tracemalloc was tracing).
+_originals = {}
+#Original functions keyed by (owner, attribute) while instrumentation is on.
+_lock = threading.Lock()
+_profiler = None
+_started_tracing = False
+#Whether start_profile() started tracemalloc, so stop_profile() stops it.
+
+#================================================================
+# TIMING
+#================================================================
+def _record(label,seconds,allocated):
+    with _lock:
+        entry = stats.setdefault(label,{"calls":0,"seconds":0.0,"bytes":0})
+        entry["calls"] += 1
+        entry["seconds"] += seconds
+        entry["bytes"] += allocated
+
+def _timed(function,label):
+    """This function returns a wrapper of a function that records its
+    statistics under a label."""
+    @functools.wraps(function)
+    def wrapper(*args,**kwargs):
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            return function(*args,**kwargs)
+        finally:
+            seconds = time.perf_counter()-start
+            allocated = 0
+            if tracing:
+                allocated = tracemalloc.get_traced_memory()[0]-before
+            _record(label,seconds,allocated)
+    return wrapper
+
+def _wrap(owner,attribute,label):
+    """This function replaces a function (or property) with a timed wrapper,
+    remembering the original."""
+    original = vars(owner)[attribute] if isinstance(owner,type)\
+        else getattr(owner,attribute)
+    _originals[(owner,attribute)] = original
+    if isinstance(original,property):
+        setattr(owner,attribute,property(_timed(original.fget,label),
+            original.fset,original.fdel,original.__doc__))
+    else:
+        setattr(owner,attribute,_timed(original,label))
+
+def enabled():
+    """This function returns whether instrumentation is on."""
+    return bool(_originals)
+
+def enable():
+    """This function turns instrumentation on."""
+    if enabled():
+        return
+    for owner, attribute, label in TARGETS:
+        _wrap(owner,attribute,label)
+
+def disable():
+    """This function turns instrumentation off, putting the original
+    functions back. The recorded statistics are kept."""
+    while _originals:
+        (owner, attribute), original = _originals.popitem()
+        setattr(owner,attribute,original)
+
+def register(owner,attribute,label):
+    """This function adds a function to the instrumented targets, e.g.
+    register(AppHistory, "update", "redraw")."""
+    TARGETS.append((owner,attribute,label))
+    if enabled():
+        _wrap(owner,attribute,label)
+
+def reset():
+    """This function clears the recorded statistics."""
+    with _lock:
+        stats.clear()
+
+
+#================================================================
+# PROFILING
+#================================================================
+def profiling():
+    """This function returns whether a profile capture is running."""
+    return _profiler is not None
+
+def start_profile():
+    """This function starts capturing a cProfile profile of the main thread
+    and tracing memory allocations with tracemalloc. Instrumented functions
+    also record their allocations while the capture runs."""
+    global _profiler, _started_tracing
+    if profiling():
+        return
+    _started_tracing = not tracemalloc.is_tracing()
+    if _started_tracing:
+        tracemalloc.start()
+    _profiler = cProfile.Profile()
+    _profiler.enable()
+
+def stop_profile(limit=20):
+    """This function stops the profile capture and returns a report of the
+    functions with the most cumulative time and of the lines that allocated
+    the most memory still in use. Memory tracing started elsewhere (e.g.
+    by the user) is left running."""
+    global _profiler, _started_tracing
+    if not profiling():
+        return "No profile is being captured."
+    _profiler.disable()
+    text = io.StringIO()
+    pstats.Stats(_profiler,stream=text).sort_stats("cumulative")\
+        .print_stats(limit)
+    _profiler = None
+    text.write("Top memory allocations (still in use):\n")
+    for statistic in tracemalloc.take_snapshot()\
+        .statistics("lineno")[:limit]:
+        text.write(f"    {statistic}\n")
+    if _started_tracing:
+        tracemalloc.stop()
+        _started_tracing = False
+    return text.getvalue()
+
+
+#================================================================
+# REPORTING
+#================================================================
+def summary():
+    """This function returns a table of the recorded statistics, slowest
+    first."""
+    with _lock:
+        rows = sorted(stats.items(),key=lambda item: -item[1]["seconds"])
+    lines = [f"{'Operation':<36}{'Calls':>8}{'Total (ms)':>13}"
+        f"{'Mean (ms)':>12}{'Alloc (MiB)':>13}"]
+    for label, entry in rows:
+        lines.append(f"{label:<36}{entry['calls']:>8}"
+            f"{entry['seconds']*1000:>13.2f}"
+            f"{entry['seconds']*1000/entry['calls']:>12.3f}"
+            f"{entry['bytes']/2**20:>13.2f}")
+    if not rows:
+        lines.append("(nothing recorded)")
+    return "\n".join(lines)
+
+def dump(filepath):
+    """This function writes the summary (and the report of a running profile
+    capture, which is stopped) to a text file."""
+    with open(filepath,"w") as writer:
+        writer.write(summary()+"\n")
+        if profiling():
+            writer.write("\n"+stop_profile())
+
+if os.environ.get("MCHROMA_INSTRUMENT","") not in ("","0"):
+    enable()
@@ -0,0 +1,209 @@
+"""This module picks peaks in chromatograms while they are being acquired.
+
+Example:
+    python live.py run.dat.asc
+    python live.py run.dat.asc --threshold 5000
+
+New detector readings, e.g. from a data file that is still being written
+(tail_asc()) or from a pipe or socket (read_samples()), are appended to a
+Chromatogram by a LiveIngest, which reports each peak as soon as it ends. The
+work done per append depends only on the number of new readings, so several
+instruments can be monitored at once."""
+import argparse
+import os
+import sys
+import time
+import numpy as np
+import derivatives
+import loader
+import noise
+from chromatogram import Chromatogram
+from stream import FeatureDetector, MAX_WIDTH
+
+POLL_INTERVAL = 1.0
+#Seconds between checks of a data file for new readings.
+
+#================================================================
+# SOURCES OF DETECTOR READINGS
+#================================================================
+def _parse_lines(text):
+    """This function splits text into the readings on its complete lines and
+    the incomplete line at its end."""
+    end = text.rfind("\n")+1
+    return loader.parse_data(text[:end]), text[end:]
+
+def tail_asc(path,poll_interval=POLL_INTERVAL,timeout=None):
+    """This generator yields int32 arrays of the readings appended to a
+    .dat.asc file as it is written, starting with the ones already in it.
+
+    Arguments:
+        path -- the data file, which must already contain its header
+        poll_interval -- seconds to wait between checks for new readings
+        timeout -- stop after this many seconds without new readings (default:
+            never stop)"""
+    with open(path,"r") as reader:
+        partial = loader.read_header(reader)[1]
+        last_read = time.monotonic()
+        while True:
+            text = partial+reader.read()
+            data, partial = _parse_lines(text)
+            if len(data) > 0:
+                last_read = time.monotonic()
+                yield data
+            elif timeout is not None and time.monotonic()-last_read > timeout:
+                return
+            else:
+                time.sleep(poll_interval)
+
+def read_samples(stream,size=2**16):
+    """This generator yields int32 arrays of the readings in a binary stream
+    of newline-separated integers (e.g. a pipe or socket.makefile("rb")) as
+    they arrive, until the stream is closed."""
+    partial = ""
+    while True:
+        if hasattr(stream,"read1"):
+            block = stream.read1(size)
+        else:
+            block = os.read(stream.fileno(),size)
+        #Returns whatever has arrived instead of waiting for size bytes.
+        if not block:
+            break
+        data, partial = _parse_lines(partial+block.decode())
+        if len(data) > 0:
+            yield data
+    if partial.strip():
+        yield loader.parse_data(partial)
+
+
+#================================================================
+# LIVE INGEST
+#================================================================
+class LiveIngest:
+    """The LiveIngest class appends readings to a chromatogram as they are
+    acquired and picks the peaks above a threshold as they end, with the same
+    logic as Chromatogram.threshold_autopick().
+
+    Parameters:
+        gram - the chromatogram to append to (see Chromatogram.extend());
+            peak bounds are found with its derivative mode
+        threshold - the signal threshold for picking peaks, or 'auto' (the
+            default)
+        tolerance - the derivative magnitude below which the signal is
+            considered flat, or 'auto' (default: that of the chromatogram)
+
+    The noise of the rest of the run is not known while it is acquired, so
+    'auto' thresholds and tolerances use the noise of the readings so far (see
+    stream.FeatureDetector), and the peaks can differ slightly from those
+    threshold_autopick() finds in the whole run. With numeric thresholds and
+    tolerances they are the same.
+        area_mode - the integration mode of the picked peaks
+        max_width - the maximum width of a peak in data points
+
+    Peaks already in the chromatogram and readings it already holds are kept;
+    the readings are scanned for peaks along with the first new ones."""
+
+    def __init__(self,gram,threshold="auto",tolerance=None,area_mode="bb",
+        max_width=MAX_WIDTH):
+        if tolerance is None and gram._tolerance_setting() != "auto":
+            tolerance = gram._bound_tolerance()
+        elif tolerance is None:
+            tolerance = "auto"
+            #The detector estimates the noise of the derivative as it is fed,
+            #like the chromatogram does.
+        self.gram = gram
+        self.area_mode = area_mode
+        self.detector = FeatureDetector(threshold,tolerance,max_width,
+            gram.derivative_mode,gram.derivative_window)
+        self.fed = 0
+        #Number of points passed to the detector. The last points of the
+        #chromatogram are held back until their derivative is known.
+
+    def _pick(self,features):
+        """This method adds a peak to the chromatogram for each set of bounds
+        found by the detector, returning the new Peaks."""
+        return [self.gram.add_peak([i_0,i_f],area_mode=self.area_mode)
+            for i_0, i_f, signal in features]
+
+    def append(self,data):
+        """This method appends new readings to the chromatogram, returning a
+        list of the Peaks that ended within them."""
+        self.gram.extend(data)
+        final = len(self.gram.signal_series)-derivatives.reach(
+            self.gram.derivative_mode,self.gram.derivative_window)[1]
+        if final <= self.fed:
+            return []
+        features = self.detector.push(self.gram.signal_series[self.fed:final],
+            self.gram.derivative_series[self.fed:final])
+        self.fed = final
+        return self._pick(features)
+
+    def close(self):
+        """This method ends the acquisition, returning a list of the Peaks
+        that were still open."""
+        self.detector.push(self.gram.signal_series[self.fed:],
+            self.gram.derivative_series[self.fed:])
+        #The derivative at the last points of the run is 0.
+        self.fed = len(self.gram.signal_series)
+        peaks = self._pick(self.detector.close())
+        signal_noise = self.gram.signal_noise
+        for peak in self.gram.peaks:
+            peak.snr = peak.signal_to_noise(signal_noise)
+        self.gram.update_peak_table()
+        #Signal-to-noise ratios are given while the run is acquired relative
+        #to the noise so far, and finally relative to that of the whole run.
+        return peaks
+
+    def follow(self,source):
+        """This generator appends each array of readings from a source (e.g.
+        tail_asc()) and yields the Peaks as they end, until the source runs
+        out."""
+        for data in source:
+            yield from self.append(data)
+        yield from self.close()
+
+
+#================================================================
+# COMMAND LINE INTERFACE
+#================================================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Report peaks in a run as it is being acquired.")
+    parser.add_argument("input",
+        help="data file being written, or - to read readings from stdin")
+    parser.add_argument("--threshold",type=noise.parse_level,default="auto",
+        help="signal threshold for picking peaks (default: auto, 10 times the "
+        "estimated noise above the baseline)")
+    parser.add_argument("--tolerance",type=noise.parse_level,
+        help="derivative tolerance for peak bounds, or auto (default: "
+        "NOISE_TOLERANCE)")
+    parser.add_argument("--area-mode",choices=("bb","vv","bv","vb"),
+        default="bb")
+    parser.add_argument("--derivative",choices=derivatives.MODES,
+        default="right",help="derivative mode for peak bounds")
+    parser.add_argument("--window",type=int,default=derivatives.WINDOW,
+        help="window in points of the smoothing derivative modes")
+    parser.add_argument("--sampling-rate",type=float,
+        help="sampling rate in Hz (default: from the file header)")
+    parser.add_argument("--timeout",type=float,
+        help="stop after this many seconds without new readings")
+    args = parser.parse_args(argv)
+
+    rate = args.sampling_rate
+    if args.input == "-":
+        source = read_samples(sys.stdin.buffer)
+    else:
+        source = tail_asc(args.input,timeout=args.timeout)
+        if rate is None:
+            rate = loader.sampling_rate(loader.read_asc_header(args.input))
+    gram = Chromatogram(data=np.zeros(0,dtype=np.int32),sampling_rate=rate,
+        name=args.input,derivative_mode=args.derivative,
+        derivative_window=args.window)
+    ingest = LiveIngest(gram,args.threshold,args.tolerance,args.area_mode)
+    print("Retention Time,Area,Height,Width,Plate Count")
+    for peak in ingest.follow(source):
+        print(f"{peak.retention_time},{peak.area},{peak.height},"
+            f"{peak.width_hh},{peak.plates}",flush=True)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""This module is used for loading chromatogram data files"""
+import itertools
+import pathlib
+import warnings
+import numpy as np
+from chromatogram import Chromatogram
+
+CHUNK_SIZE = 2**16
+#Number of data points read at a time by iter_asc().
+
+#================================================================
+# SHIMADZU CLASS-VP ASCII FILES (.dat.asc)
+#================================================================
+def _is_data_line(line):
+    """This function checks if a line of a data file is a single (possibly
+    negative) integer data point."""
+    return line.strip().replace("-","").isnumeric()
+
+def read_asc(path):
+    """This function reads a .dat.asc file exported from Shimadzu CLASS-VP
+    and returns its data points and header.
+
+    The header block ('Key: value' lines) is read once, and the numeric body
+    is converted to an array in a single bulk pass.
+
+    Returns:
+        data -- an int32 array of signal intensities in detector counts
+        header -- a dict of the header fields, e.g. header['Sample ID']"""
+    with open(path,"r") as reader:
+        text = reader.read()
+
+    header = {}
+    position = 0
+    while position < len(text):
+        end = text.find("\n",position)
+        if end == -1:
+            end = len(text)
+        line = text[position:end]
+        if _is_data_line(line):
+            break
+            #The header ends at the first line that is just a number.
+        if ":" in line:
+            key, value = line.split(":",1)
+            header[key.strip()] = value.strip()
+        position = end+1
+
+    return parse_data(text[position:]), header
+
+def parse_data(body):
+    """This function converts a block of data lines to an int32 array in a
+    single bulk pass."""
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("error",DeprecationWarning)
+            #numpy warns (rather than raising) when it cannot parse the string
+            #to its end, so the warning is escalated to fall back below.
+            data = np.fromstring(body,dtype=np.int64,sep="\n")
+    except (DeprecationWarning,ValueError):
+        data = np.array([int(line) for line in body.splitlines()
+            if _is_data_line(line)],dtype=np.int64)
+        #Fallback for bodies that contain stray non-numeric lines.
+    return data.astype(np.int32)
+
+def read_header(reader):
+    """This function reads the header block of an open .dat.asc file. It
+    returns the header and the first data line, which has been read past."""
+    header = {}
+    for line in reader:
+        if _is_data_line(line):
+            return header, line
+        if ":" in line:
+            key, value = line.split(":",1)
+            header[key.strip()] = value.strip()
+    return header, ""
+
+def read_asc_header(path):
+    """This function reads just the header of a .dat.asc file (see
+    read_asc())."""
+    with open(path,"r") as reader:
+        return read_header(reader)[0]
+
+def iter_asc(path,chunk_size=CHUNK_SIZE):
+    """This generator reads the data points of a .dat.asc file in chunks,
+    yielding an int32 array of (at most) chunk_size points at a time, so that
+    files of any length can be read in bounded memory."""
+    with open(path,"r") as reader:
+        first_line = read_header(reader)[1]
+        lines = [first_line]
+        while True:
+            lines += itertools.islice(reader,chunk_size-len(lines))
+            if not lines or lines == [""]:
+                return
+            yield parse_data("".join(lines))
+            lines = []
+
+def sampling_rate(header):
+    """This function extracts the sampling rate in Hz from a .dat.asc header,
+    returning None if it is missing or invalid."""
+    try:
+        return float(header["Sampling Rate"].split()[0])
+    except (KeyError,IndexError,ValueError):
+        return None
+
+def load_asc(path,color=None):
+    """This function loads a .dat.asc file as a Chromatogram object.
+
+    The chromatogram is named after the sample ID in the header, falling back
+    on the file name without its extension."""
+    data, header = read_asc(path)
+    return build_chromatogram(path,data,header,color)
+
+def build_chromatogram(path,data,header,color=None):
+    """This function creates a Chromatogram object from the data points and
+    header read from a .dat.asc file (see load_asc())."""
+    name = header.get("Sample ID","")
+    if name == "":
+        name = pathlib.Path(path).name.replace(".dat.asc","")
+        #Fallback chromatogram name is file name without extension.
+
+    return Chromatogram(
+        data=data,
+        name=name,
+        color=color,
+        sampling_rate=sampling_rate(header)
+        )
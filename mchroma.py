@@ -4,6 +4,12 @@
 from chromatogram import Chromatogram, Peak
 import dialogues as tkd
 import save as save
+import align
+import cache
+import render
+import instrument
+import settings
+from history import History
 import pandas as pd
 import numpy as np
 import tkinter as tk
@@ -11,12 +17,11 @@ import tkinter.filedialog
 import tkinter.colorchooser
 from matplotlib.figure import Figure
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
-import copy
 import sys
 import pathlib
+import concurrent.futures
 path = pathlib.Path(__file__).parent.absolute()
 
-from icecream import ic
 
 class Empty:
     def __init__(self):
@@ -56,12 +61,9 @@ graph.table=graph.plot.table(
     colLabels=blank_gram.peak_table.columns,loc="bottom")
 #this should make the peak summary table below the subplot
 
-def plot(gram):
-    """This method takes a Chromatogram object as its argument and it draws
-    the chromatogram the graph."""
-    if not gram.hidden:
-        graph.plot.plot(gram.time_series, gram.signal_series, color=gram.color)
-        graph.canvas.draw()
+graph.renderer = render.Renderer(graph.plot)
+#The renderer keeps one line per chromatogram, decimated to the width of the
+#graph (see render.py).
 
 #================================================================
 #INITIALIZE COLOR PALETTE
@@ -77,13 +79,7 @@ graph.colors = []
         #carriage return, but idk.
         if len(color) == 3:
             graph.colors.append(color[1])"""
-with open("settings.cfg","r") as reader:
-    line = reader.readline()
-    while line != "":
-        if "DEFAULT_COLORS" in line:
-            graph.colors = line.replace("DEFAULT_COLORS ","").split(" ")
-            break
-        line = reader.readline()
+graph.colors = settings.get("DEFAULT_COLORS")
 
 graph.color_index = 0
 
@@ -91,77 +87,32 @@ graph.color_index = 0
 #================================================================
 # SET UP HISTORY OBJECT FOR UNDO/REDO FUNCTIONALITY
 #================================================================
-class SaveState:
-    """The SaveState class is used to create a deep copy of the chromatograms
-    in their current state so that changes can be undone/redone
-    """
-    def __init__(self):
-        self.chromatograms=[]
-        self.active_index=0
-
-    def active(self):
-        """This method returns the active chromatogram"""
-        return self.chromatograms[self.active_index]
-
-    def __getitem__(self,i):
-        """This method allows direct indexing into a SaveState object to access
-        chromatograms in the list."""
-        return self.chromatograms[i]
-
-class History:
-    """The History class is for the instantiation of a master object which
-    contains the cache of SaveStates, as well as methods pertaining to changing
-    the current SaveState."""
-
-    def __init__(self):
-        self.states=[SaveState()]
-        self.present_index=0
-
-    def save(self):
-        """This method adds a new SaveState to the cache. The while statement
-        is used to overwrite changes that have been undone prior to saving the
-        new state."""
-        while len(self.states)>self.present_index+1:
-            self.states.pop()
-        self.states.append(copy.deepcopy(self.states[self.present_index]))
-        self.present_index+=1
-
-    def present(self):
-        """This method returns the presently displayed SaveState."""
-        return self.states[self.present_index]
+class AppHistory(History):
+    """The AppHistory class extends History (see history.py) to redraw the
+    GUI when changes are undone/redone."""
 
     def undo(self):
-        """"This method returns to the previous SaveState in the cache."""
-        if self.present_index>0:
-            self.present_index-=1
-            plot(self.present().active())
+        """This method returns to the previous SaveState in the cache."""
+        if super().undo():
             self.update()
-        else:
-            print("Nothing to undo!")
 
     def redo(self):
         """This method returns to the next SaveState in the cache."""
-        if self.present_index<len(self.states)-1:
-            self.present_index+=1
-            plot(self.present().active())
+        if super().redo():
             self.update()
-        else:
-            print("Nothing to redo!")
 
     def update(self):
         """"This method is invoked to apply a new SaveState"""
-        for gram in history.present().chromatograms:
-            gram.active = False
-        history.present().active().active = True
+        for i,gram in enumerate(history.present().chromatograms):
+            gram.active = i == history.present().active_index
         #Ensure that only one chromatogram is active.
 
-        graph.plot.cla() #Clears the plot.
-        graph.canvas.draw() #Redraws plot as blank.
-        for gram in self.present().chromatograms:
-            plot(gram) #redraws each unhidden chromatogram
+        graph.renderer.update(self.present().chromatograms)
+        #Updates the line of each chromatogram.
 
-        ic(history.present().active())
-        if not history.present().active().peak_table.empty:
+        graph.table.remove()
+        if history.present().chromatograms and\
+            not history.present().active().peak_table.empty:
             table_temp = history.present().active().peak_table
             #contraction for the next part
             graph.table=graph.plot.table(
@@ -173,9 +124,20 @@ class History:
                 colLabels=blank_gram.peak_table.columns,loc="bottom")
             #Make the table blank again when a peakless chromatogram is active
         repack_legend()
+        graph.canvas.draw_idle()
+        #Redraw the graph once all changes have been made.
+        self.evict()
+        #Changes and the data derived lazily for the redraw may have taken up
+        #memory since the last save.
 
 
-history = History()
+instrument.register(AppHistory,"update","redraw")
+#Records the time taken to redraw the GUI when instrumentation is on.
+
+history = AppHistory()
+
+parse_cache = cache.ParseCache(path/".cache")
+#Parsed data files are cached so that reopening them skips parsing.
 
 def active_chroma():
     """This function streamlines referencing the active chromatogram."""
@@ -185,57 +147,90 @@ def active_chroma():
 #================================================================
 # IMPORTING CHROMATOGRAMS
 #================================================================
+import_pool = concurrent.futures.ThreadPoolExecutor()
+#Data files are parsed by background threads so that the GUI stays responsive.
+#(A process pool would re-run this script, and open a window, in each worker
+#on platforms that spawn processes.)
+
 def import_chromatogram():
-    try:
-        paths = tk.filedialog.askopenfilename(multiple=True)
-        #Use tk filedialog to select the chromatogram data file(s) as a tuple.
-        for path in paths:
-            temp_data = []
-            temp_name = ""
-            temp_rate = ""
-            if graph.color_index < len(graph.colors):
-                temp_color = graph.colors[graph.color_index]
-            else:
-                temp_color = "#000000"
-                #Once default colors are exhausted, default chromatogram color
-                #will be black.
-
-            with open(path) as reader:
-                line = reader.readline()
-                while line != '':  # The EOF char is an empty string
-                    if line.replace("\n","").replace("-","").isnumeric():
-                        #Treat line as data point if it is just a number.
-                        #Note: remove minus sign because isnumeric doesn't
-                        #recognize negative numbers.
-                        temp_data.append(int(line))
-                    elif "Sample ID" in line:
-                        temp_name=line.replace("Sample ID: ","").replace("\n","")
-                        #Assign chromatogram name as the sample ID the data file.
-                    elif "Sampling Rate" in line:
-                        temp_rate = float(line.replace("Sampling Rate: ","").replace(" Hz\n",""))
-                    line = reader.readline()
-                    #Move on to the next line.
-
-                if temp_name == "":
-                    temp_name = path.split("/")[-1].replace(".dat.asc","")
-                    #Fallback chromatogram name is file name without extension.
+    paths = tk.filedialog.askopenfilename(multiple=True)
+    #Use tk filedialog to select the chromatogram data file(s) as a tuple.
+    if paths in ("",()):
+        print("Please select a file!")
+        return
 
-            history.save()
-            history.present().chromatograms.append(Chromatogram(
-                data=temp_data,
-                name=temp_name,
-                color=temp_color,
-                sampling_rate = temp_rate
-                ))
+    futures = []
+    for path in paths:
+        if graph.color_index < len(graph.colors):
+            temp_color = graph.colors[graph.color_index]
+        else:
+            temp_color = "#000000"
+            #Once default colors are exhausted, default chromatogram color
+            #will be black.
+        futures.append(import_pool.submit(parse_cache.load_asc,path,temp_color))
+        graph.color_index +=1
+        #Change the color of the next loaded chromatogram.
+    finish_import(paths,futures)
+
+def finish_import(paths,futures):
+    """This function waits for the chromatograms being loaded by
+    import_chromatogram() without blocking the GUI, showing the progress in the
+    window title. Once all are loaded, they are added to the current SaveState
+    as a single step of the history."""
+    n_done = sum(future.done() for future in futures)
+    if n_done < len(futures):
+        windows["main"].title(f"M|Chroma (loading {n_done}/{len(futures)})")
+        windows["main"].after(50,lambda: finish_import(paths,futures))
+        return
+    windows["main"].title("M|Chroma")
+
+    history.save()
+    for path, future in zip(paths,futures):
+        try:
+            history.present().add_chromatogram(future.result())
             #Create new chromatogram in current SaveState.
-            graph.color_index +=1
-            #Change the color of the next loaded chromatogram.
-            history.present().active_index=len(history.present().chromatograms)-1
-            #Set the new chromatogram as active for analysis
-            history.update()
-            #update plots
-    except FileNotFoundError:
+        except (OSError,ValueError) as error:
+            print(f"Could not load {path}: {error}")
+    history.present().active_index=len(history.present().chromatograms)-1
+    #Set the last new chromatogram as active for analysis
+    history.update()
+    #update plots
+
+#================================================================
+# SAVING/LOADING SESSIONS
+#================================================================
+session_filetypes = [("M|Chroma Session", "*.mchroma"), ("All Files", "*.*")]
+
+def save_session():
+    """This function saves the present SaveState to a session file."""
+    filepath = tk.filedialog.asksaveasfilename(defaultextension="mchroma",
+        filetypes=session_filetypes)
+    if filepath in ("",()):
+        print("Save session operation aborted!")
+        return
+    save.release_file(history.states,filepath)
+    history.update()
+    #Redraw from the copies, so that nothing is mapped from the file being
+    #replaced (e.g. when saving over the open session).
+    try:
+        save.save_session(history.present(),filepath)
+    except OSError as error:
+        print(f"Could not save session: {error}")
+
+def open_session():
+    """This function loads a session file as a new SaveState."""
+    filepath = tk.filedialog.askopenfilename(filetypes=session_filetypes)
+    if filepath in ("",()):
         print("Please select a file!")
+        return
+    try:
+        history.push(save.load_session(filepath))
+    except ValueError as error:
+        print(error)
+        return
+    graph.color_index = len(history.present().chromatograms)
+    #Continue assigning default colors after the loaded chromatograms.
+    history.update()
 
 #================================================================
 # PEAK PICKING
@@ -254,18 +249,31 @@ def on_click(event):
         if len(picking["points"]) == picking["n"]:
             #When the desired number of points have been picked, we can
             #pass them on to whatever function needs them.
+            history.save()
+            gram = history.present().edit_active()
+            #Changes are made to a copy of the active chromatogram so that
+            #they can be undone.
             if picking["mode"] == "peak_bounds":
                 #Pick a peak from a starting and ending point.
                 picking["points"].sort()
-                active_chroma().add_peak(active_chroma().time2index(picking["points"]))
+                gram.add_peak(gram.time2index(picking["points"]))
             elif picking["mode"] == "peak_crest":
                 #Pick a peak from a high point.
-                active_chroma().one_point_peak(active_chroma().time2index(picking["points"][0]))
+                gram.one_point_peak(gram.time2index(picking["points"][0]))
                 pass
+            elif picking["mode"] in ("remove_peak","area_mode"):
+                #Remove or reintegrate the peak under the point picked.
+                i = gram.peak_at(gram.time2index(picking["points"][0]))
+                if i is None:
+                    print("No peak was picked!")
+                elif picking["mode"] == "remove_peak":
+                    gram.remove_peak(i)
+                else:
+                    gram.recompute_peak(i,area_mode=picking["area_mode"])
             elif picking["mode"] == "baseline":
                 #Correct the baseline from two points picked on the baseline.
                 picking["points"].sort()
-                active_chroma().baseline_correct(active_chroma().time2index(picking["points"]))
+                gram.baseline_correct(gram.time2index(picking["points"]))
             history.update()
             #Update the GUI's graph and table.
             picking["points"] = []
@@ -290,6 +298,20 @@ def peak_from_crest():
     picking["n"] = 1
     picking["mode"] = "peak_crest"
 
+def remove_peak():
+    """This function toggles 1-point picking of a peak to remove."""
+    global picking
+    picking["n"] = 1
+    picking["mode"] = "remove_peak"
+
+def change_area_mode(area_mode):
+    """This function toggles 1-point picking of a peak to reintegrate with a
+    new area mode."""
+    global picking
+    picking["n"] = 1
+    picking["mode"] = "area_mode"
+    picking["area_mode"] = area_mode
+
 def pick_baseline():
     """This function toggles point picking for baseline correction."""
     global picking
@@ -306,9 +328,46 @@ def scale_signal():
     if scale_factor == "\x18":
         print("Scale operation aborted.")
     else:
-        active_chroma().scale_signal(float(scale_factor))
+        history.save()
+        history.present().edit_active().scale_signal(float(scale_factor))
+        history.update()
+
+def auto_baseline(method):
+    """This function corrects the baseline of the active chromatogram with an
+    automatically estimated baseline (see baselines.py)."""
+    history.save()
+    history.present().edit_active().auto_baseline(method)
+    history.update()
+
+def set_derivative_mode(mode):
+    """This function sets the derivative mode used to find the peak bounds of
+    the active chromatogram (see derivatives.py)."""
+    history.save()
+    history.present().edit_active().set_derivative_mode(mode)
+    history.update()
+
+def set_derivative_window():
+    windows["derivative window popup"] = tkd.MultiEntryInput(windows["main"],
+        ["Derivative window (points)"])
+    window = windows["derivative window popup"].results[0]
+    if window == "\x18":
+        print("Derivative window operation aborted.")
+    else:
+        history.save()
+        gram = history.present().edit_active()
+        gram.set_derivative_mode(gram.derivative_mode,int(window))
         history.update()
 
+def align_chromatograms(method):
+    """This function aligns the retention times of all chromatograms with
+    those of the active chromatogram."""
+    history.save()
+    state = history.present()
+    grams = [state.edit(i) for i in range(len(state.chromatograms))
+        if i != state.active_index]
+    align.align(grams,state.active(),method=method)
+    history.update()
+
 
 
 
@@ -323,10 +382,16 @@ menu.bar = tk.Menu(windows["main"])
 
 menu.file = tk.Menu(menu.bar, tearoff=0)
 menu.file.add_command(label="Open", command=import_chromatogram)
+menu.file.add_command(label="Open Session", command=open_session)
+menu.file.add_command(label="Save Session", command=save_session)
 menu.file.add_command(label="Export Peak Table",
     command=lambda : save.export_peaks({
         "chromatograms":history.present().chromatograms
     }))
+menu.file.add_command(label="Export Compound Table",
+    command=lambda : save.export_compounds({
+        "chromatograms":history.present().chromatograms
+    }))
 menu.bar.add_cascade(label="File", menu=menu.file)
 #This creates the "File" dropdown on the menu bar.
 
@@ -340,16 +405,87 @@ menu.bar.add_cascade(label="Edit", menu=menu.edit)
 menu.peak = tk.Menu(menu.bar, tearoff=0)
 menu.peak.add_command(label="Pick from bounds", command=peak_from_bounds)
 menu.peak.add_command(label="Pick from a point", command=peak_from_crest)
+menu.peak.add_command(label="Remove peak", command=remove_peak)
+menu.area_mode = tk.Menu(menu.peak, tearoff=0)
+for area_mode, label in [("bb","Base-base"),("vv","Valley-valley"),
+    ("bv","Base-valley"),("vb","Valley-base")]:
+    menu.area_mode.add_command(label=label,
+        command=lambda area_mode=area_mode: change_area_mode(area_mode))
+menu.peak.add_cascade(label="Change area mode", menu=menu.area_mode)
+menu.derivative = tk.Menu(menu.peak, tearoff=0)
+for mode, label in [("right","Right slope"),("left","Left slope"),
+    ("central","Central (left/right average)"),("savgol","Savitzky-Golay"),
+    ("moving_average","Moving average")]:
+    menu.derivative.add_command(label=label,
+        command=lambda mode=mode: set_derivative_mode(mode))
+menu.derivative.add_separator()
+menu.derivative.add_command(label="Window...", command=set_derivative_window)
+menu.peak.add_cascade(label="Derivative mode", menu=menu.derivative)
 #menu.peak.add_command(label="Threshold autopick", command=threshold_autopick)
 menu.bar.add_cascade(label="Peak", menu=menu.peak)
 #This creates the "Peak" dropdown on the menu bar.
 
 menu.analysis = tk.Menu(menu.bar, tearoff=0)
 menu.analysis.add_command(label="Baseline correct", command=pick_baseline)
+menu.analysis.add_command(label="Auto baseline (ALS)",
+    command=lambda: auto_baseline("als"))
+menu.analysis.add_command(label="Auto baseline (rolling minimum)",
+    command=lambda: auto_baseline("rolling_min"))
+menu.analysis.add_command(label="Auto baseline (polynomial)",
+    command=lambda: auto_baseline("polynomial"))
 menu.analysis.add_command(label="Scale signal", command=scale_signal)
+menu.analysis.add_command(label="Align to active (peaks)",
+    command=lambda: align_chromatograms("peaks"))
+menu.analysis.add_command(label="Align to active (COW)",
+    command=lambda: align_chromatograms("cow"))
 menu.bar.add_cascade(label="Analysis", menu=menu.analysis)
 #This creates the "Analysis" dropdown on the menu bar.
 
+#================================================================
+# DIAGNOSTICS
+#================================================================
+diagnostics = Empty()
+diagnostics.timing = tk.BooleanVar(value=instrument.enabled())
+diagnostics.profiling = tk.BooleanVar(value=False)
+
+def toggle_timing():
+    """This function turns the timing instrumentation on or off."""
+    if diagnostics.timing.get():
+        instrument.enable()
+    else:
+        instrument.disable()
+
+def toggle_profiling():
+    """This function starts a profile capture, or stops it and prints its
+    report."""
+    if diagnostics.profiling.get():
+        instrument.start_profile()
+    else:
+        print(instrument.stop_profile())
+
+def save_diagnostics():
+    """This function saves the timing summary (and the report of a running
+    profile capture, which is stopped) to a text file."""
+    filepath = tk.filedialog.asksaveasfilename(defaultextension="txt",
+        filetypes=[("Text", "*.txt"), ("All Files", "*.*")])
+    if filepath in ("",()):
+        print("Save diagnostics operation aborted!")
+    else:
+        instrument.dump(filepath)
+        diagnostics.profiling.set(False)
+
+menu.diagnostics = tk.Menu(menu.bar, tearoff=0)
+menu.diagnostics.add_checkbutton(label="Record Timings",
+    variable=diagnostics.timing, command=toggle_timing)
+menu.diagnostics.add_checkbutton(label="Profile",
+    variable=diagnostics.profiling, command=toggle_profiling)
+menu.diagnostics.add_command(label="Print Summary",
+    command=lambda: print(instrument.summary()))
+menu.diagnostics.add_command(label="Save Summary", command=save_diagnostics)
+menu.diagnostics.add_command(label="Clear Timings", command=instrument.reset)
+menu.bar.add_cascade(label="Diagnostics", menu=menu.diagnostics)
+#This creates the "Diagnostics" dropdown on the menu bar.
+
 
 windows["main"].iconbitmap('images/icon/mchroma.ico')
 #Set icon on window
@@ -373,7 +509,7 @@ legend.check_vars = []
 legend.radios = []
 
 def toggle_gram(i):
-    chromatogram = history.present().chromatograms[i]
+    chromatogram = history.present().edit(i)
 
     chromatogram.hidden = not bool(legend.check_vars[i].get())
 
@@ -391,7 +527,7 @@ def change_color(i):
     color = tk.colorchooser.askcolor(color=chromatogram.color,
                       title = f"Select color for {chromatogram.name}")[1]
     if color is not None:
-        chromatogram.color = color
+        history.present().edit(i).color = color
     history.update()
 
 def edit_chromatogram(i):
@@ -402,6 +538,8 @@ def edit_chromatogram(i):
     if "\x18" in results:
         print("Edit chromatogram operation aborted.")
     else:
+        history.save()
+        gram = history.present().edit(i)
         gram.name = results["name"]
         gram.hidden = results["hidden"]
         gram.color = results["color"]
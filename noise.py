@@ -0,0 +1,135 @@
+"""This module estimates the detector noise of a chromatogram from its data,
+for setting peak detection thresholds and computing signal-to-noise ratios.
+
+Example:
+    gram.noise                   #noise of the derivative in counts per point
+    gram.signal_noise            #noise of the signal in counts
+    noise.estimate(derivative)
+
+The noise is estimated from the derivative rather than the signal, so that
+baseline drift does not count as noise. The derivative is cut into blocks of
+WINDOW points and the spread of each block is measured by its median
+absolute deviation (MAD), which peaks and spikes barely affect. Blocks
+containing peaks still come out noisier, so the estimate is the QUANTILE
+quantile of the block estimates, i.e. that of the quieter parts of the run.
+The noise of the signal follows from that of the derivative through the
+derivative kernel (see signal_noise()).
+
+Signal-to-noise ratios and the 'auto' threshold are measured from the
+baseline rather than from zero, so they also hold for data whose baseline has
+not been corrected: a peak's height is taken above the line joining its
+bounds, and the threshold above the running median of the signal (see
+baseline_level())."""
+import numpy as np
+import derivatives
+
+WINDOW = 200
+#Number of derivative points in each block.
+QUANTILE = 0.25
+#Quantile of the block estimates taken as the noise.
+MAD_SCALE = 1.4826
+#Ratio of the standard deviation to the MAD of normally distributed noise.
+TOLERANCE_FACTOR = 5
+#Multiple of the derivative noise below which the signal is considered flat
+#when the noise tolerance is 'auto'.
+THRESHOLD_FACTOR = 10
+#Multiple of the signal noise used as the autopicking threshold when it is
+#'auto' (i.e. the minimum signal-to-noise ratio of a picked peak).
+LEVEL_WINDOW = 601
+#Width in points of the running median taken as the level of the baseline
+#when the threshold is 'auto'; it should be much wider than the peaks.
+
+#================================================================
+# NOISE ESTIMATION
+#================================================================
+def block_mads(series,window=WINDOW):
+    """This function returns the MAD-based standard deviation of each
+    complete block of window points of a series."""
+    series = np.asarray(series,dtype=np.float64)
+    blocks = series[:len(series)//window*window].reshape(-1,window)
+    deviations = np.abs(blocks-np.median(blocks,axis=1,keepdims=True))
+    return MAD_SCALE*np.median(deviations,axis=1)
+
+class NoiseEstimator:
+    """The NoiseEstimator class estimates the noise of a series pushed to it
+    in chunks (e.g. a derivative series that is being extended), keeping only
+    the estimates of complete blocks and the points of the last incomplete
+    one.
+
+    Parameters:
+        window - the number of points in each block"""
+
+    def __init__(self,window=WINDOW):
+        self.window = window
+        self.estimates = np.zeros(0)
+        self.pending = np.zeros(0)
+        #Points of the last, incomplete block.
+        self.count = 0
+        #Number of points pushed.
+        self._sigma = None
+        #Estimate computed since the last push.
+
+    def push(self,series):
+        """This method adds points to the series."""
+        self.count += len(series)
+        self._sigma = None
+        self.pending = np.concatenate((self.pending,series))
+        complete = len(self.pending)//self.window*self.window
+        if complete > 0:
+            self.estimates = np.concatenate((self.estimates,
+                block_mads(self.pending[:complete],self.window)))
+            self.pending = self.pending[complete:]
+
+    def sigma(self):
+        """This method returns the estimated standard deviation of the noise.
+        Blocks without any spread (e.g. where the detector is saturated) are
+        ignored; a series shorter than one block is measured as a whole, and
+        an empty one has no noise."""
+        if self._sigma is None:
+            estimates = self.estimates[self.estimates > 0]
+            if len(estimates) > 0:
+                self._sigma = float(np.quantile(estimates,QUANTILE))
+            elif len(self.pending) > 0:
+                self._sigma = float(block_mads(self.pending,
+                    len(self.pending))[0])
+            else:
+                self._sigma = 0.0
+        return self._sigma
+
+def estimate(series,window=WINDOW):
+    """This function returns the estimated standard deviation of the noise
+    of a series (see NoiseEstimator)."""
+    estimator = NoiseEstimator(window)
+    estimator.push(series)
+    return estimator.sigma()
+
+def signal_noise(derivative_noise,mode="right",window=derivatives.WINDOW):
+    """This function converts the noise of a derivative series to that of the
+    signal it was computed from: for white noise, the derivative noise is the
+    signal noise times the norm of the derivative kernel."""
+    coefficients = derivatives.kernel(mode,window)[1]
+    return derivative_noise/np.linalg.norm(coefficients)
+
+def snr(height,signal_noise):
+    """This function returns the signal-to-noise ratio of a peak of a given
+    height above the baseline, or NaN if there is no noise."""
+    return height/signal_noise if signal_noise > 0 else np.nan
+
+def baseline_level(signal,window=LEVEL_WINDOW):
+    """This function returns the level of the baseline at each point of a
+    signal series: the median of the window of points centred on it, which
+    follows baseline drift but not peaks much narrower than the window. The
+    level at a point depends only on the points within window//2 of it, and
+    the series is extended with its end points."""
+    from scipy import ndimage
+    #Imported here so that estimating the noise does not need scipy.
+    signal = np.asarray(signal,dtype=np.float64)
+    if len(signal) == 0:
+        return signal.copy()
+    return ndimage.median_filter(signal,size=max(int(window),1),
+        mode="nearest")
+
+def parse_level(text):
+    """This function converts a noise tolerance or threshold given on the
+    command line to a number, or to 'auto'."""
+    return "auto" if text == "auto" else float(text)
@@ -0,0 +1,113 @@
+"""This module detects and integrates peaks in many chromatograms at once,
+using a pool of worker processes"""
+import concurrent.futures
+from multiprocessing import shared_memory
+import numpy as np
+import settings
+from chromatogram import Chromatogram, Peak
+
+_signals = None
+#Array of all signal series in the shared memory block, in worker processes.
+_memory = None
+#The shared memory block itself, kept open for as long as _signals is used.
+
+#================================================================
+# WORKER PROCESSES
+#================================================================
+def _attach(name,length):
+    """This function is the initializer of the worker processes. It attaches
+    the shared memory block holding the signal series."""
+    global _signals, _memory
+    _memory = shared_memory.SharedMemory(name=name)
+    #Worker processes share the resource tracker of the parent process, which
+    #unregisters the block when the parent unlinks it.
+    _signals = np.ndarray((length,),dtype=np.float64,buffer=_memory.buf)
+
+def _detect(task):
+    """This function detects and integrates the peaks of one chromatogram,
+    whose signal series is a slice of the shared memory block. It returns the
+    attributes of each peak (see Peak.restore())."""
+    signal = _signals[task["start"]:task["start"]+task["length"]]
+    gram = Chromatogram(
+        data=signal,
+        signal_series=signal,
+        time_scale=task["time_scale"],
+        time_shift=task["time_shift"],
+        signal_scale=task["signal_scale"],
+        time_warp=task["time_warp"],
+        derivative_mode=task["derivative_mode"],
+        derivative_window=task["derivative_window"],
+        noise_tolerance=task["noise_tolerance"]
+        )
+    gram.threshold_autopick(task["threshold"],area_mode=task["area_mode"])
+    return [{key:value for key, value in vars(peak).items()
+        if key not in ("time_series","signal_series")} for peak in gram.peaks]
+
+
+#================================================================
+# PARALLEL PEAK DETECTION
+#================================================================
+def detect_peaks(chromatograms,threshold="auto",noise_tolerance=None,area_mode="bb",
+    workers=None):
+    """This function picks peaks above a threshold in each of a list of
+    chromatograms (see Chromatogram.threshold_autopick()) in parallel.
+
+    The signal series are copied once into a shared memory block that the
+    worker processes read directly, so no data arrays are pickled. Each worker
+    detects and integrates the peaks of one chromatogram and sends back only
+    the peak metrics, which are merged into the chromatogram's peaks and peak
+    table. Peaks with the same bounds as existing peaks are skipped.
+
+    Arguments:
+        chromatograms -- a list of Chromatogram objects
+        threshold -- the signal threshold for picking peaks, or 'auto' (the
+            default)
+        noise_tolerance -- overrides the noise tolerance of every
+            chromatogram when set (a number or 'auto')
+        area_mode -- the integration mode of the new peaks
+        workers -- the number of worker processes (default: number of CPUs)"""
+    lengths = [len(gram.signal_series) for gram in chromatograms]
+    starts = np.concatenate(([0],np.cumsum(lengths)[:-1])).astype(int)
+    total = int(sum(lengths))
+    memory = shared_memory.SharedMemory(create=True,size=max(total,1)*8)
+    try:
+        signals = np.ndarray((total,),dtype=np.float64,buffer=memory.buf)
+        for gram, start, length in zip(chromatograms,starts,lengths):
+            signals[start:start+length] = gram.signal_series
+        del signals
+        #Release the view so the block can be closed.
+
+        tasks = []
+        for gram, start, length in zip(chromatograms,starts,lengths):
+            tolerance = noise_tolerance
+            if tolerance is None:
+                tolerance = gram.noise_tolerance
+            if tolerance is None:
+                tolerance = settings.get("NOISE_TOLERANCE")
+            #Resolved here so that settings overridden in this process apply
+            #in the worker processes.
+            tasks.append({
+                "start":int(start),
+                "length":length,
+                "time_scale":gram.time_scale,
+                "time_shift":gram.time_shift,
+                "signal_scale":gram.signal_scale,
+                "time_warp":gram.time_warp,
+                "derivative_mode":gram.derivative_mode,
+                "derivative_window":gram.derivative_window,
+                "noise_tolerance":tolerance,
+                "threshold":threshold,
+                "area_mode":area_mode
+                })
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers,
+            initializer=_attach,initargs=(memory.name,total)) as pool:
+            results = list(pool.map(_detect,tasks))
+    finally:
+        memory.close()
+        memory.unlink()
+
+    for gram, peaks in zip(chromatograms,results):
+        picked = set((peak.i_0,peak.i_f) for peak in gram.peaks)
+        gram.insert_peaks([Peak.restore(gram,attributes) for attributes in peaks
+            if (attributes["i_0"],attributes["i_f"]) not in picked])
+    return chromatograms
@@ -0,0 +1,136 @@
+"""This module draws chromatograms on a matplotlib Axes"""
+import numpy as np
+
+#================================================================
+# DECIMATION
+#================================================================
+def minmax_decimate(x,y,x_min,x_max,n_bins):
+    """This function reduces the points of a series within [x_min, x_max] to
+    the minimum and maximum of each of n_bins equal bins, so that a plot of the
+    result looks the same as a plot of every point at a width of n_bins pixels.
+
+    Arguments:
+        x -- a sorted array of x values
+        y -- an array of y values
+        x_min, x_max -- the visible range of x values
+        n_bins -- the number of bins, usually the width of the plot in pixels
+
+    Returns the decimated x and y arrays, including the first point on either
+    side of the visible range so that lines run to the edges of the plot."""
+    i_0 = max(np.searchsorted(x,x_min,"left")-1,0)
+    i_f = min(np.searchsorted(x,x_max,"right")+1,len(x))
+    x = x[i_0:i_f]
+    y = y[i_0:i_f]
+    n_bins = max(int(n_bins),1)
+    if len(x) <= 2*n_bins:
+        return x, y
+
+    bin_size = -(-len(x)//n_bins)
+    n_full = len(x)//bin_size
+    blocks = y[:n_full*bin_size].reshape(n_full,bin_size)
+    i_min = blocks.argmin(axis=1)
+    i_max = blocks.argmax(axis=1)
+    offsets = np.arange(n_full)*bin_size
+    indices = np.column_stack((np.minimum(i_min,i_max),
+        np.maximum(i_min,i_max)))+offsets[:,None]
+    indices = indices.ravel()
+    #The minimum and maximum of each bin, in the order they occur.
+    tail = y[n_full*bin_size:]
+    if len(tail) > 0:
+        tail_indices = np.sort([tail.argmin(),tail.argmax()])+n_full*bin_size
+        indices = np.concatenate((indices,tail_indices))
+        #Points left over after the last full bin.
+    indices = np.unique(np.concatenate(([0],indices,[len(x)-1])))
+    #The end points are kept even when they are not extremes of their bins.
+    return x[indices], y[indices]
+
+
+#================================================================
+# RENDERER
+#================================================================
+class Renderer:
+    """The Renderer class draws a list of chromatograms on a matplotlib Axes,
+    keeping one Line2D artist per chromatogram.
+
+    Lines hold min/max-decimated envelopes sized to the pixel width of the
+    axes, and are re-decimated whenever the visible time range changes (e.g.
+    when zooming or panning). Updating the chromatograms changes the data of
+    the existing lines instead of clearing the axes and plotting them again.
+    The Renderer never draws the canvas itself."""
+
+    def __init__(self,axes):
+        self.axes = axes
+        self.lines = []
+        self.chromatograms = []
+        self._views = []
+        #The time and signal series each line was last decimated from and
+        #the view it was decimated for. The series are kept rather than their
+        #id(), which a new array can reuse once the old one is freed.
+        axes.callbacks.connect("xlim_changed",self._on_xlim_changed)
+
+    def _bins(self):
+        """This method returns the number of decimation bins: the width of the
+        axes in pixels."""
+        return max(int(self.axes.bbox.width),1)
+
+    def _is_current(self,i):
+        """This method returns whether the i-th line was last decimated from
+        the present series of the i-th chromatogram. Series are replaced
+        rather than modified in place, so the same arrays hold the same
+        data."""
+        last = self._views[i]
+        gram = self.chromatograms[i]
+        return last is not None and last[0] is gram.time_series\
+            and last[1] is gram.signal_series
+
+    def _decimate(self,i,x_min,x_max):
+        """This method sets the data of the i-th line to the decimated
+        envelope of the i-th chromatogram within [x_min, x_max]."""
+        gram = self.chromatograms[i]
+        if gram.hidden:
+            return
+        view = (x_min,x_max,self._bins())
+        if self._is_current(i) and self._views[i][2] == view:
+            return
+        self._views[i] = (gram.time_series,gram.signal_series,view)
+        self.lines[i].set_data(*minmax_decimate(gram.time_series,
+            gram.signal_series,x_min,x_max,view[2]))
+
+    def _on_xlim_changed(self,axes):
+        x_min, x_max = sorted(axes.get_xlim())
+        for i in range(len(self.lines)):
+            self._decimate(i,x_min,x_max)
+
+    def update(self,chromatograms):
+        """This method updates the lines to show a list of chromatograms.
+        When the axes are autoscaling (i.e. the user has not zoomed in), the
+        view is fit to all visible chromatograms."""
+        self.chromatograms = list(chromatograms)
+        while len(self.lines) > len(self.chromatograms):
+            self.lines.pop().remove()
+            self._views.pop()
+        while len(self.lines) < len(self.chromatograms):
+            self.lines.append(self.axes.plot([],[])[0])
+            self._views.append(None)
+
+        for line, gram in zip(self.lines,self.chromatograms):
+            line.set_color(gram.color)
+            line.set_visible(not gram.hidden)
+
+        if self.axes.get_autoscale_on():
+            visible = [gram for gram in self.chromatograms
+                if not gram.hidden and len(gram.time_series) > 0]
+            if visible:
+                x_min = min(gram.time_series[0] for gram in visible)
+                x_max = max(gram.time_series[-1] for gram in visible)
+                for i in range(len(self.lines)):
+                    if not self._is_current(i):
+                        self._decimate(i,x_min,x_max)
+                #Decimating over the whole run keeps the extremes of every
+                #chromatogram, so the data limits cover the full signal. Lines
+                #already decimated while autoscaling cover their whole run.
+            self.axes.relim(visible_only=True)
+            self.axes.autoscale_view()
+            #Changing the limits re-decimates the lines to the new view.
+        else:
+            self._on_xlim_changed(self.axes)
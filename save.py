@@ -1,26 +1,229 @@
 """This module is used for saving and loading data"""
-import tkinter as tk
-import tkinter.filedialog
+import json
+import os
+import struct
+import numpy as np
 import pandas as pd
-from icecream import ic
+import compounds
+from chromatogram import Chromatogram, Peak
+from history import SaveState
 
 #================================================================
 # EXPORT PEAK TABLE TO CSV
 #================================================================
+def peak_summary(chromatograms):
+    """This function concatenates the peak tables of several chromatograms
+    into one data frame, with a leading column naming the chromatogram each
+    peak belongs to."""
+    peak_tables = [gram.peak_table for gram in chromatograms]
+    table_temp = pd.concat(peak_tables,
+        keys=[gram.name for gram in chromatograms])
+    #concatenate all peak summary tables into one data frame indexed by
+    #chromatogram names
+    table_temp.insert(0,"Chromatogram",
+        table_temp.index.get_level_values(0))
+    return table_temp.reset_index(drop=True)
+
+def write_peaks(chromatograms,filepath):
+    """This function writes the combined peak table of several chromatograms
+    to a CSV file."""
+    peak_summary(chromatograms).to_csv(str(filepath), index = False, header=True)
+
+def write_compounds(chromatograms,filepath,tolerance=compounds.TOLERANCE,
+    column="Area"):
+    """This function writes a table of the compounds found in several
+    chromatograms (see compounds.PeakIndex.compound_table()) to a CSV file."""
+    compounds.PeakIndex(chromatograms).compound_table(tolerance,column)\
+        .to_csv(str(filepath),header=True)
+
+def _ask_csv_path():
+    import tkinter.filedialog
+    #Imported here so that the rest of this module can be used without Tk.
+    return tkinter.filedialog.asksaveasfilename(
+        defaultextension="csv",
+        filetypes=[
+            ("Comma-Separated Values", "*.csv"),
+            ("All Files", "*.*")],
+        )
+    #open a filedialog to pick output file name and destination
+
 def export_peaks(params):
     try:
-        filepath = tk.filedialog.asksaveasfilename(
-            defaultextension="csv",
-            filetypes=[
-                ("Comma-Separated Values", "*.csv"),
-                ("All Files", "*.*")],
-            )
-        #open a filedialog to pick output file name and destination
-        peak_tables = [gram.peak_table for gram in params["chromatograms"]]
-        table_temp = pd.concat(peak_tables,
-            keys=[gram.name for gram in params["chromatograms"]])
-        #concatenate all peak summary tables into one data frame indexed by
-        #chromatogram names
-        table_temp.to_csv(str(filepath), index = False, header=True)
+        write_peaks(params["chromatograms"],_ask_csv_path())
     except ValueError:
         print("Peak summary export operation aborted!")
+
+def export_compounds(params):
+    try:
+        write_compounds(params["chromatograms"],_ask_csv_path())
+    except ValueError:
+        print("Compound table export operation aborted!")
+
+
+#================================================================
+# SAVE/LOAD SESSIONS
+#================================================================
+SESSION_MAGIC = b"MCHROMA\x00"
+SESSION_VERSION = 1
+SESSION_ALIGNMENT = 64
+SESSION_ARRAYS = ("raw_data","signal_series","baseline")
+#A session file (.mchroma) consists of:
+#   - the 8 byte SESSION_MAGIC
+#   - the length of the header as a little-endian unsigned 64-bit integer
+#   - the header: JSON describing the SaveState, its chromatograms and peaks,
+#     and the dtype, length and offset of each of their data arrays
+#   - the data arrays, stored raw and little-endian, each starting on a
+#     multiple of SESSION_ALIGNMENT bytes from the start of the file
+#Array offsets in the header are relative to the end of the header (rounded
+#up to SESSION_ALIGNMENT), which is where the first array starts.
+
+def _align(n):
+    """This function rounds a number of bytes up to SESSION_ALIGNMENT."""
+    return -(-n//SESSION_ALIGNMENT)*SESSION_ALIGNMENT
+
+def _mapped_file(array):
+    """This function returns the path of the file an array is memory-mapped
+    from, or None if it is not."""
+    while isinstance(array,np.ndarray):
+        if isinstance(array,np.memmap):
+            return array.filename
+        array = array.base
+    return None
+
+def release_file(states,filepath):
+    """This function copies the data arrays of the chromatograms in a list of
+    SaveStates that are memory-mapped from a file into memory, so that the
+    file can be replaced: Windows does not allow replacing a file that is
+    mapped. Arrays shared between chromatograms are still shared afterwards."""
+    target = os.path.normcase(os.path.abspath(filepath))
+    copies = {}
+    #Copies of the released arrays keyed by the ids of the originals.
+    for state in states:
+        for gram in state.chromatograms:
+            released = False
+            for attribute in SESSION_ARRAYS:
+                array = getattr(gram,attribute)
+                filename = _mapped_file(array)
+                if filename is not None and\
+                    os.path.normcase(os.path.abspath(filename)) == target:
+                    if id(array) not in copies:
+                        copies[id(array)] = (array,np.array(array))
+                    setattr(gram,attribute,copies[id(array)][1])
+                    released = True
+            if released:
+                for peak in gram._peaks:
+                    if isinstance(peak,Peak):
+                        peak.signal_series = gram.signal_series[peak.i_0:peak.i_f+1]
+                #Peaks hold views of the signal series.
+
+def save_session(state,filepath):
+    """This function saves the chromatograms of a SaveState to a session file.
+
+    The file is written to a temporary file first, then moved over the
+    destination, so that a failed save does not corrupt an existing file.
+    Arrays of the SaveState memory-mapped from the destination are first
+    copied into memory (see release_file()); arrays of other SaveStates
+    mapped from it must be released by the caller."""
+    arrays = []
+    offset = 0
+    grams = []
+    for gram in state.chromatograms:
+        descriptors = {}
+        for attribute in SESSION_ARRAYS:
+            array = np.asarray(getattr(gram,attribute))
+            array = array.astype(array.dtype.newbyteorder("<"),copy=False)
+            descriptors[attribute] = {
+                "dtype":array.dtype.str,
+                "length":len(array),
+                "offset":offset
+                }
+            arrays.append((offset,array))
+            offset = _align(offset+array.nbytes)
+        grams.append({
+            "name":gram.name,
+            "color":gram.color,
+            "hidden":gram.hidden,
+            "time_scale":gram.time_scale,
+            "time_shift":gram.time_shift,
+            "signal_scale":gram.signal_scale,
+            "time_warp":gram.time_warp,
+            "derivative_mode":gram.derivative_mode,
+            "derivative_window":gram.derivative_window,
+            "noise_tolerance":gram.noise_tolerance,
+            "peaks":gram.peak_bounds(),
+            "arrays":descriptors
+            })
+    header = json.dumps({
+        "version":SESSION_VERSION,
+        "active_index":state.active_index,
+        "chromatograms":grams
+        }).encode("utf-8")
+    data_start = _align(len(SESSION_MAGIC)+8+len(header))
+
+    temp_path = f"{filepath}.tmp"
+    with open(temp_path,"wb") as writer:
+        writer.write(SESSION_MAGIC)
+        writer.write(struct.pack("<Q",len(header)))
+        writer.write(header)
+        for array_offset, array in arrays:
+            writer.seek(data_start+array_offset)
+            writer.write(np.ascontiguousarray(array).data)
+        writer.truncate(data_start+offset)
+    release_file([state],filepath)
+    try:
+        os.replace(temp_path,filepath)
+    except OSError:
+        os.remove(temp_path)
+        raise
+
+def load_session(filepath):
+    """This function loads a session file as a new SaveState.
+
+    The data arrays are memory-mapped read-only rather than read, so data is
+    only read from disk when it is used, and peaks are rebuilt the first time
+    they are needed."""
+    with open(filepath,"rb") as reader:
+        if reader.read(len(SESSION_MAGIC)) != SESSION_MAGIC:
+            raise ValueError(f"{filepath} is not an M|Chroma session file.")
+        header_length, = struct.unpack("<Q",reader.read(8))
+        header = json.loads(reader.read(header_length).decode("utf-8"))
+    if header["version"] > SESSION_VERSION:
+        raise ValueError(f"{filepath} was saved by a newer version of M|Chroma.")
+    data_start = _align(len(SESSION_MAGIC)+8+header_length)
+
+    state = SaveState()
+    if os.path.getsize(filepath) > data_start:
+        data = np.memmap(filepath,dtype=np.uint8,mode="r",offset=data_start)
+    else:
+        data = np.zeros(0,dtype=np.uint8)
+        #np.memmap cannot map an empty region (i.e. all arrays are empty).
+    for entry in header["chromatograms"]:
+        time_warp = entry.get("time_warp")
+        if time_warp is not None:
+            time_warp = tuple(time_warp)
+            #JSON stores the (anchors, offsets) tuple as a list.
+        arrays = {}
+        for attribute, descriptor in entry["arrays"].items():
+            dtype = np.dtype(descriptor["dtype"])
+            start = descriptor["offset"]
+            arrays[attribute] = data[start:start+descriptor["length"]*dtype.itemsize]\
+                .view(dtype)
+        gram = Chromatogram(
+            data=arrays["raw_data"],
+            signal_series=arrays["signal_series"],
+            baseline=arrays["baseline"],
+            name=entry["name"],
+            color=entry["color"],
+            time_scale=entry["time_scale"],
+            time_shift=entry["time_shift"],
+            signal_scale=entry["signal_scale"],
+            time_warp=time_warp,
+            derivative_mode=entry.get("derivative_mode"),
+            derivative_window=entry.get("derivative_window"),
+            noise_tolerance=entry.get("noise_tolerance")
+            )
+        gram.hidden = entry["hidden"]
+        gram.restore_peaks(entry["peaks"])
+        state.add_chromatogram(gram)
+    state.active_index = header["active_index"]
+    return state
@@ -0,0 +1,135 @@
+"""This module holds M|Chroma's settings.
+
+Settings are read from settings.cfg next to this module (or from the file
+named by the environment variable MCHROMA_SETTINGS) the first time one is
+requested, and the parsed values are cached for the rest of the process.
+Nothing is read when the module is imported, so modules that use settings can
+be imported from any working directory, e.g. by worker processes.
+
+Example:
+    import settings
+    settings.get("NOISE_TOLERANCE")
+    settings.override(NOISE_TOLERANCE=30)    #for the rest of the process
+    with settings.overridden(SAMPLING_RATE=5):    #for a block of code
+        ...
+
+Each line of a settings file is a key followed by its value(s), separated by
+spaces. Missing keys (or a missing file) fall back on DEFAULTS."""
+import contextlib
+import os
+import pathlib
+import threading
+
+SETTINGS_FILE = pathlib.Path(__file__).parent/"settings.cfg"
+
+DEFAULTS = {
+    "NOISE_TOLERANCE":"auto",
+    "SAMPLING_RATE":10.000640,
+    "DEFAULT_COLORS":["#00274c","#ffcb05","#ca0147","#069af3","#01b44c",
+        "#6c3876","#13eac9","#55060a","#aaaaaa"]
+    }
+#NOISE_TOLERANCE -- 'auto' for a multiple of the noise estimated for each
+#   chromatogram (see noise.py), or a derivative magnitude in detector counts
+#   below which the signal is considered flat when detecting peak bounds
+#SAMPLING_RATE -- default sampling rate in Hz of data files without one
+#DEFAULT_COLORS -- colors given to chromatograms in the order they are opened
+
+CONVERTERS = {
+    "NOISE_TOLERANCE":lambda values: "auto" if values[0] == "auto"\
+        else float(values[0]),
+    "SAMPLING_RATE":lambda values: float(values[0]),
+    "DEFAULT_COLORS":list
+    }
+#Functions converting the values on a line of a settings file to a setting.
+#Settings without a converter are kept as a string.
+
+_loaded = None
+#Settings read from the settings file, once it has been read.
+_overrides = {}
+_lock = threading.Lock()
+
+#================================================================
+# READING SETTINGS
+#================================================================
+def settings_file():
+    """This function returns the path of the settings file."""
+    return pathlib.Path(os.environ.get("MCHROMA_SETTINGS",SETTINGS_FILE))
+
+def read_settings(filepath):
+    """This function parses a settings file into a dict. A missing file has
+    no settings; lines that cannot be converted are reported and skipped."""
+    values = {}
+    try:
+        with open(filepath,"r") as reader:
+            lines = reader.read().splitlines()
+    except FileNotFoundError:
+        return values
+    for line in lines:
+        words = line.split()
+        if not words:
+            continue
+        key = words[0]
+        try:
+            if key in CONVERTERS:
+                values[key] = CONVERTERS[key](words[1:])
+            else:
+                values[key] = " ".join(words[1:])
+        except (IndexError,ValueError):
+            print(f"Invalid setting in {filepath}: {line}")
+    return values
+
+def _file_settings():
+    """This function returns the settings in the settings file, reading it
+    the first time it is called."""
+    global _loaded
+    if _loaded is None:
+        with _lock:
+            if _loaded is None:
+                _loaded = read_settings(settings_file())
+    return _loaded
+
+def get(key):
+    """This function returns the value of a setting: its override if there
+    is one, else its value in the settings file, else its default."""
+    if key in _overrides:
+        return _overrides[key]
+    values = _file_settings()
+    if key in values:
+        return values[key]
+    return DEFAULTS[key]
+
+
+#================================================================
+# OVERRIDING SETTINGS
+#================================================================
+def override(**values):
+    """This function overrides settings for the rest of the process, e.g.
+    override(NOISE_TOLERANCE=30)."""
+    _overrides.update(values)
+
+def clear_overrides(*keys):
+    """This function removes the overrides of the given settings (or of all
+    settings if none are given)."""
+    if not keys:
+        _overrides.clear()
+    for key in keys:
+        _overrides.pop(key,None)
+
+@contextlib.contextmanager
+def overridden(**values):
+    """This context manager overrides settings within a block of code,
+    restoring the previous overrides afterwards."""
+    previous = dict(_overrides)
+    _overrides.update(values)
+    try:
+        yield
+    finally:
+        _overrides.clear()
+        _overrides.update(previous)
+
+def reload():
+    """This function discards the cached settings file so that it is read
+    again the next time a setting is requested."""
+    global _loaded
+    with _lock:
+        _loaded = None
@@ -0,0 +1,479 @@
+"""This module picks and integrates the peaks of data files too long to hold in
+memory, reading them in chunks through a pipeline of generators.
+
+Example:
+    python stream.py run.dat.asc -o peaks.csv
+    python stream.py run.dat.asc -o peaks.csv --baseline 0.5 28 --threshold 5000
+
+The stages of the pipeline are:
+    loader.iter_asc() -- parses chunks of data points from a .dat.asc file
+    subtract_baseline() -- subtracts a baseline from each chunk
+    differentiate() -- pairs each chunk with its first derivative
+    detect_features() -- finds the bounds of the peaks above a threshold
+    integrate() -- builds a Peak object for each set of bounds
+    order_peaks() -- yields the peaks in order of retention time
+Each stage holds only what it needs to carry over a chunk boundary, so memory
+stays bounded regardless of the length of the run. Peaks are found with the
+same logic as Chromatogram.threshold_autopick(), and are yielded in the order
+of Chromatogram.peaks as soon as no peak found later can come before them.
+'auto' thresholds and
+tolerances need the noise of the whole run, which stream_peaks() measures in a
+first pass over the file (see measure_noise())."""
+import argparse
+import csv
+import heapq
+import itertools
+import sys
+import numpy as np
+import derivatives
+import loader
+import noise
+import settings
+from chromatogram import (BoundLookup, Chromatogram, Peak, INDEX_COLUMN,
+    PEAK_TABLE_COLUMNS, peak_order_key)
+
+MAX_WIDTH = 2**20
+#Maximum number of points of the series held by detect_features(), which
+#bounds the width of the peaks it can find.
+
+#================================================================
+# PIPELINE STAGES
+#================================================================
+def linear_baseline(i_0,s_0,i_f,s_f):
+    """This function returns a baseline for subtract_baseline(): the line
+    through the points (i_0, s_0) and (i_f, s_f), where i_0 and i_f are data
+    point indices (see Chromatogram.baseline_correct())."""
+    slope = (s_f-s_0)/(i_f-i_0)
+    return lambda indices: slope*(indices-i_0) + s_0
+
+def subtract_baseline(chunks,baseline=None):
+    """This generator converts chunks of detector counts to chunks of signal
+    by subtracting a baseline.
+
+    Arguments:
+        chunks -- an iterable of arrays of consecutive data points
+        baseline -- a function returning the baseline at an array of data
+            point indices (e.g. linear_baseline()), or None for no baseline"""
+    start = 0
+    for chunk in chunks:
+        signal = np.asarray(chunk).astype(np.float64)
+        if baseline is not None:
+            signal = signal - baseline(np.arange(start,start+len(signal)))
+        start += len(signal)
+        yield signal
+
+def differentiate(chunks,mode="right",window=derivatives.WINDOW):
+    """This generator pairs chunks of signal with their first derivative,
+    computed like Chromatogram.compute_derivative() in a derivative mode (see
+    derivatives.py).
+
+    The derivative at the last points of a chunk depends on the first points
+    of the next chunk, so those points are held back and yielded with the
+    next chunk. Yields (signal, derivative) pairs of equal length."""
+    before, after = derivatives.reach(mode,window)
+    buffer = np.zeros(0)
+    offset = 0
+    #Index of the first point of the buffer in the run.
+    done = 0
+    #Number of points yielded.
+    for chunk in chunks:
+        buffer = np.concatenate((buffer,chunk))
+        limit = offset+len(buffer)-after
+        if limit <= done:
+            continue
+        derivative = derivatives.differentiate(buffer,mode,window,
+            done-offset)[:limit-done]
+        yield buffer[done-offset:limit-offset], derivative
+        done = limit
+        keep = max(done-before,offset)
+        buffer = buffer[keep-offset:]
+        offset = keep
+        #Only the points the held-back derivatives depend on are kept.
+    if offset+len(buffer) > done:
+        yield buffer[done-offset:], derivatives.differentiate(buffer,mode,
+            window,done-offset)
+        #The derivative at the last points of the run is 0.
+
+class FeatureDetector:
+    """The FeatureDetector class finds the bounds of the peaks whose signal
+    rises above a threshold, like Chromatogram.threshold_autopick(), from
+    consecutive chunks of a series pushed to it one at a time.
+
+    A window of the series is kept from the earliest point the bounds of
+    current or future peaks can reach back to. As each chunk arrives, features
+    that start in it are added to the pending features, and the bounds of
+    every pending feature whose right bound now lies within the window are
+    final. The work done per chunk therefore depends on the size of the chunk
+    and of the window, not on the length of the series. Peaks wider than
+    max_width points are cut off at the right.
+
+    Parameters:
+        threshold - the signal threshold for picking peaks, or 'auto' for a
+            multiple of the noise of the signal above the level of its
+            baseline (see noise.baseline_level())
+        tolerance - the derivative magnitude below which the signal is
+            considered flat, or 'auto' for a multiple of the noise of the
+            derivative (default: the NOISE_TOLERANCE setting)
+        max_width - the maximum number of points held in the window
+        derivative_mode, derivative_window - the mode of the derivative pushed
+            (see derivatives.py), from which the noise of the signal follows
+        derivative_noise - the noise of the derivative of the whole series
+            (see measure_noise()), or None to estimate it as it is pushed
+
+    With numeric thresholds and tolerances, or with the derivative_noise of
+    the whole series, the peaks are exactly those threshold_autopick() finds in
+    the whole series. Otherwise 'auto' uses the noise of the derivative pushed
+    so far (see FeatureDetector.noise), which is all that is known while a run
+    is acquired, so the peaks can differ slightly. An 'auto' threshold also
+    holds back noise.LEVEL_WINDOW//2 points, until the level of the baseline
+    under them is known."""
+
+    def __init__(self,threshold="auto",tolerance=None,max_width=MAX_WIDTH,
+        derivative_mode="right",derivative_window=derivatives.WINDOW,
+        derivative_noise=None):
+        if tolerance is None:
+            tolerance = settings.get("NOISE_TOLERANCE")
+        self.threshold = threshold
+        self.tolerance = tolerance
+        self.max_width = max_width
+        self.derivative_mode = derivative_mode
+        self.derivative_window = derivative_window
+        self.reach = noise.LEVEL_WINDOW//2 if threshold == "auto" else 0
+        #Number of points after a point that its baseline level depends on.
+        self.base = 0
+        #Index of the first point of the window in the series.
+        self.signal = np.zeros(0)
+        self.derivative = np.zeros(0)
+        self.pending = np.zeros(0,dtype=np.int64)
+        #Start points of features whose bounds are not yet known.
+        self.scanned = 0
+        #Number of points compared with the threshold.
+        self.above = False
+        #Whether the last point scanned was above the threshold.
+        self.picked = set()
+        #Bounds found so far that later features could also lead to.
+        self.noise = noise.NoiseEstimator()
+        #Estimator of the noise of the derivative pushed so far.
+        self.derivative_noise = derivative_noise
+
+    def sigma(self):
+        """This method returns the noise of the derivative used for 'auto'
+        thresholds and tolerances: that of the whole series if it was given,
+        or else that of the derivative pushed so far."""
+        if self.derivative_noise is not None:
+            return self.derivative_noise
+        return self.noise.sigma()
+
+    def push(self,signal,derivative):
+        """This method adds a chunk of the series and its first derivative
+        (see differentiate()) to the window. It returns a list of (i_0, i_f,
+        signal) tuples: the bounding indices of each peak that ended and its
+        signal from i_0 to i_f."""
+        self.signal = np.concatenate((self.signal,signal))
+        self.derivative = np.concatenate((self.derivative,derivative))
+        self.noise.push(derivative)
+        self.pending = np.concatenate((self.pending,self._scan(False)))
+        return self._finish(False)
+
+    def close(self):
+        """This method ends the series, returning the peaks that were still
+        pending (see FeatureDetector.push())."""
+        self.pending = np.concatenate((self.pending,self._scan(True)))
+        return self._finish(True)
+
+    def _scan(self,final):
+        """This method compares the points not yet scanned with the threshold,
+        up to the last one whose baseline level is known, and returns the
+        indices at which features start."""
+        total = self.base+len(self.signal)
+        end = total if final else total-self.reach
+        if end <= self.scanned:
+            return np.zeros(0,dtype=np.int64)
+        series = self.signal[self.scanned-self.base:end-self.base]
+        threshold = self.threshold
+        if threshold == "auto":
+            first = max(self.scanned-self.reach,0)
+            level = noise.baseline_level(
+                self.signal[first-self.base:min(end+self.reach,total)-self.base])
+            series = series-level[self.scanned-first:end-first]
+            #With reach points on either side (or the ends of the series), the
+            #level is the same as that of the whole series.
+            threshold = noise.THRESHOLD_FACTOR*noise.signal_noise(
+                self.sigma(),self.derivative_mode,self.derivative_window)
+        over = series > threshold
+        previous = np.concatenate(([self.above],over[:-1]))
+        starts = np.flatnonzero(over & ~previous)+self.scanned
+        #A feature starts where the signal first exceeds the threshold.
+        self.above = bool(over[-1])
+        self.scanned = end
+        return starts
+
+    def features(self,pairs):
+        """This generator pushes an iterable of (signal, derivative) chunks
+        and yields the peaks as they end (see FeatureDetector.push())."""
+        for signal, derivative in pairs:
+            yield from self.push(signal,derivative)
+        yield from self.close()
+
+    def _finish(self,final):
+        """This method finds the bounds of the pending features, returns the
+        ones that are final, and drops the part of the window that is no
+        longer needed."""
+        n = len(self.signal)
+        tolerance = self.tolerance
+        if tolerance == "auto":
+            tolerance = noise.TOLERANCE_FACTOR*self.sigma()
+        lookup = BoundLookup(self.derivative,tolerance)
+        lefts, rights = lookup.find(self.pending-self.base)
+        done = (rights < n-1) | final
+        #A right bound at the end of the window may lie further right.
+
+        keep = 0
+        last_rising = lookup.last_rising[-1] if n > 0 else -1
+        if last_rising > 0:
+            keep = max(int(lookup.last_falling_or_flat[last_rising-1]),0)
+        #The left bound of a future feature can reach back from the last
+        #rising point to the falling or flat point before it, but no further
+        #(or to the start of the run if there is none).
+        if (~done).any():
+            keep = min(keep,int(lefts[~done].min()))
+        if n-keep > self.max_width:
+            keep = n-self.max_width
+            cut = ~done & (lefts < keep)
+            if cut.any():
+                print(f"Peaks wider than {self.max_width} points were cut off.")
+                done |= cut
+        if self.scanned-self.base < n:
+            keep = min(keep,max(self.scanned-self.reach,0)-self.base,
+                int(lookup.find(np.arange(self.scanned-self.base,n))[0].min()))
+        #Features can still start at the points not yet scanned, so the
+        #points their bounds and baseline levels depend on are kept as well.
+
+        features = []
+        for left, right in zip(lefts[done].tolist(),rights[done].tolist()):
+            bounds = (self.base+left,self.base+right)
+            if bounds not in self.picked:
+                self.picked.add(bounds)
+                features.append((bounds[0],bounds[1],
+                    self.signal[left:right+1].copy()))
+                #Several features can belong to the same peak, which is only
+                #returned once.
+
+        self.pending = self.pending[~done]
+        self.base += keep
+        self.signal = self.signal[keep:]
+        self.derivative = self.derivative[keep:]
+        self.picked = set(bounds for bounds in self.picked
+            if bounds[0] >= self.base)
+        return features
+
+def detect_features(pairs,threshold="auto",tolerance=None,max_width=MAX_WIDTH,
+    derivative_mode="right",derivative_window=derivatives.WINDOW,
+    derivative_noise=None):
+    """This generator finds the bounds of the peaks whose signal rises above a
+    threshold in an iterable of (signal, derivative) chunks (see
+    differentiate() and FeatureDetector).
+
+    Yields (i_0, i_f, signal) tuples: the bounding indices of a peak and its
+    signal from i_0 to i_f."""
+    yield from FeatureDetector(threshold,tolerance,max_width,derivative_mode,
+        derivative_window,derivative_noise).features(pairs)
+
+def integrate(features,time_scale,time_shift=0,area_mode="bb",
+    signal_noise=None):
+    """This generator builds a Peak object from each set of bounds found by
+    detect_features().
+
+    Each peak is computed from a chromatogram of just its own points, so its
+    time_series and signal_series do not hold on to the rest of the run. Its
+    signal-to-noise ratio is relative to the noise returned by signal_noise
+    (a function called when the peak is built), or NaN if none is given."""
+    for i_0, i_f, signal in features:
+        gram = Chromatogram(
+            data=signal,
+            signal_series=signal,
+            time_scale=time_scale,
+            time_shift=time_shift+i_0*time_scale
+            )
+        peak = Peak(gram,[0,i_f-i_0],area_mode=area_mode,
+            signal_noise=np.nan if signal_noise is None else signal_noise())
+        #The noise of the few points of the peak is not estimated.
+        peak.i_0 += i_0
+        peak.i_f += i_0
+        peak.i_max += i_0
+        #Indices of the peak in the whole run.
+        yield peak
+
+def order_peaks(peaks,horizon):
+    """This generator yields peaks in the order of Chromatogram.peaks (see
+    chromatogram.peak_order_key()) rather than the order they are found in.
+
+    Peaks are held in a heap until their crest lies before horizon(), the
+    first index at which a peak found later can have its crest (for peaks
+    found by a FeatureDetector, the start of its window). Only the peaks
+    around the end of the window are held, so memory stays bounded."""
+    heap = []
+    counter = itertools.count()
+    #Breaks ties between equal keys, which Peak objects cannot.
+    for peak in peaks:
+        heapq.heappush(heap,(peak_order_key(peak),next(counter),peak))
+        while heap and heap[0][2].i_max < horizon():
+            yield heapq.heappop(heap)[2]
+    while heap:
+        yield heapq.heappop(heap)[2]
+
+
+#================================================================
+# STREAMING PEAK PICKING
+#================================================================
+def measure_noise(path,baseline=None,chunk_size=loader.CHUNK_SIZE,
+    derivative_mode="right",derivative_window=derivatives.WINDOW):
+    """This function reads through a .dat.asc file and returns the noise of
+    the derivative of the whole run (see noise.py), as Chromatogram.noise
+    measures it: the derivative of the last points, which is 0, is left out."""
+    after = derivatives.reach(derivative_mode,derivative_window)[1]
+    estimator = noise.NoiseEstimator()
+    held = np.zeros(0)
+    #Derivative of the last points read, which may be the end of the run.
+    chunks = subtract_baseline(loader.iter_asc(path,chunk_size),baseline)
+    for signal, derivative in differentiate(chunks,derivative_mode,
+        derivative_window):
+        held = np.concatenate((held,derivative))
+        estimator.push(held[:len(held)-after])
+        held = held[len(held)-after:]
+    return estimator.sigma()
+
+def read_points(path,indices,chunk_size=loader.CHUNK_SIZE):
+    """This function reads the detector counts at a list of data point
+    indices of a .dat.asc file. Indices past either end of the run are
+    clamped to its ends. It returns the clamped indices and their counts."""
+    indices = [max(int(index),0) for index in indices]
+    values = [None]*len(indices)
+    start = 0
+    last = None
+    for chunk in loader.iter_asc(path,chunk_size):
+        for position, index in enumerate(indices):
+            if start <= index < start+len(chunk):
+                values[position] = float(chunk[index-start])
+        start += len(chunk)
+        if len(chunk) > 0:
+            last = float(chunk[-1])
+        if all(value is not None for value in values):
+            break
+    if start == 0:
+        raise ValueError(f"{path} has no data points")
+    for position, value in enumerate(values):
+        if value is None:
+            indices[position] = start-1
+            values[position] = last
+    return indices, values
+
+def stream_peaks(path,threshold="auto",baseline=None,tolerance=None,
+    area_mode="bb",chunk_size=loader.CHUNK_SIZE,max_width=MAX_WIDTH,
+    time_scale=None,derivative_mode="right",
+    derivative_window=derivatives.WINDOW):
+    """This generator picks and integrates the peaks of a .dat.asc file
+    above a threshold, yielding Peak objects as it reads through the file.
+
+    When the threshold or the tolerance is 'auto' (the defaults), the noise of
+    the whole run is first measured in a separate pass over the file (see
+    measure_noise()), so the peaks and their signal-to-noise ratios are those
+    of Chromatogram.threshold_autopick(). Otherwise the file is read once and
+    signal-to-noise ratios are relative to the noise read up to each peak.
+
+    The time scale is taken from the sampling rate in the file's header
+    unless it is given (in minutes per point). See the pipeline stages for the
+    other arguments."""
+    if time_scale is None:
+        rate = loader.sampling_rate(loader.read_asc_header(path))
+        if rate is None:
+            rate = settings.get("SAMPLING_RATE")
+        time_scale = 1/(60*rate)
+    if tolerance is None:
+        tolerance = settings.get("NOISE_TOLERANCE")
+    derivative_noise = None
+    if "auto" in (threshold,tolerance):
+        derivative_noise = measure_noise(path,baseline,chunk_size,
+            derivative_mode,derivative_window)
+    chunks = loader.iter_asc(path,chunk_size)
+    signal = subtract_baseline(chunks,baseline)
+    pairs = differentiate(signal,derivative_mode,derivative_window)
+    detector = FeatureDetector(threshold,tolerance,max_width,derivative_mode,
+        derivative_window,derivative_noise)
+    peaks = integrate(detector.features(pairs),time_scale,area_mode=area_mode,
+        signal_noise=lambda: noise.signal_noise(detector.sigma(),
+        derivative_mode,derivative_window))
+    return order_peaks(peaks,lambda: detector.base)
+
+def write_peaks(peaks,filepath,name):
+    """This function writes peaks to a CSV file one row at a time as they are
+    yielded, in the layout of save.write_peaks(), numbering their retention
+    indices in the order they are yielded (see order_peaks()). It returns the
+    number of peaks written."""
+    count = 0
+    with open(filepath,"w",newline="") as writer:
+        rows = csv.writer(writer)
+        rows.writerow(["Chromatogram",INDEX_COLUMN]+list(PEAK_TABLE_COLUMNS))
+        for peak in peaks:
+            rows.writerow([name,count+1]+[getattr(peak,attribute)
+                for attribute in PEAK_TABLE_COLUMNS.values()])
+            writer.flush()
+            #Rows are written as soon as each peak ends.
+            count += 1
+    return count
+
+
+#================================================================
+# COMMAND LINE INTERFACE
+#================================================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Pick peaks in a long data file, reading it in chunks.")
+    parser.add_argument("input",help="data file")
+    parser.add_argument("-o","--output",default="peaks.csv",
+        help="CSV file for the peak table (default: peaks.csv)")
+    parser.add_argument("--baseline",nargs=2,type=float,metavar=("START","END"),
+        help="baseline points in minutes")
+    parser.add_argument("--threshold",type=noise.parse_level,default="auto",
+        help="signal threshold for picking peaks (default: auto, 10 times the "
+        "estimated noise above the baseline)")
+    parser.add_argument("--tolerance",type=noise.parse_level,
+        help="derivative tolerance for peak bounds, or auto (default: "
+        "NOISE_TOLERANCE)")
+    parser.add_argument("--area-mode",choices=("bb","vv","bv","vb"),
+        default="bb")
+    parser.add_argument("--chunk-size",type=int,default=loader.CHUNK_SIZE,
+        help="number of data points read at a time")
+    parser.add_argument("--max-width",type=int,default=MAX_WIDTH,
+        help="maximum peak width in data points")
+    parser.add_argument("--derivative",choices=derivatives.MODES,
+        default="right",help="derivative mode for peak bounds")
+    parser.add_argument("--window",type=int,default=derivatives.WINDOW,
+        help="window in points of the smoothing derivative modes")
+    args = parser.parse_args(argv)
+
+    header = loader.read_asc_header(args.input)
+    name = header.get("Sample ID","")
+    if name == "":
+        name = args.input
+    rate = loader.sampling_rate(header)
+    if rate is None:
+        rate = settings.get("SAMPLING_RATE")
+    time_scale = 1/(60*rate)
+    baseline = None
+    if args.baseline is not None:
+        bounds, counts = read_points(args.input,
+            [round(time/time_scale) for time in args.baseline],args.chunk_size)
+        baseline = linear_baseline(bounds[0],counts[0],bounds[1],counts[1])
+        #As in batch.py, the baseline is the line through the counts at the
+        #two points, which are clamped to the ends of the run.
+    peaks = stream_peaks(args.input,args.threshold,baseline,args.tolerance,
+        area_mode=args.area_mode,chunk_size=args.chunk_size,
+        max_width=args.max_width,time_scale=time_scale,
+        derivative_mode=args.derivative,derivative_window=args.window)
+    count = write_peaks(peaks,args.output,name)
+    print(f"Wrote {count} peaks to {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
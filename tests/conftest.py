@@ -0,0 +1,40 @@
+"""Shared fixtures of the tests. The modules of M|Chroma are imported from the
+directory above this one."""
+import pathlib
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0,str(pathlib.Path(__file__).resolve().parent.parent))
+
+def synthetic_run(n=20000,n_peaks=60,noise=20,seed=0,drift=0):
+    """This function returns int32 detector counts of a run of n points with
+    Gaussian peaks, white noise and (optionally) a baseline rising by drift
+    counts per point from 1500 counts."""
+    rng = np.random.default_rng(seed)
+    x = np.arange(n)
+    y = np.zeros(n)
+    for center in np.unique(rng.choice(np.arange(200,n-200),n_peaks)):
+        y += rng.uniform(2e4,1e6)*np.exp(-0.5*((x-center)/rng.uniform(3,8))**2)
+    y += rng.normal(0,noise,n)
+    if drift:
+        y += 1500+drift*x
+    return np.round(y).astype(np.int32)
+
+@pytest.fixture
+def run():
+    """This fixture is the function building synthetic runs."""
+    return synthetic_run
+
+@pytest.fixture
+def asc_file(tmp_path):
+    """This fixture is a function writing detector counts to a .dat.asc file
+    and returning its path."""
+    def write(data,name="run.dat.asc",newline="\n"):
+        path = tmp_path/name
+        lines = ["Sample ID: synthetic","Sampling Rate: 10.000000 Hz",""]
+        lines += [str(value) for value in data]
+        with open(path,"w",newline="") as writer:
+            writer.write(newline.join(lines)+newline)
+        return path
+    return write
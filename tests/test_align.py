@@ -0,0 +1,59 @@
+"""Tests of retention time alignment."""
+import numpy as np
+import pytest
+import align
+from chromatogram import Chromatogram
+
+def picked(data,**kwargs):
+    gram = Chromatogram(data=data,noise_tolerance=50.0,**kwargs)
+    gram.threshold_autopick(5000)
+    return gram
+
+@pytest.mark.parametrize("method",["peaks","cow"])
+def test_align_recovers_shift(run,method):
+    data = run(seed=5)
+    reference = picked(data)
+    gram = picked(data,time_shift=0.1)
+    warps = align.align([gram,reference],reference,method=method)
+    assert warps[0] is not None and warps[1] is None
+    times = [peak.retention_time for peak in gram.peaks]
+    expected = [peak.retention_time for peak in reference.peaks]
+    if method == "peaks":
+        assert times == pytest.approx(expected,abs=1e-6)
+    else:
+        inside = [i for i, time in enumerate(expected)
+            if time < reference.time_series[-1]-align.MAX_SHIFT]
+        #Correlation optimized warping can only move the end of the run by
+        #as much as the runs overlap there.
+        assert [times[i] for i in inside]\
+            == pytest.approx([expected[i] for i in inside],abs=0.05)
+
+def test_peak_warp_without_matches(run):
+    gram = picked(run(seed=5))
+    times = np.array([peak.retention_time for peak in gram.peaks])
+    assert align.peak_warp(gram,[]) is None
+    assert align.peak_warp(gram,times+100) is None
+    #No peak within max_shift of a reference peak.
+    rng = np.random.default_rng(0)
+    assert align.peak_warp(gram,times+rng.uniform(0.01,0.04,len(times)),
+        tolerance=1e-9) is None
+    #Peaks within max_shift, but none within the tolerance.
+
+def test_align_without_matches_keeps_times(run,capsys):
+    reference = picked(run(seed=5))
+    gram = picked(run(seed=6),time_shift=100)
+    before = gram.time_series
+    assert align.align([gram],reference) == [None]
+    assert gram.time_series is before
+    assert "Could not align" in capsys.readouterr().out
+
+def test_warp_time_rejects_reversal(run):
+    gram = Chromatogram(data=run())
+    before = gram.time_series
+    with pytest.raises(ValueError):
+        gram.warp_time([0,10],[0,-1])
+    with pytest.raises(ValueError):
+        gram.warp_time([10,0],[0,0])
+    assert gram.time_series is before and gram.time_warp is None
+    gram.warp_time([0,10000],[0,0.1])
+    assert np.all(np.diff(gram.time_series) > 0)
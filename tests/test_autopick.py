@@ -0,0 +1,98 @@
+"""Tests that threshold autopicking finds the same peaks as the point-by-point
+walk of detect_bounds() that it replaced."""
+import numpy as np
+import pytest
+from chromatogram import Chromatogram, peak_order_key, threshold_features
+
+def legacy_bounds(derivative,point,tolerance):
+    """This function finds the bounds of the feature containing a point by
+    walking the derivative one point at a time, as detect_bounds() did before
+    it used a BoundLookup. Walks that run past either end stop at that end."""
+    n = len(derivative)
+    if abs(derivative[point]) < tolerance:
+        location = "top"
+    elif derivative[point] < 0:
+        location = "right"
+    else:
+        location = "left"
+    left = point
+    while True:
+        left -= 1
+        if left < 0:
+            left = 0
+            break
+        slope = derivative[left]
+        if location == "left" and (abs(slope) < tolerance or -slope > tolerance):
+            break
+        elif location in ("top","right") and slope > tolerance:
+            location = "left"
+        elif location == "right" and abs(slope) < tolerance:
+            location = "top"
+    right = point
+    while True:
+        right += 1
+        if right >= n:
+            right = n-1
+            break
+        slope = derivative[right]
+        if location == "right" and (abs(slope) < tolerance or slope > tolerance):
+            break
+        elif location in ("top","left") and -slope > tolerance:
+            location = "right"
+        elif location == "left" and abs(slope) < tolerance:
+            location = "top"
+    return left, right
+
+def legacy_autopick(signal,derivative,threshold,tolerance):
+    """This function returns the bounds of the peaks picked from the start of
+    each feature above a threshold, each set of bounds once."""
+    above = False
+    bounds = []
+    for index, value in enumerate(signal):
+        if not above and value > threshold:
+            found = legacy_bounds(derivative,index,tolerance)
+            if found not in bounds:
+                bounds.append(found)
+        above = value > threshold
+    return bounds
+
+@pytest.mark.parametrize("seed,noise,tolerance",
+    [(0,20,50.0),(1,5,10.0),(2,60,200.0),(3,0,1.0)])
+def test_detect_bounds_matches_legacy_walk(run,seed,noise,tolerance):
+    gram = Chromatogram(data=run(n=8000,n_peaks=40,noise=noise,seed=seed),
+        noise_tolerance=tolerance)
+    derivative = gram.derivative_series
+    assert np.array_equal(derivative,
+        np.append(np.diff(gram.signal_series),0))
+    points = np.random.default_rng(seed).integers(0,len(derivative),500)
+    points = np.concatenate(([0,len(derivative)-1],points))
+    lefts, rights = gram.detect_bounds_batch(points)
+    assert list(zip(lefts.tolist(),rights.tolist()))\
+        == [legacy_bounds(derivative,point,tolerance) for point in points]
+
+@pytest.mark.parametrize("seed,threshold",[(0,5000),(1,500),(2,50000)])
+def test_autopick_matches_legacy_walk(run,seed,threshold):
+    gram = Chromatogram(data=run(n=8000,n_peaks=40,seed=seed),
+        noise_tolerance=50.0)
+    expected = legacy_autopick(gram.signal_series,gram.derivative_series,
+        threshold,50.0)
+    gram.threshold_autopick(threshold)
+    assert sorted((peak.i_0,peak.i_f) for peak in gram.peaks)\
+        == sorted(expected)
+    assert gram.peaks == sorted(gram.peaks,key=peak_order_key)
+    assert gram.peak_table["Retention Index"].tolist()\
+        == list(range(1,len(gram.peaks)+1))
+    assert gram.peak_table["Area"].tolist()\
+        == [peak.area for peak in gram.peaks]
+
+def test_autopick_keeps_existing_peaks(run):
+    gram = Chromatogram(data=run(seed=4),noise_tolerance=50.0)
+    gram.threshold_autopick(5000)
+    count = len(gram.peaks)
+    gram.threshold_autopick(5000)
+    assert len(gram.peaks) == count
+
+def test_threshold_features_open_at_end():
+    starts, ends = threshold_features(np.array([0,5,5,0,5,5]),1)
+    assert starts.tolist() == [1,4]
+    assert ends.tolist() == [3,6]
@@ -0,0 +1,42 @@
+"""Tests that the automatic baseline methods recover a known baseline."""
+import numpy as np
+import pytest
+import baselines
+from chromatogram import Chromatogram
+
+NOISE = 5
+
+@pytest.fixture
+def drifting():
+    """This fixture returns a signal with peaks on a curved baseline, and the
+    baseline."""
+    rng = np.random.default_rng(0)
+    n = 10000
+    x = np.linspace(-1,1,n)
+    baseline = 3000+800*x-600*x**2+400*x**3
+    indices = np.arange(n)
+    signal = baseline+rng.normal(0,NOISE,n)
+    for center in rng.choice(np.arange(300,n-300),15,replace=False):
+        signal += rng.uniform(500,5000)\
+            *np.exp(-0.5*((indices-center)/rng.uniform(3,8))**2)
+    return signal, baseline
+
+@pytest.mark.parametrize("method",baselines.METHODS)
+def test_recovers_baseline(drifting,method):
+    signal, baseline = drifting
+    errors = np.abs(baselines.estimate(signal,method)-baseline)
+    assert np.median(errors) < 3*NOISE
+    assert np.percentile(errors,99) < 10*NOISE
+    #The methods follow the baseline from below, so they sit within the
+    #noise under it rather than on it.
+
+def test_auto_baseline(drifting):
+    signal, baseline = drifting
+    gram = Chromatogram(data=np.round(signal).astype(np.int32))
+    gram.auto_baseline("rolling_min",window=301)
+    assert np.array_equal(gram.signal_series,gram.raw_data-gram.baseline)
+    assert np.median(np.abs(gram.baseline-baseline)) < 3*NOISE
+
+def test_unknown_method():
+    with pytest.raises(ValueError):
+        baselines.estimate(np.zeros(10),"spline")
@@ -0,0 +1,62 @@
+"""Tests of the batch-processing command line interface."""
+import json
+import numpy as np
+import pandas as pd
+import pytest
+import batch
+import loader
+import save
+
+@pytest.fixture
+def files(run,asc_file):
+    """This fixture writes three drifting runs to .dat.asc files and returns
+    their paths."""
+    return [asc_file(run(n=8000,n_peaks=20,seed=seed,drift=0.2),
+        name=f"run{seed}.dat.asc") for seed in range(3)]
+
+def expected(paths,baseline,threshold):
+    """This function processes files one at a time by hand, as a recipe with
+    two baseline points and a threshold would."""
+    grams = []
+    for path in paths:
+        gram = loader.load_asc(path)
+        gram.baseline_correct([min(max(i,0),len(gram.signal_series)-1)
+            for i in gram.time2index(baseline)])
+        gram.set_derivative_mode("right",5)
+        gram.threshold_autopick(threshold)
+        grams.append(gram)
+    return save.peak_summary(grams)
+
+@pytest.mark.parametrize("workers",["0","2"])
+def test_batch_matches_pipeline(files,tmp_path,workers):
+    output = tmp_path/"peaks.csv"
+    assert batch.main([str(tmp_path/"*.asc"),"-o",str(output),"--baseline",
+        "0.1","100","--threshold","auto","-j",workers]) == 0
+    table = pd.read_csv(output)
+    summary = expected(files,[0.1,100],"auto")
+    assert len(table) == len(summary) > 0
+    assert table["Chromatogram"].tolist() == summary["Chromatogram"].tolist()
+    assert np.allclose(table["Area"],summary["Area"])
+    assert table["Retention Index"].tolist()\
+        == summary["Retention Index"].tolist()
+
+def test_recipe_file_and_options(files,tmp_path):
+    recipe = tmp_path/"recipe.json"
+    recipe.write_text(json.dumps({"threshold":1e9,"baseline":[0.1,100]}))
+    output = tmp_path/"peaks.csv"
+    assert batch.main([str(files[0]),"-o",str(output),"--recipe",str(recipe),
+        "--threshold","5000","-j","0"]) == 0
+    #Command line options take precedence over the recipe file.
+    table = pd.read_csv(output)
+    assert np.allclose(table["Area"],expected(files[:1],[0.1,100],5000)["Area"])
+
+def test_bad_files_are_skipped(files,tmp_path,capsys):
+    broken = tmp_path/"broken.dat.asc"
+    broken.write_bytes(b"\xff\xfe\x00\x81")
+    #Not text, so it cannot be parsed.
+    output = tmp_path/"peaks.csv"
+    assert batch.main([str(files[0]),str(broken),"-o",str(output),
+        "--threshold","5000","-j","0"]) == 0
+    captured = capsys.readouterr()
+    assert "broken" in captured.err and "1/2" in captured.out
+    assert set(pd.read_csv(output)["Chromatogram"]) == {"synthetic"}
@@ -0,0 +1,50 @@
+"""Tests of the parsed file cache."""
+import os
+import numpy as np
+import cache
+import loader
+
+def test_cache_hit(run,asc_file,tmp_path):
+    data = run(n=2000,n_peaks=5)
+    path = asc_file(data)
+    parse_cache = cache.ParseCache(tmp_path/"cache")
+    first = parse_cache.read_asc(path)
+    second = parse_cache.read_asc(path)
+    assert (parse_cache.misses, parse_cache.hits) == (1,1)
+    assert np.array_equal(second[0],data)
+    assert second[1] == first[1] == loader.read_asc(path)[1]
+    gram = parse_cache.load_asc(path)
+    assert parse_cache.hits == 2
+    assert np.array_equal(gram.raw_data,data)
+
+def test_cache_invalidated_by_mtime(run,asc_file,tmp_path):
+    path = asc_file(run(n=2000,n_peaks=5))
+    parse_cache = cache.ParseCache(tmp_path/"cache")
+    parse_cache.read_asc(path)
+    changed = run(n=2000,n_peaks=5,seed=1)
+    asc_file(changed)
+    stat = os.stat(path)
+    os.utime(path,ns=(stat.st_atime_ns,stat.st_mtime_ns+10**9))
+    #The file is rewritten with the same size, so only its mtime tells.
+    data, header = parse_cache.read_asc(path)
+    assert (parse_cache.misses, parse_cache.hits) == (2,0)
+    assert np.array_equal(data,changed)
+    parse_cache.read_asc(path)
+    assert parse_cache.hits == 1
+
+def test_cache_content_keys_survive_touch(run,asc_file,tmp_path):
+    path = asc_file(run(n=2000,n_peaks=5))
+    parse_cache = cache.ParseCache(tmp_path/"cache",hash_contents=True)
+    parse_cache.read_asc(path)
+    stat = os.stat(path)
+    os.utime(path,ns=(stat.st_atime_ns,stat.st_mtime_ns+10**9))
+    parse_cache.read_asc(path)
+    assert (parse_cache.misses, parse_cache.hits) == (1,1)
+
+def test_cache_evicts_to_max_bytes(run,asc_file,tmp_path):
+    parse_cache = cache.ParseCache(tmp_path/"cache",max_bytes=20000)
+    for seed in range(4):
+        parse_cache.read_asc(asc_file(run(n=2000,n_peaks=5,seed=seed),
+            name=f"run{seed}.dat.asc"))
+    assert 0 < parse_cache.size() <= 20000
+    assert len(parse_cache.entries()) < 4
@@ -0,0 +1,71 @@
+"""Tests of the peak index and compound identification."""
+import numpy as np
+import pytest
+import compounds
+from chromatogram import Chromatogram
+
+@pytest.fixture
+def runs(run):
+    """This fixture returns three runs of the same sample with small shifts
+    of the retention times."""
+    data = run(seed=7)
+    grams = []
+    for index, shift in enumerate([0,0.005,-0.004]):
+        gram = Chromatogram(data=data,time_shift=shift,noise_tolerance=50.0,
+            name=f"run {index}")
+        gram.threshold_autopick(5000)
+        grams.append(gram)
+    return grams
+
+def entries(results):
+    return [(gram.name,peak.retention_time) for gram, peak in results]
+
+def test_queries_match_brute_force(runs):
+    index = compounds.PeakIndex(runs)
+    every = sorted(((gram.name,peak.retention_time) for gram in runs
+        for peak in gram.peaks),key=lambda entry: entry[1])
+    assert len(index) == len(every)
+    assert sorted(entries(index.in_range(5,12)))\
+        == sorted(entry for entry in every if 5 <= entry[1] <= 12)
+    peak = runs[1].peaks[10]
+    overlapping = [(gram.name,other.retention_time) for gram in runs
+        for other in gram.peaks
+        if other.t_0 <= peak.retention_time <= other.t_f]
+    assert sorted(entries(index.overlapping(peak.retention_time)))\
+        == sorted(overlapping)
+    assert index.nearest(peak.retention_time)[1] is peak
+
+def test_find_each_run(runs):
+    index = compounds.PeakIndex(runs)
+    reference = runs[0].peaks[20]
+    found = index.find(reference.retention_time)
+    assert found[0] is reference
+    assert [peak.i_max for peak in found] == [reference.i_max]*3
+
+def test_compound_table(runs):
+    runs[2].remove_peak(5)
+    missing = runs[0].peaks[5].i_max
+    table = compounds.PeakIndex(runs).compound_table()
+    assert list(table.columns) == ["run 0","run 1","run 2"]
+    assert len(table) == len(runs[0].peaks)
+    assert table["run 0"].tolist() == [peak.area for peak in runs[0].peaks]
+    assert table["run 1"].tolist() == table["run 0"].tolist()
+    row = table.iloc[5]
+    assert np.isnan(row["run 2"]) and row["run 0"] == row["run 1"]
+    assert table.index[5] == pytest.approx(np.mean([gram.index2time(missing)
+        for gram in runs[:2]]))
+    heights = compounds.PeakIndex(runs).compound_table(column="Height")
+    assert heights["run 0"].tolist() == [peak.height for peak in runs[0].peaks]
+
+def test_sync_matches_rebuilt_index(runs):
+    index = compounds.PeakIndex(runs)
+    runs[0].remove_peak(3)
+    runs[1].one_point_peak(150)
+    runs[2].shift_time(0.001)
+    added = Chromatogram(data=runs[0].raw_data,name="run 3")
+    added.threshold_autopick(5000)
+    index.sync([runs[0],runs[1],added])
+    rebuilt = compounds.PeakIndex([runs[0],runs[1],added])
+    assert entries(index.in_range(0,100)) == entries(rebuilt.in_range(0,100))
+    assert [gram.name for gram in index.chromatograms]\
+        == ["run 0","run 1","run 3"]
@@ -0,0 +1,57 @@
+"""Tests that each derivative mode matches a direct computation."""
+import numpy as np
+import pytest
+import derivatives
+from chromatogram import Chromatogram
+
+def direct(y,mode,window):
+    """This function computes a derivative point by point from the definition
+    of its mode, with 0 where the points it needs are missing."""
+    n = len(y)
+    half = window//2
+    derivative = np.zeros(n)
+    for i in range(n):
+        if mode == "right" and i+1 < n:
+            derivative[i] = y[i+1]-y[i]
+        elif mode == "left" and i >= 1:
+            derivative[i] = y[i]-y[i-1]
+        elif mode == "central" and 1 <= i < n-1:
+            derivative[i] = (y[i+1]-y[i-1])/2
+        elif mode == "savgol" and half <= i < n-half:
+            x = np.arange(-half,half+1)
+            derivative[i] = np.polyfit(x,y[i-half:i+half+1],2)[1]
+            #The slope of the fitted quadratic at the middle of the window.
+        elif mode == "moving_average" and half <= i < n-half-1:
+            derivative[i] = np.mean(np.diff(y[i-half:i+half+2]))
+    return derivative
+
+@pytest.mark.parametrize("window",[3,5,9])
+@pytest.mark.parametrize("mode",derivatives.MODES)
+def test_matches_direct(mode,window):
+    y = np.random.default_rng(window).normal(0,100,200).cumsum()
+    assert derivatives.differentiate(y,mode,window)\
+        == pytest.approx(direct(y,mode,window),abs=1e-8)
+
+@pytest.mark.parametrize("mode",derivatives.MODES)
+def test_start_and_reach(mode):
+    y = np.random.default_rng(0).normal(0,1,100)
+    full = derivatives.differentiate(y,mode,7)
+    assert np.array_equal(derivatives.differentiate(y,mode,7,start=40),
+        full[40:])
+    before, after = derivatives.reach(mode,7)
+    changed = y.copy()
+    changed[60] += 1
+    #Only the derivatives within reach of a point depend on it.
+    differs = np.flatnonzero(derivatives.differentiate(changed,mode,7) != full)
+    assert differs.min() >= 60-after and differs.max() <= 60+before
+
+def test_chromatogram_derivative_mode(run):
+    data = run(n=2000,n_peaks=5)
+    gram = Chromatogram(data=data)
+    gram.set_derivative_mode("savgol",7)
+    assert np.array_equal(gram.derivative_series,
+        derivatives.differentiate(gram.signal_series,"savgol",7))
+
+def test_unknown_mode():
+    with pytest.raises(ValueError):
+        derivatives.kernel("spline")
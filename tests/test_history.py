@@ -0,0 +1,73 @@
+"""Tests of undo/redo with copy-on-write SaveStates."""
+import numpy as np
+from chromatogram import Chromatogram
+from history import History
+
+def history_with(run,**bounds):
+    history = History(**bounds)
+    history.present().add_chromatogram(
+        Chromatogram(data=run(),noise_tolerance=50.0))
+    return history
+
+def test_undo_redo_restores_state(run):
+    history = history_with(run)
+    original = history.present().active().signal_series.copy()
+    history.save()
+    gram = history.present().edit_active()
+    gram.scale_signal(2.0)
+    gram.threshold_autopick(5000)
+    picked = gram.peak_bounds()
+    assert picked
+
+    assert history.undo()
+    restored = history.present().active()
+    assert np.array_equal(restored.signal_series,original)
+    assert restored.peaks == [] and restored.peak_table.empty
+    assert history.redo()
+    redone = history.present().active()
+    assert np.array_equal(redone.signal_series,2*original)
+    assert redone.peak_bounds() == picked
+    assert not history.redo()
+
+def test_save_discards_undone_states(run):
+    history = history_with(run)
+    history.save()
+    history.present().edit_active().shift_time(1.0)
+    history.undo()
+    history.save()
+    history.present().edit_active().shift_time(2.0)
+    assert len(history.states) == 2
+    assert not history.redo()
+    history.undo()
+    assert history.present().active().time_shift == 0
+
+def test_unedited_chromatograms_are_shared(run):
+    history = history_with(run)
+    history.present().add_chromatogram(Chromatogram(data=run(seed=1)))
+    history.save()
+    history.present().edit(1).shift_time(1.0)
+    previous, present = history.states
+    assert previous[0] is present[0]
+    assert previous[1] is not present[1]
+    assert previous[1].raw_data is present[1].raw_data
+
+def test_max_states(run):
+    history = history_with(run,max_states=3)
+    for shift in range(5):
+        history.save()
+        history.present().edit_active().shift_time(1.0)
+    assert len(history.states) == 3
+    assert history.present().active().time_shift == 5
+
+def test_max_bytes_counts_derived_data(run):
+    history = history_with(run,max_bytes=2*2**20)
+    for _ in range(5):
+        history.save()
+        gram = history.present().edit_active()
+        gram.scale_signal(1.5)
+        gram.threshold_autopick(5000)
+        gram.noise
+        history.evict()
+        assert history.nbytes() <= history.max_bytes\
+            or len(history.states) == 1
+    assert history.present().active().signal_scale == 1.5**5
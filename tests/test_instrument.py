@@ -0,0 +1,47 @@
+"""Tests of the timing instrumentation and profile captures."""
+import tracemalloc
+import pytest
+import instrument
+from chromatogram import Chromatogram
+
+@pytest.fixture
+def recording():
+    """This fixture turns instrumentation on for a test, with no statistics
+    recorded yet."""
+    instrument.reset()
+    instrument.enable()
+    yield
+    instrument.disable()
+    instrument.reset()
+
+def test_records_calls(run,recording):
+    gram = Chromatogram(data=run(n=4000,n_peaks=10),noise_tolerance=50.0)
+    gram.threshold_autopick(5000)
+    gram.peak_table
+    assert instrument.stats["Chromatogram.threshold_autopick"]["calls"] == 1
+    assert instrument.stats["Peak"]["calls"] == len(gram.peaks)
+    assert instrument.stats["Chromatogram.peak_table"]["calls"] >= 1
+    assert "Chromatogram.threshold_autopick" in instrument.summary()
+
+def test_disable_restores_originals(recording):
+    original = instrument._originals[(Chromatogram,"threshold_autopick")]
+    instrument.disable()
+    assert not instrument.enabled()
+    assert Chromatogram.threshold_autopick is original
+    assert isinstance(vars(Chromatogram)["peak_table"],property)
+    Chromatogram(data=[0,1,0]).update()
+    assert "Chromatogram.update" not in instrument.stats
+
+def test_profile_leaves_user_tracing_running():
+    tracemalloc.start()
+    try:
+        instrument.start_profile()
+        report = instrument.stop_profile()
+        assert "Top memory allocations" in report
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+    instrument.start_profile()
+    instrument.stop_profile()
+    assert not tracemalloc.is_tracing()
+    assert instrument.stop_profile() == "No profile is being captured."
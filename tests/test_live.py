@@ -0,0 +1,47 @@
+"""Tests that live ingest finds the same peaks as
+Chromatogram.threshold_autopick()."""
+import numpy as np
+import pytest
+import live
+import noise
+from chromatogram import Chromatogram
+
+def picked(gram):
+    return [(peak.i_0,peak.i_f,peak.area,peak.height) for peak in gram.peaks]
+
+def acquire(data,mode,threshold,tolerance):
+    """This function appends a run to a live chromatogram in random-sized
+    pieces and returns the chromatogram."""
+    acquired = Chromatogram(data=np.zeros(0,dtype=np.int32),
+        derivative_mode=mode,noise_tolerance=tolerance)
+    ingest = live.LiveIngest(acquired,threshold)
+    rng = np.random.default_rng(0)
+    start = 0
+    while start < len(data):
+        size = int(rng.integers(1,3000))
+        ingest.append(data[start:start+size])
+        start += size
+    ingest.close()
+    return acquired
+
+@pytest.mark.parametrize("mode",["right","savgol"])
+def test_live_matches_autopick(run,mode):
+    """With a numeric threshold and tolerance, live ingest picks exactly the
+    peaks of the whole run."""
+    data = run(seed=1)
+    gram = Chromatogram(data=data,derivative_mode=mode,noise_tolerance=50.0)
+    gram.threshold_autopick(5000)
+    acquired = acquire(data,mode,5000,50.0)
+    assert picked(acquired) == picked(gram)
+    assert acquired.peak_table.equals(gram.peak_table)
+
+def test_live_auto_matches_autopick(run,monkeypatch):
+    """'auto' uses the noise of the readings so far, so with the noise fixed
+    live ingest picks exactly the peaks of the whole run."""
+    monkeypatch.setattr(noise.NoiseEstimator,"sigma",lambda self: 28.0)
+    data = run(seed=1,drift=0.05)
+    gram = Chromatogram(data=data,noise_tolerance="auto")
+    gram.threshold_autopick("auto")
+    acquired = acquire(data,"right","auto","auto")
+    assert picked(acquired) == picked(gram)
+    assert acquired.peak_table.equals(gram.peak_table)
@@ -0,0 +1,39 @@
+"""Tests that the bulk .dat.asc loader reads the same data as the
+line-by-line parser it replaced (benchmark.legacy_read_asc())."""
+import pathlib
+import numpy as np
+import pytest
+import loader
+from benchmark import legacy_read_asc
+
+SAMPLE_DATA = pathlib.Path(__file__).resolve().parent.parent/"sample data"
+
+@pytest.mark.parametrize("path",sorted(SAMPLE_DATA.glob("*.dat.asc")),
+    ids=lambda path: path.name)
+def test_sample_files_match_legacy_parser(path):
+    data, header = loader.read_asc(path)
+    legacy_data, name, rate = legacy_read_asc(path)
+    assert data.dtype == np.int32
+    assert data.tolist() == legacy_data
+    assert header["Sample ID"] == name
+    assert loader.sampling_rate(header) == rate
+
+@pytest.mark.parametrize("newline",["\n","\r\n"],ids=["lf","crlf"])
+def test_line_endings_match_legacy_parser(run,asc_file,newline):
+    data = run(n=5000,noise=200)-20000
+    path = asc_file(data,newline=newline)
+    parsed, header = loader.read_asc(path)
+    legacy_data, name, rate = legacy_read_asc(path)
+    assert parsed.tolist() == legacy_data == data.tolist()
+    assert header["Sample ID"] == name == "synthetic"
+    assert loader.sampling_rate(header) == rate == 10.0
+    chunks = list(loader.iter_asc(path,chunk_size=777))
+    assert np.concatenate(chunks).tolist() == legacy_data
+    assert loader.read_asc_header(path) == header
+
+def test_load_asc_names_and_rate(asc_file):
+    path = asc_file([1,2,3])
+    gram = loader.load_asc(path)
+    assert gram.name == "synthetic"
+    assert gram.time_scale == pytest.approx(1/600)
+    assert gram.raw_data.tolist() == [1,2,3]
@@ -0,0 +1,36 @@
+"""Tests of noise estimation and 'auto' thresholds."""
+import numpy as np
+import pytest
+import noise
+import stream
+from chromatogram import Chromatogram
+
+@pytest.mark.parametrize("chunk_size",[1,333,50000])
+def test_auto_threshold_levels_match(run,monkeypatch,chunk_size):
+    """With the noise fixed, an 'auto' threshold picks the same features in
+    chunks as in the whole series."""
+    monkeypatch.setattr(noise,"signal_noise",lambda *args: 5.0)
+    data = run(n=12000,n_peaks=20,noise=5,drift=0.05)
+    gram = Chromatogram(data=data)
+    gram.threshold_autopick("auto")
+    chunks = [data[i:i+chunk_size].astype(np.float64)
+        for i in range(0,len(data),chunk_size)]
+    features = stream.detect_features(stream.differentiate(chunks),"auto")
+    assert sorted((i_0,i_f) for i_0, i_f, signal in features)\
+        == sorted((peak.i_0,peak.i_f) for peak in gram.peaks)
+
+def test_auto_threshold_uncorrected_baseline(run):
+    """An 'auto' threshold is measured from the baseline, so a drifting,
+    uncorrected run is not picked as one long feature."""
+    data = run(n=12000,n_peaks=20,noise=5,drift=0.05)
+    gram = Chromatogram(data=data)
+    gram.threshold_autopick("auto")
+    corrected = Chromatogram(data=data)
+    corrected.baseline = 1500+0.05*np.arange(len(data))
+    corrected.signal_series = corrected.signal_series-corrected.baseline
+    corrected.threshold_autopick(noise.THRESHOLD_FACTOR*gram.signal_noise)
+    assert len(gram.peaks) == len(corrected.peaks)
+    tallest = int(np.argmax(data-corrected.baseline))
+    assert any(peak.i_max == tallest and peak.i_f-peak.i_0 < 200
+        for peak in gram.peaks)
+    assert all(peak.snr > 0 for peak in gram.peaks)
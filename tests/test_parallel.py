@@ -0,0 +1,30 @@
+"""Tests that parallel peak detection gives the same peaks as detecting them
+one chromatogram at a time."""
+import pytest
+import parallel
+from chromatogram import Chromatogram
+
+def picked(gram):
+    return [(peak.i_0,peak.i_f,peak.area,peak.height,peak.retention_time,
+        peak.snr) for peak in gram.peaks]
+
+@pytest.mark.parametrize("threshold",[5000,"auto"])
+def test_parallel_matches_serial(run,threshold):
+    def grams():
+        return [Chromatogram(data=run(n=8000,n_peaks=20,seed=seed,drift=0.05),
+            time_shift=0.1*seed,derivative_mode=mode)
+            for seed, mode in enumerate(["right","savgol","central"])]
+    serial = grams()
+    for gram in serial:
+        gram.threshold_autopick(threshold)
+    parallel_grams = parallel.detect_peaks(grams(),threshold,workers=2)
+    for gram, expected in zip(parallel_grams,serial):
+        assert picked(gram) == picked(expected)
+        assert gram.peak_table.equals(expected.peak_table)
+
+def test_parallel_keeps_existing_peaks(run):
+    gram = Chromatogram(data=run(n=8000,n_peaks=20),noise_tolerance=50.0)
+    gram.threshold_autopick(5000)
+    count = len(gram.peaks)
+    parallel.detect_peaks([gram],5000,workers=1)
+    assert len(gram.peaks) == count
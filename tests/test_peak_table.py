@@ -0,0 +1,48 @@
+"""Tests that the peak table maintained one row at a time equals the table
+rebuilt from all of the peaks."""
+import pytest
+from chromatogram import Chromatogram
+
+def rebuilt(gram):
+    """This function returns the peak table of a copy of a chromatogram whose
+    peak data is rebuilt from all of its peaks."""
+    duplicate = gram.copy()
+    duplicate.update_peak_table()
+    return duplicate.peak_table
+
+@pytest.fixture
+def gram(run):
+    gram = Chromatogram(data=run(seed=2),noise_tolerance=50.0)
+    gram.threshold_autopick(5000)
+    return gram
+
+def test_insert(gram):
+    count = len(gram.peaks)
+    for point in (5000,150,19500):
+        gram.one_point_peak(point)
+    assert len(gram.peaks) == count+3
+    assert gram.peak_table.equals(rebuilt(gram))
+
+def test_remove(gram):
+    count = len(gram.peaks)
+    for i in (0,len(gram.peaks)//2,len(gram.peaks)-3):
+        gram.remove_peak(i)
+    assert len(gram.peaks) == count-3
+    assert gram.peak_table.equals(rebuilt(gram))
+
+def test_recompute(gram):
+    for i in range(0,len(gram.peaks),5):
+        gram.recompute_peak(i,area_mode="vv")
+    assert gram.peak_table.equals(rebuilt(gram))
+    assert gram.peak_table["Area"][0] == gram.peaks[0].areas["vv"]
+
+def test_rescale(gram):
+    gram.peak_table
+    gram.scale_signal(2.5)
+    assert gram.peak_table.equals(rebuilt(gram))
+
+def test_peak_at(gram):
+    peak = gram.peaks[3]
+    assert gram.peak_at(peak.i_max) == 3
+    gram.remove_peak(gram.peak_at(peak.i_max))
+    assert peak.i_max not in [other.i_max for other in gram.peaks]
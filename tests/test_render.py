@@ -0,0 +1,61 @@
+"""Tests of the decimated drawing of chromatograms."""
+import matplotlib
+matplotlib.use("Agg")
+import numpy as np
+import pytest
+from matplotlib.figure import Figure
+import render
+from chromatogram import Chromatogram
+
+@pytest.mark.parametrize("n,n_bins",[(10000,300),(10007,64),(500,300)])
+def test_minmax_keeps_extremes(n,n_bins):
+    rng = np.random.default_rng(n)
+    x = np.arange(n)/10
+    y = rng.normal(0,1,n)
+    x_d, y_d = render.minmax_decimate(x,y,x[0],x[-1],n_bins)
+    assert np.all(np.diff(x_d) > 0)
+    kept = set(x_d.tolist())
+    if n <= 2*n_bins:
+        assert len(kept) == n
+        return
+    bin_size = -(-n//n_bins)
+    for start in range(0,n,bin_size):
+        block = y[start:start+bin_size]
+        assert x[start+block.argmin()] in kept
+        assert x[start+block.argmax()] in kept
+    assert y_d.max() == y.max() and y_d.min() == y.min()
+
+def test_minmax_keeps_points_around_view():
+    x = np.arange(1000.0)
+    y = np.sin(x)
+    x_d, y_d = render.minmax_decimate(x,y,100.5,200.5,10)
+    assert x_d[0] == 100 and x_d[-1] == 201
+    assert np.all((x_d >= 100) & (x_d <= 201))
+
+@pytest.fixture
+def renderer():
+    figure = Figure(figsize=(4,2),dpi=100)
+    return render.Renderer(figure.add_subplot(111))
+
+def test_renderer_reuses_decimation(run,renderer,monkeypatch):
+    gram = Chromatogram(data=run())
+    renderer.update([gram])
+    calls = []
+    decimate = render.minmax_decimate
+    monkeypatch.setattr(render,"minmax_decimate",
+        lambda *args: calls.append(args) or decimate(*args))
+    renderer.update([gram])
+    assert calls == []
+    renderer.axes.set_xlim(1,2)
+    assert len(calls) == 1
+
+def test_renderer_redraws_after_edit(run,renderer):
+    gram = Chromatogram(data=run())
+    renderer.update([gram])
+    height = renderer.lines[0].get_ydata().max()
+    gram.scale_signal(2)
+    renderer.update([gram])
+    assert renderer.lines[0].get_ydata().max() == pytest.approx(2*height)
+    gram.extend(np.full(5000,3*height,dtype=np.int32))
+    renderer.update([gram])
+    assert renderer.lines[0].get_xdata()[-1] == gram.time_series[-1]
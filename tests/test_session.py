@@ -0,0 +1,57 @@
+"""Tests that session files restore the chromatograms they were saved from."""
+import numpy as np
+import save
+from chromatogram import Chromatogram
+from history import SaveState
+
+def session_state(run):
+    state = SaveState()
+    first = Chromatogram(data=run(seed=0),name="first",color="#ff0000",
+        noise_tolerance=30.0,derivative_mode="savgol",derivative_window=7)
+    first.baseline_correct([100,19000])
+    first.scale_signal(2.0)
+    first.shift_time(0.5)
+    first.warp_time([0,10000,19999],[0.0,0.1,-0.05])
+    first.threshold_autopick(5000,area_mode="vv")
+    state.add_chromatogram(first)
+    second = Chromatogram(data=np.zeros(0,dtype=np.int32),name="empty")
+    second.hidden = True
+    state.add_chromatogram(second)
+    state.active_index = 1
+    return state
+
+def test_session_round_trip(run,tmp_path):
+    state = session_state(run)
+    path = tmp_path/"session.mchroma"
+    save.save_session(state,path)
+    loaded = save.load_session(path)
+    assert loaded.active_index == 1
+    for original, restored in zip(state.chromatograms,loaded.chromatograms):
+        for attribute in save.SESSION_ARRAYS:
+            assert np.array_equal(getattr(original,attribute),
+                getattr(restored,attribute))
+            assert getattr(original,attribute).dtype\
+                == getattr(restored,attribute).dtype
+        for attribute in ("name","color","hidden","time_scale","time_shift",
+            "signal_scale","time_warp","derivative_mode","derivative_window",
+            "noise_tolerance"):
+            assert getattr(original,attribute) == getattr(restored,attribute)
+        assert np.array_equal(original.time_series,restored.time_series)
+        assert restored.peak_bounds() == original.peak_bounds()
+        assert restored.peak_table.equals(original.peak_table)
+
+def test_session_saved_over_itself(run,tmp_path):
+    path = tmp_path/"session.mchroma"
+    save.save_session(session_state(run),path)
+    loaded = save.load_session(path)
+    gram = loaded[0]
+    gram.peaks
+    assert save._mapped_file(gram.signal_series) is not None
+    save.save_session(loaded,path)
+    assert save._mapped_file(gram.signal_series) is None
+    assert all(save._mapped_file(peak.signal_series) is None
+        for peak in gram.peaks)
+    assert not (tmp_path/"session.mchroma.tmp").exists()
+    reloaded = save.load_session(path)
+    assert np.array_equal(reloaded[0].signal_series,gram.signal_series)
+    assert reloaded[0].peak_bounds() == gram.peak_bounds()
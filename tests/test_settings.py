@@ -0,0 +1,57 @@
+"""Tests of reading and overriding settings."""
+import os
+import pathlib
+import subprocess
+import sys
+import pytest
+import settings
+from chromatogram import Chromatogram
+
+@pytest.fixture
+def settings_file(tmp_path,monkeypatch):
+    """This fixture is a function writing a settings file that is read in
+    place of settings.cfg for the rest of the test."""
+    path = tmp_path/"settings.cfg"
+    def write(text):
+        path.write_text(text)
+        monkeypatch.setenv("MCHROMA_SETTINGS",str(path))
+        settings.reload()
+    yield write
+    monkeypatch.delenv("MCHROMA_SETTINGS",raising=False)
+    settings.reload()
+    settings.clear_overrides()
+
+def test_import_does_not_read_settings(tmp_path):
+    script = ("import settings, chromatogram, stream, parallel;"
+        "print(settings._loaded is None)")
+    result = subprocess.run([sys.executable,"-c",script],cwd=tmp_path,
+        capture_output=True,text=True,check=True,
+        env=dict(os.environ,
+        PYTHONPATH=str(pathlib.Path(settings.__file__).parent)))
+    assert result.stdout.strip() == "True"
+
+def test_settings_file_values(settings_file):
+    settings_file("NOISE_TOLERANCE 30\nSAMPLING_RATE 4\nNAME some text\n")
+    assert settings.get("NOISE_TOLERANCE") == 30.0
+    assert settings.get("SAMPLING_RATE") == 4.0
+    assert settings.get("NAME") == "some text"
+    assert settings.get("DEFAULT_COLORS") == settings.DEFAULTS["DEFAULT_COLORS"]
+    gram = Chromatogram(data=[0,1,2,1,0])
+    assert gram._bound_tolerance() == 30.0
+    assert gram.time_scale == pytest.approx(1/(60*4))
+
+def test_invalid_settings_fall_back(settings_file,capsys):
+    settings_file("NOISE_TOLERANCE lots\n")
+    assert settings.get("NOISE_TOLERANCE") == settings.DEFAULTS["NOISE_TOLERANCE"]
+    assert "Invalid setting" in capsys.readouterr().out
+
+def test_overrides(settings_file):
+    settings_file("NOISE_TOLERANCE 30\n")
+    with settings.overridden(NOISE_TOLERANCE=10):
+        assert settings.get("NOISE_TOLERANCE") == 10
+        assert Chromatogram(data=[0,1,0])._bound_tolerance() == 10
+    assert settings.get("NOISE_TOLERANCE") == 30.0
+    settings.override(NOISE_TOLERANCE="auto")
+    assert settings.get("NOISE_TOLERANCE") == "auto"
+    settings.clear_overrides("NOISE_TOLERANCE")
+    assert settings.get("NOISE_TOLERANCE") == 30.0
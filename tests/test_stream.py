@@ -0,0 +1,77 @@
+"""Tests that the streaming pipeline finds the same peaks as
+Chromatogram.threshold_autopick()."""
+import csv
+import types
+import pytest
+import loader
+import stream
+from chromatogram import Chromatogram
+
+def picked(gram):
+    return [(peak.i_0,peak.i_f,peak.area,peak.height) for peak in gram.peaks]
+
+@pytest.mark.parametrize("threshold",[5000,"auto"])
+@pytest.mark.parametrize("chunk_size",[7,997,100000])
+def test_stream_matches_autopick(run,asc_file,chunk_size,threshold):
+    data = run(drift=0.05)
+    gram = Chromatogram(data=data)
+    gram.threshold_autopick(threshold)
+    peaks = list(stream.stream_peaks(asc_file(data),threshold,
+        chunk_size=chunk_size,time_scale=gram.time_scale))
+    assert [(peak.i_0,peak.i_f,peak.area,peak.height) for peak in peaks]\
+        == picked(gram)
+    assert [peak.retention_time for peak in peaks]\
+        == pytest.approx([peak.retention_time for peak in gram.peaks])
+    assert [peak.snr for peak in peaks]\
+        == pytest.approx([peak.snr for peak in gram.peaks])
+
+def test_measure_noise(run,asc_file):
+    data = run()
+    for mode in ("right","savgol"):
+        gram = Chromatogram(data=data,derivative_mode=mode)
+        assert stream.measure_noise(asc_file(data),chunk_size=333,
+            derivative_mode=mode) == pytest.approx(gram.noise)
+
+def test_order_peaks():
+    """Peaks are yielded by retention time once no later peak can precede
+    them."""
+    def peak(i_max):
+        return types.SimpleNamespace(retention_time=i_max/10,i_0=i_max-5,
+            i_f=i_max+5,i_max=i_max)
+    found = [(peak(50),0),(peak(30),0),(peak(120),100),(peak(110),100),
+        (peak(300),100)]
+    window = {"base":0}
+    ordered = []
+    released = []
+    #Number of peaks yielded in order before each peak was found.
+    def peaks():
+        for item, base in found:
+            window["base"] = base
+            released.append(len(ordered))
+            yield item
+    for item in stream.order_peaks(peaks(),lambda: window["base"]):
+        ordered.append(item)
+    assert [item.i_max for item in ordered] == [30,50,110,120,300]
+    assert released == [0,0,0,2,2]
+
+def test_cli_baseline(run,asc_file,tmp_path):
+    data = run(seed=3,drift=0.5)
+    path = asc_file(data)
+    output = tmp_path/"peaks.csv"
+    assert stream.main([str(path),"-o",str(output),"--baseline","0.1","40",
+        "--threshold","5000","--tolerance","50"]) == 0
+    with open(output,newline="") as reader:
+        rows = list(csv.DictReader(reader))
+    gram = loader.load_asc(path)
+    gram.baseline_correct([min(max(i,0),len(gram.signal_series)-1)
+        for i in gram.time2index([0.1,40])])
+    gram.noise_tolerance = 50.0
+    gram.threshold_autopick(5000)
+    table = gram.peak_table
+    assert len(rows) == len(table) > 0
+    assert [int(row["Retention Index"]) for row in rows]\
+        == table["Retention Index"].tolist()
+    assert [float(row["Area"]) for row in rows]\
+        == pytest.approx(table["Area"].tolist())
+    assert [float(row["Retention Time"]) for row in rows]\
+        == pytest.approx(table["Retention Time"].tolist())